@@ -0,0 +1,1231 @@
+"""
+Benchmarks for the graph building and playlist generation code.
+
+These are run with 'python cli.py bench'. They can run on a graph built from the data files or,
+when the data files aren't available, on a synthetic graph made by synthetic_graph.
+"""
+import asyncio
+import collections
+import datetime
+import http.server
+import itertools
+import json
+import math
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from typing import Any, Callable, Optional, Tuple
+import catalog_search
+import computations
+import dedup
+import overlays
+import service
+import song_filters
+import song_graph
+import sparsify
+
+
+# Words the names of synthetic songs are made of
+WORDS = ['love', 'night', 'heart', 'blue', 'dance', 'home', 'fire', 'rain', 'summer', 'dream',
+         'moon', 'river', 'time', 'baby', 'world', 'light', 'road', 'song', 'girl', 'city',
+         'sweet', 'wild', 'gold', 'lonely', 'crazy', 'forever', 'midnight', 'sunshine', 'angel',
+         'desire', 'memory', 'thunder', 'wonder', 'shadow', 'silver', 'paradise', 'storm', 'echo',
+         'velvet', 'highway', 'diamond', 'ocean', 'winter', 'morning', 'stranger', 'promise']
+SYLLABLES = ['ka', 'lo', 'mi', 'ren', 'ta', 'vo', 'shi', 'dan', 'el', 'ku', 'ro', 'sa', 'ne',
+             'bri', 'zo', 'fa', 'lu', 'gor', 'pe', 'xi']
+
+
+class StubHTTPError(Exception):
+    """Error raised by StubSpotify, formatted like spotipy's SpotifyException
+
+    Instance attributes:
+        - http_status: the HTTP status code of the error
+        - headers: the response headers
+    """
+    http_status: int
+    headers: dict[str, str]
+
+    def __init__(self, http_status: int, headers: dict[str, str]) -> None:
+        """Initialize the error"""
+        super().__init__('http status ' + str(http_status))
+        self.http_status = http_status
+        self.headers = headers
+
+
+class StubSpotify:
+    """
+    Stand-in for the spotipy client that serves made up tracks, artists and playlists without
+    any network access. Each request sleeps for latency seconds and is counted in calls.
+
+    Instance attributes:
+        - tracks_by_id: maps track id to track, formatted the way spotify returns tracks
+        - artists_by_id: maps artist id to artist, formatted the way spotify returns artists
+        - playlists: maps playlist id to the playlist and its track ids
+        - calls: number of requests made, by method name
+        - latency: seconds every request takes
+        - rate_limit_every: every rate_limit_every'th request is answered with a 429 (too many
+          requests) error instead, 0 to never do that
+    """
+    tracks_by_id: dict[str, dict]
+    artists_by_id: dict[str, dict]
+    playlists: dict[str, dict]
+    calls: dict[str, int]
+    latency: float
+    rate_limit_every: int
+    _requests: int
+    _lock: threading.Lock
+
+    def __init__(self, num_tracks: int = 1000, num_artists: int = 100, latency: float = 0.0,
+                 rate_limit_every: int = 0, seed: int = 0) -> None:
+        """Initialize the stub with num_tracks random tracks by num_artists artists"""
+        rand = random.Random(seed)
+        genres = list(song_graph.load_genres(song_graph.GENRE_DATA))
+        self.artists_by_id = {}
+        for i in range(num_artists):
+            artist_id = 'artist' + str(i)
+            self.artists_by_id[artist_id] = {'id': artist_id, 'name': 'Artist ' + str(i),
+                                             'genres': rand.sample(genres, 3)}
+        self.tracks_by_id = {}
+        for i in range(num_tracks):
+            track_id = 'track' + str(i)
+            artist = self.artists_by_id['artist' + str(rand.randrange(num_artists))]
+            self.tracks_by_id[track_id] = {
+                'id': track_id, 'name': 'Track ' + str(i), 'duration_ms': 200000,
+                'explicit': rand.random() < 0.2, 'popularity': rand.randint(0, 100),
+                'artists': [{'id': artist['id'], 'name': artist['name']}],
+                'album': {'release_date': str(rand.randint(1950, 2020)) + '-01-01'}}
+        self.playlists = {}
+        self.calls = {}
+        self.latency = latency
+        self.rate_limit_every = rate_limit_every
+        self._requests = 0
+        self._lock = threading.Lock()
+
+    def _request(self, method: str) -> None:
+        """Count a request to method and wait for the simulated latency"""
+        with self._lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+            self._requests += 1
+            rate_limited = self.rate_limit_every > 0 and \
+                self._requests % self.rate_limit_every == 0
+        if self.latency > 0:
+            time.sleep(self.latency)
+        if rate_limited:
+            raise StubHTTPError(429, {'Retry-After': str(self.latency)})
+
+    def audio_features(self, tracks: list[str]) -> list[Optional[dict]]:
+        """Return made up audio features of the given track ids"""
+        self._request('audio_features')
+        features = []
+        for track_id in tracks:
+            if track_id not in self.tracks_by_id:
+                features.append(None)
+                continue
+            rand = random.Random(track_id)
+            audio_info = {prop: rand.random() for prop in song_graph.PROPERTIES}
+            audio_info.update({'id': track_id, 'key': rand.randint(0, 11),
+                               'mode': rand.randint(0, 1), 'loudness': -60 * rand.random(),
+                               'tempo': 60 + 140 * rand.random()})
+            features.append(audio_info)
+        return features
+
+    def tracks(self, tracks: list[str]) -> dict:
+        """Return the tracks with the given ids"""
+        self._request('tracks')
+        return {'tracks': [self.tracks_by_id.get(track_id) for track_id in tracks]}
+
+    def artists(self, artists: list[str]) -> dict:
+        """Return the artists with the given ids"""
+        self._request('artists')
+        return {'artists': [self.artists_by_id.get(artist_id) for artist_id in artists]}
+
+    def add_playlist(self, name: str, track_ids: list[str]) -> str:
+        """Add a playlist with the given tracks and return its id"""
+        playlist_id = 'playlist' + str(len(self.playlists))
+        self.playlists[playlist_id] = {'id': playlist_id, 'name': name, 'tracks': list(track_ids)}
+        return playlist_id
+
+    def _page(self, kind: str, items: list, offset: int, limit: int) -> dict:
+        """Return the page of items starting at offset, formatted the way spotify pages are"""
+        next_page = None
+        if offset + limit < len(items):
+            next_page = kind + ':' + str(offset + limit) + ':' + str(limit)
+        return {'items': items[offset:offset + limit], 'offset': offset, 'limit': limit,
+                'total': len(items), 'next': next_page}
+
+    def _playlist_items(self, kind: str) -> list[dict]:
+        """Return every item of kind ('playlists' or 'tracks/<playlist id>')"""
+        if kind == 'playlists':
+            return [{'id': playlist['id'], 'name': playlist['name']}
+                    for playlist in self.playlists.values()]
+        playlist = self.playlists[kind.split('/')[1]]
+        return [{'track': self.tracks_by_id[track_id]} for track_id in playlist['tracks']]
+
+    def user_playlists(self, user: str, limit: int = 50, offset: int = 0) -> dict:
+        """Return a page of the user's playlists"""
+        self._request('user_playlists')
+        return self._page('playlists', self._playlist_items('playlists'), offset, limit)
+
+    def user_playlist_tracks(self, user: str, playlist_id: str, limit: int = 100,
+                             offset: int = 0) -> dict:
+        """Return a page of a playlist's tracks"""
+        self._request('user_playlist_tracks')
+        kind = 'tracks/' + playlist_id
+        return self._page(kind, self._playlist_items(kind), offset, limit)
+
+    def user_playlist_create(self, user: str, name: str) -> dict:
+        """Create an empty playlist and return it"""
+        self._request('user_playlist_create')
+        playlist_id = self.add_playlist(name, [])
+        return {'id': playlist_id, 'name': name}
+
+    def user_playlist_add_tracks(self, user: str, playlist_id: str, tracks: list[str]) -> dict:
+        """Add tracks to the end of a playlist, at most 100 at a time like spotify"""
+        self._request('user_playlist_add_tracks')
+        if len(tracks) > 100:
+            raise StubHTTPError(400, {})
+        with self._lock:
+            self.playlists[playlist_id]['tracks'].extend(tracks)
+        return {'snapshot_id': str(len(self.playlists[playlist_id]['tracks']))}
+
+    def next(self, result: dict) -> Optional[dict]:
+        """Return the page after result"""
+        if result['next'] is None:
+            return None
+        self._request('next')
+        kind, offset, limit = result['next'].split(':')
+        return self._page(kind, self._playlist_items(kind), int(offset), int(limit))
+
+    def search(self, q: str, limit: int = 10, type: str = 'track') -> dict:
+        """Return the tracks or artists whose name contains every word of q"""
+        self._request('search')
+        words = [word.lower() for word in q.replace('+', ' ').split()]
+        if type == 'artist':
+            items = [artist for artist in self.artists_by_id.values()
+                     if all(word in artist['name'].lower().split() for word in words)]
+            return {'artists': {'items': items[:limit]}}
+        items = [track for track in self.tracks_by_id.values()
+                 if all(word in track['name'].lower().split() for word in words)]
+        return {'tracks': {'items': items[:limit]}}
+
+
+class RateLimitedServer(http.server.ThreadingHTTPServer):
+    """
+    Local HTTP server standing in for the spotify web API: answers the first rate_limited
+    requests with 429 (too many requests) and a Retry-After header, and the rest with empty
+    audio features.
+
+    Instance attributes:
+        - rate_limited: how many requests are answered with 429
+        - retry_after: the Retry-After header sent with the 429s, in seconds
+        - requests: number of requests received
+        - connections: the client (address, port) of every connection requests came on
+    """
+    rate_limited: int
+    retry_after: int
+    requests: int
+    connections: set[tuple[str, int]]
+    lock: threading.Lock
+
+    def __init__(self, rate_limited: int, retry_after: int) -> None:
+        """Start listening on a free local port"""
+        super().__init__(('127.0.0.1', 0), RateLimitedHandler)
+        self.rate_limited = rate_limited
+        self.retry_after = retry_after
+        self.requests = 0
+        self.connections = set()
+        self.lock = threading.Lock()
+
+
+class RateLimitedHandler(http.server.BaseHTTPRequestHandler):
+    """Answers the requests of a RateLimitedServer, keeping connections alive"""
+    protocol_version = 'HTTP/1.1'
+    server: RateLimitedServer
+
+    def do_GET(self) -> None:
+        """Answer a request with 429 or an audio features response"""
+        with self.server.lock:
+            self.server.requests += 1
+            self.server.connections.add(self.client_address)
+            rate_limited = self.server.requests <= self.server.rate_limited
+        if rate_limited:
+            body = b'{"error": {"status": 429, "message": "API rate limit exceeded"}}'
+            self.send_response(429)
+            self.send_header('Retry-After', str(self.server.retry_after))
+        else:
+            body = b'{"audio_features": []}'
+            self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args: Any) -> None:
+        """Don't log requests"""
+
+
+class LocalSpotify:
+    """
+    The audio_features method of the spotipy client, for sending requests to a RateLimitedServer
+    when spotipy isn't installed. Errors are raised as StubHTTPError, like spotipy raises
+    SpotifyException.
+
+    Instance attributes:
+        - prefix: the url the API is at, like spotipy.Spotify.prefix
+        - session: the requests session requests are sent through, None to send them with urllib
+    """
+    prefix: str
+    session: Any
+
+    def __init__(self, prefix: str, session: Any = None) -> None:
+        """Initialize the client"""
+        self.prefix = prefix
+        self.session = session
+
+    def audio_features(self, tracks: list[str]) -> Any:
+        """Return the audio features of tracks"""
+        url = self.prefix + 'audio-features/?ids=' + ','.join(tracks)
+        if self.session is not None:
+            response = self.session.get(url)
+            if response.status_code >= 400:
+                raise StubHTTPError(response.status_code, dict(response.headers))
+            return response.json()
+        try:
+            with urllib.request.urlopen(url) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as error:
+            raise StubHTTPError(error.code, dict(error.headers)) from error
+
+
+def synthetic_name(rand: random.Random) -> str:
+    """Return a random song name, made of common words and made up ones"""
+    words = []
+    for _ in range(rand.randint(1, 4)):
+        if rand.random() < 0.6:
+            words.append(rand.choice(WORDS))
+        else:
+            words.append(''.join(rand.choice(SYLLABLES) for _ in range(rand.randint(2, 3))))
+    return ' '.join(words).capitalize()
+
+
+def synthetic_graph(num_genres: int, songs_per_genre: int, threshold: float,
+                    seed: int = 0) -> Tuple[song_graph.GenreGraph, dict]:
+    """
+    Return a genre graph (and its song id to genre mapping) made of random songs. The genres are
+    the first num_genres genres of song_graph.GENRE_DATA.
+
+    Preconditions:
+        - num_genres > 0 and songs_per_genre > 0
+        - threshold > 0
+    """
+    rand = random.Random(seed)
+    genres_to_prop = song_graph.load_genres(song_graph.GENRE_DATA)
+    genre_graph = song_graph.GenreGraph()
+    songs_to_g = {}
+    ratings = []
+
+    for genre in list(genres_to_prop)[:num_genres]:
+        songs = []
+        artists = [' '.join(''.join(rand.choice(SYLLABLES) for _ in range(rand.randint(2, 3)))
+                            for _ in range(2)).title() for _ in range(songs_per_genre // 10 + 1)]
+        for i in range(songs_per_genre):
+            properties = {prop: rand.random() for prop in song_graph.PROPERTIES}
+            properties['key'] = rand.randint(0, 11)
+            properties['mode'] = rand.randint(0, 1)
+            properties['loudness'] = -60 * rand.random()
+            properties['tempo'] = 60 + 140 * rand.random()
+            year = rand.randint(1921, 2020)
+            information = {'artists': [rand.choice(artists)],
+                           'duration': float(rand.randint(60000, 400000)),
+                           'explicit': rand.randint(0, 1),
+                           'id': genre + '-' + str(i),
+                           'name': synthetic_name(rand),
+                           'release_date': datetime.datetime(year, 1, 1),
+                           'year': str(year),
+                           'popularity': float(rand.randint(0, 100))}
+            song = song_graph.Song(properties, information, information['name'])
+            song.genre = genre
+            songs.append(song)
+            songs_to_g[information['id']] = genre
+
+        curr_genre = song_graph.Genre(song_graph.create_song_graph(songs, threshold),
+                                      genres_to_prop[genre], genre)
+        genre_graph.add_genre(curr_genre)
+        ratings.append((song_graph.get_genre_rating(curr_genre), genre))
+
+    ratings.sort(key=lambda x: x[0])
+    for i in range(0, len(ratings) - 1):
+        for j in range(i + 1, min(i + 4, len(ratings))):
+            genre_graph.add_edge(ratings[i][1], ratings[j][1], ratings[j][0] - ratings[i][0])
+
+    genre_graph.get_genre_index().build_nearest()
+    genre_graph.get_bridge_index().build()
+    genre_graph.get_dedup_index()
+    return genre_graph, songs_to_g
+
+
+def random_seeds(graph: song_graph.GenreGraph, rand: random.Random,
+                 num_seeds: int) -> list[song_graph.Song]:
+    """Return num_seeds random songs from graph, picked from non-empty genres"""
+    genres = [genre for genre in graph.genres if graph.genres[genre].song_graph.songs != {}]
+    seeds = []
+    for _ in range(num_seeds):
+        songs = graph.genres[rand.choice(genres)].song_graph.songs
+        seeds.append(songs[rand.choice(list(songs))])
+    return seeds
+
+
+def new_songs(graph: song_graph.GenreGraph, rand: random.Random, num_songs: int,
+              prefix: str = 'new') -> list[song_graph.Song]:
+    """Return num_songs songs that aren't in graph, each a slightly changed copy of a random song
+    of graph (in the same genre)"""
+    songs = []
+    for i, base in enumerate(random_seeds(graph, rand, num_songs)):
+        properties = {prop: value if prop in {'key', 'mode'}
+                      else value * (1 + rand.uniform(-0.05, 0.05))
+                      for prop, value in base.properties.items()}
+        information = dict(base.information)
+        information['id'] = prefix + '-' + str(i)
+        song = song_graph.Song(properties, information, base.name)
+        song.genre = base.genre
+        songs.append(song)
+    return songs
+
+
+def time_runs(function: Callable[[], object], runs: int) -> list[float]:
+    """Call function runs times and return how long each call took in milliseconds"""
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        function()
+        times.append((time.perf_counter() - start) * 1000)
+    return times
+
+
+def report(label: str, times: list[float]) -> None:
+    """Print the mean, median and worst time of a benchmark"""
+    print(label.ljust(32) + 'mean ' + format(statistics.mean(times), '9.3f') + ' ms   median '
+          + format(statistics.median(times), '9.3f') + ' ms   max '
+          + format(max(times), '9.3f') + ' ms')
+
+
+def bench_modes(graph: song_graph.GenreGraph, all_songs: dict, runs: int = 5,
+                num_seeds: int = 3, seed: int = 0) -> None:
+    """Time computations.recommend for every generation mode on random seed songs"""
+    rand = random.Random(seed)
+    seed_lists = [random_seeds(graph, rand, num_seeds) for _ in range(runs)]
+
+    for mode in computations.GEN_MODES:
+        preferences = dict(computations.DEFAULT_PREFERENCES)
+        preferences['gen_mode'] = mode
+        preferences['acousticness'] = 50
+        seed_iter = iter(seed_lists)
+        times = time_runs(lambda: computations.recommend(graph, all_songs, list(next(seed_iter)),
+                                                         preferences), runs)
+        report(mode, times)
+
+
+def bench_catalog(graph: song_graph.GenreGraph, runs: int = 200, seed: int = 0) -> None:
+    """Time searching the songs of graph with its CatalogIndex, compared to checking the name
+    and artists of every song"""
+    rand = random.Random(seed)
+    start = time.perf_counter()
+    index = catalog_search.CatalogIndex(song for genre in graph.genres.values()
+                                        for song in genre.song_graph.songs.values())
+    print('build index'.ljust(32) + format((time.perf_counter() - start) * 1000, '9.3f') + ' ms   '
+          + str(len(index.songs)) + ' songs, ' + str(len(index.vocabulary)) + ' words')
+
+    songs = [rand.choice(index.songs) for _ in range(runs)]
+    queries = {'song name': [(song.name, '') for song in songs],
+               'song name, artist': [(song.name, song.information['artists'][0])
+                                     for song in songs],
+               'prefix of a word': [(rand.choice(catalog_search.search_tokens(song.name))[:4], '')
+                                    for song in songs]}
+
+    def scan(song_name: str, artist: str) -> list[song_graph.Song]:
+        """Search by checking every song"""
+        name_words = catalog_search.search_tokens(song_name)
+        artist_words = catalog_search.search_tokens(artist)
+        matches = []
+        for song in index.songs:
+            name = catalog_search.search_tokens(song.name)
+            artists = catalog_search.search_tokens(' '.join(song.information['artists']))
+            if all(any(w.startswith(q) for w in name) for q in name_words) \
+                    and all(any(w.startswith(q) for w in artists) for q in artist_words):
+                matches.append(song)
+        matches.sort(key=lambda s: -s.information['popularity'])
+        return matches[:10]
+
+    for label, query_list in queries.items():
+        query_iter = iter(query_list)
+        report('index: ' + label, time_runs(lambda: index.search(*next(query_iter)), runs))
+    query_iter = iter(queries['song name, artist'][:5])
+    report('scan: song name, artist', time_runs(lambda: scan(*next(query_iter)), 5))
+
+
+def bench_delta(graph: song_graph.GenreGraph, all_songs: dict, deltas: int = 50,
+                size: int = 4, seed: int = 0) -> None:
+    """Replay a log of deltas that each add, remove and change size songs (like catalog_delta
+    does at startup), compared to building the dedup index from scratch once. Checks that the
+    dedup index is kept up to date rather than rebuilt. graph is changed."""
+    import catalog_delta
+    rand = random.Random(seed)
+    index = graph.get_dedup_index()
+    start = time.perf_counter()
+    dedup.DedupIndex(song for genre in graph.genres.values()
+                     for song in genre.song_graph.songs.values())
+    print('build dedup index'.ljust(32) + format((time.perf_counter() - start) * 1000, '9.1f')
+          + ' ms')
+
+    with tempfile.TemporaryDirectory() as directory:
+        log_file = os.path.join(directory, 'graph.delta.jsonl')
+        ids = list(all_songs)
+        rand.shuffle(ids)
+        for i in range(deltas):
+            added = new_songs(graph, rand, size, 'delta-' + str(i))
+            for song in added:
+                song.name = song.information['id']  # a title no song of the graph has
+            changed = []
+            for song_id in ids[i * 2 * size + size:(i + 1) * 2 * size]:
+                old = graph.genres[all_songs[song_id]].song_graph.songs[song_id]
+                song = catalog_delta.song_from_json(catalog_delta.song_to_json(old))
+                song.information['popularity'] = rand.randint(0, 100)
+                changed.append(song)
+            catalog_delta.append_to_log(log_file, catalog_delta.CatalogDelta(
+                added, ids[i * 2 * size:i * 2 * size + size], changed))
+
+        start = time.perf_counter()
+        applied = catalog_delta.replay_log(log_file, graph, all_songs)
+        took = time.perf_counter() - start
+
+    assert graph.dedup_index is index, 'the dedup index was rebuilt'
+    rebuilt = dedup.DedupIndex(song for genre in graph.genres.values()
+                               for song in genre.song_graph.songs.values())
+    assert index.groups.keys() == rebuilt.groups.keys()
+    assert sorted(index.sizes.values()) == sorted(rebuilt.sizes.values())
+    print('replay'.ljust(32) + format(took * 1000, '9.1f') + ' ms   ' + str(applied)
+          + ' deltas of ' + str(3 * size) + ' songs, dedup index kept up to date')
+
+
+def bench_imports(runs: int = 5) -> None:
+    """Time starting a fresh interpreter and importing main, compared to also loading everything
+    main used to import eagerly (the visualization libraries and the spotify client). A
+    comparison whose imports fail is skipped."""
+    cold = 'import main'
+    eager = 'import main, pygame_visualization, spotify_methods; spotify_methods.get_client()'
+    for label, code in [('python (no imports)', 'pass'), ('import main', cold),
+                        ('import main (eager)', eager)]:
+        result = subprocess.run([sys.executable, '-c', code], check=False,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        if result.returncode != 0:  # e.g. a library isn't installed, timing it would mislead
+            error = result.stderr.strip().splitlines() or ['exit code ' + str(result.returncode)]
+            print(label.ljust(32) + 'skipped, failed: ' + error[-1])
+            continue
+        times = time_runs(lambda: subprocess.run([sys.executable, '-c', code], check=True,
+                                                 stdout=subprocess.DEVNULL,
+                                                 stderr=subprocess.DEVNULL), runs)
+        report(label, times)
+
+
+def bench_service(graph: song_graph.GenreGraph, all_songs: dict, requests: int = 50,
+                  concurrency: int = 8, seed: int = 0) -> None:
+    """Start the recommendation service on a free local port and time requests sent to it,
+    concurrency at a time"""
+    import catalog_delta
+    rand = random.Random(seed)
+    bodies = [{'seeds': [song.information['id'] for song in random_seeds(graph, rand, 3)],
+               'gen_mode': computations.GEN_MODES[i % len(computations.GEN_MODES)]}
+              for i in range(requests)]
+
+    async def run() -> None:
+        """Send the requests and report their latencies"""
+        rec_service = service.RecommendationService(graph, all_songs)
+        server = await rec_service.start('127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        limit = asyncio.Semaphore(concurrency)
+        times = []
+
+        async def timed_call(body: dict) -> None:
+            """Send one request and record how long it took"""
+            async with limit:
+                start = time.perf_counter()
+                await service.call('127.0.0.1', port, 'POST', '/recommend', body)
+                times.append((time.perf_counter() - start) * 1000)
+
+        stats_times = []
+        start = time.perf_counter()
+        pending = asyncio.gather(*[timed_call(body) for body in bodies])
+        while not pending.done():
+            stats_start = time.perf_counter()
+            await service.call('127.0.0.1', port, 'GET', '/stats')
+            stats_times.append((time.perf_counter() - stats_start) * 1000)
+            await asyncio.sleep(0.01)
+        await pending
+        total = time.perf_counter() - start
+
+        # songs added with POST /songs are in the graph once their batch is applied
+        added = new_songs(graph, rand, 10, 'posted')
+        status, response = await service.call(
+            '127.0.0.1', port, 'POST', '/songs',
+            {'songs': [catalog_delta.song_to_json(song) for song in added]})
+        rec_service.store.flush()
+        found, _ = await service.call('127.0.0.1', port, 'GET',
+                                      '/songs/' + added[0].information['id'])
+        assert status == 200 and response['queued'] == len(added) and found == 200
+        assert all(song.information['id'] not in all_songs for song in added)
+
+        server.close()
+        await server.wait_closed()
+        report('/recommend', times)
+        report('/stats during /recommend', stats_times)
+        print('throughput'.ljust(32) + format(requests / total, '.1f') + ' requests / s')
+
+        # Seeds that aren't in the graph go into an overlay per request, which mustn't add their
+        # groups to the shared dedup index or change the seeds
+        snapshot = rec_service.store.snapshot()
+        groups = len(snapshot.graph.get_dedup_index().groups)
+        seed_lists = [new_songs(graph, rand, 3, 'service-' + str(i)) for i in range(requests)]
+        for song in itertools.chain.from_iterable(seed_lists):
+            song.name = song.information['id']  # a title no song of the graph has
+        loop = asyncio.get_running_loop()
+        calls = []
+        for i, seeds in enumerate(seed_lists):
+            preferences = dict(computations.DEFAULT_PREFERENCES)
+            preferences['gen_mode'] = computations.GEN_MODES[i % len(computations.GEN_MODES)]
+            calls.append(loop.run_in_executor(rec_service.executor, computations.recommend,
+                                              snapshot.graph, snapshot.all_songs, seeds,
+                                              preferences))
+        await asyncio.gather(*calls)
+        rec_service.executor.shutdown()
+        assert len(snapshot.graph.get_dedup_index().groups) == groups
+        assert not any(hasattr(song, 'group') or song.neighbours
+                       for song in itertools.chain.from_iterable(seed_lists))
+        print('new seeds'.ljust(32) + str(requests) + ' requests, dedup groups and seeds '
+              'unchanged')
+
+    asyncio.run(run())
+
+
+def bench_store(graph: song_graph.GenreGraph, all_songs: dict, readers: int = 4,
+                inserts: int = 500, duration: float = 5.0, seed: int = 0) -> None:
+    """Run recommendations on readers threads while a writer streams inserts into a GraphStore,
+    and report the latencies on both sides. Every reader checks that its snapshot doesn't change
+    while it uses it."""
+    import graph_store
+    rand = random.Random(seed)
+    graph.get_catalog_index()
+    store = graph_store.GraphStore(graph, all_songs)
+    first = store.snapshot()
+    songs = new_songs(graph, rand, inserts)
+    seed_lists = [random_seeds(graph, rand, 3) for _ in range(100)]
+    stop = threading.Event()
+    times, errors, versions = [], [], set()
+
+    def read(reader: int) -> None:
+        """Recommend from the current snapshot until stopped"""
+        preferences = dict(computations.DEFAULT_PREFERENCES)
+        preferences['gen_mode'] = 'level gen'
+        runs = 0
+        while not stop.is_set():
+            snapshot = store.snapshot()
+            size = len(snapshot.all_songs)
+            seeds = [snapshot.graph.get_song(song) for song in seed_lists[(reader + runs) % 100]]
+            start = time.perf_counter()
+            try:
+                computations.recommend(snapshot.graph, snapshot.all_songs, seeds, preferences)
+            except Exception as error:
+                errors.append(error)
+            times.append((time.perf_counter() - start) * 1000)
+            if len(snapshot.all_songs) != size:
+                errors.append('snapshot changed while in use')
+            versions.add(snapshot.version)
+            runs += 1
+
+    threads = [threading.Thread(target=read, args=(i,)) for i in range(readers)]
+    for thread in threads:
+        thread.start()
+    insert_times = []
+    start = time.perf_counter()
+    for i, song in enumerate(songs):
+        insert_start = time.perf_counter()
+        store.insert(song)
+        insert_times.append((time.perf_counter() - insert_start) * 1000)
+        # spread the inserts over duration, without adding the time batches take to it
+        time.sleep(max(0.0, start + duration * (i + 1) / inserts - time.perf_counter()))
+    store.flush()
+    total = time.perf_counter() - start
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    report('recommend while inserting', times)
+    report('insert', insert_times)
+    print('inserted'.ljust(32) + str(store.inserted) + ' songs in ' + format(total, '.1f')
+          + ' s, ' + str(store.version) + ' versions, readers saw ' + str(len(versions)))
+    print('errors'.ljust(32) + str(len(errors)) + (' ' + repr(errors[0]) if errors else ''))
+    assert errors == [], 'readers failed: ' + repr(errors[0])
+    assert all(song.information['id'] not in all_songs for song in songs), 'original changed'
+    assert store.inserted == inserts and all(song.information['id'] in store.snapshot().all_songs
+                                             for song in songs)
+    print('original graph unchanged'.ljust(32) + 'True')
+
+    def found(snapshot: graph_store.Snapshot, song: song_graph.Song) -> bool:
+        """Return whether searching snapshot's catalog for song finds it"""
+        results = snapshot.graph.get_catalog_index().search(
+            song.name, ', '.join(song.information['artists']), limit=len(all_songs))
+        return any(result.information['id'] == song.information['id'] for result in results)
+    assert not found(first, songs[0]) and found(store.snapshot(), songs[0])
+    depth = max(len(genre.song_graph.songs.maps) for genre in store.snapshot().graph.genres.values()
+                if isinstance(genre.song_graph.songs, collections.ChainMap))
+    assert len(store.snapshot().all_songs.maps) <= math.log2(store.version) + 2
+    print('versions have own catalog views'.ljust(32) + 'True, deepest genre has '
+          + str(depth) + ' layers')
+
+
+def bench_insert(graph: song_graph.GenreGraph, all_songs: dict,
+                 sizes: tuple = (100, 1000, 10000), seed: int = 0) -> None:
+    """Time inserting new songs one at a time (rescanning the genre for every song, like
+    sg_insert_song used to), one at a time with sg_insert_song and all at once with insert_songs.
+    Every method inserts into its own OverlayGraph, so graph isn't changed."""
+    rand = random.Random(seed)
+    for genre in graph.genres.values():  # worked out once and kept, so don't time it
+        genre.song_graph.get_rating_order()
+    for size in sizes:
+        songs = new_songs(graph, rand, size, 'insert-' + str(size))
+
+        def rescan() -> overlays.OverlayGraph:
+            """Insert the songs comparing each of them with every song of its genre"""
+            overlay = overlays.OverlayGraph(graph, all_songs)
+            for song in songs:
+                if song.genre not in overlay.genres.maps[0]:  # makes the overlay of the genre
+                    overlay.insert_song(song)
+                    continue
+                song_g = overlay.genres[song.genre].song_graph
+                song_g.add_song(song)
+                rating = song_graph.get_song_rating(song)
+                for other_id in list(song_g.songs):
+                    difference = abs(song_graph.get_song_rating(song_g.songs[other_id]) - rating)
+                    if other_id != song.information['id'] and difference <= 0.1:
+                        song_g.add_edge(song.information['id'], other_id, difference)
+            return overlay
+
+        def one_by_one() -> overlays.OverlayGraph:
+            """Insert the songs with sg_insert_song"""
+            overlay = overlays.OverlayGraph(graph, all_songs)
+            for song in songs:
+                overlay.insert_song(song)
+            return overlay
+
+        def bulk() -> overlays.OverlayGraph:
+            """Insert the songs with insert_songs"""
+            overlay = overlays.OverlayGraph(graph, all_songs)
+            overlay.insert_songs(songs)
+            return overlay
+
+        edge_counts = []
+        methods = [('one by one', one_by_one), ('bulk', bulk)]
+        if size <= 1000:
+            methods.insert(0, ('rescan', rescan))
+        for label, method in methods:
+            for song in songs:
+                song.neighbours = {}
+            start = time.perf_counter()
+            overlay = method()
+            took = (time.perf_counter() - start) * 1000
+            edge_counts.append(sum(len(overlay.get_song(song).neighbours) for song in songs))
+            print((label + ', ' + str(size) + ' songs').ljust(32) + format(took, '9.1f') + ' ms   '
+                  + str(edge_counts[-1]) + ' edges to new songs')
+            del overlay
+        print(' ' * 32 + 'same edges: ' + str(len(set(edge_counts)) == 1))
+
+
+def bench_sparsify(graph: song_graph.GenreGraph, all_songs: dict, max_degree: int = 32,
+                   runs: int = 5, num_genres: int = 5, num_seeds: int = 3, seed: int = 0) -> None:
+    """Time every generation mode on seed songs from the num_genres genres with the most edges,
+    then sparsify graph (in place) to max_degree and time them again"""
+    rand = random.Random(seed)
+    largest = sorted(graph.genres.values(), key=lambda genre: sparsify.count_edges(
+        genre.song_graph), reverse=True)[:num_genres]
+    seed_lists = []
+    for _ in range(runs):
+        songs = [list(rand.choice(largest).song_graph.songs.values()) for _ in range(num_seeds)]
+        seed_lists.append([rand.choice(genre_songs) for genre_songs in songs])
+    print('largest genres: ' + ', '.join(genre.name + ' (' + str(sparsify.count_edges(
+        genre.song_graph)) + ' edges)' for genre in largest))
+
+    def time_modes() -> dict[str, float]:
+        """Return the median time of every generation mode on the seed lists. Every mode is run
+        once on every seed list first, so the lazy indexes and transition matrices are built
+        before the timing starts."""
+        medians = {}
+        for mode in computations.GEN_MODES:
+            preferences = dict(computations.DEFAULT_PREFERENCES)
+            preferences['gen_mode'] = mode
+            preferences['acousticness'] = 50
+            for seeds in seed_lists:
+                computations.recommend(graph, all_songs, list(seeds), preferences)
+            seed_iter = iter(seed_lists)
+            random.seed(seed)  # the modes that shuffle do the same on both graphs
+            medians[mode] = statistics.median(time_runs(lambda: computations.recommend(
+                graph, all_songs, list(next(seed_iter)), preferences), runs))
+        return medians
+
+    parts_before = {name: components(genre.song_graph) for name, genre in graph.genres.items()}
+    before = time_modes()
+    start = time.perf_counter()
+    edges = sparsify.sparsify_graph(graph, max_degree)
+    took = time.perf_counter() - start
+    removed = sum(old - new for old, new in edges.values())
+    print('sparsified to degree ' + str(max_degree) + ' in ' + format(took, '.2f') + ' s: '
+          + str(removed) + ' of ' + str(sum(old for old, _ in edges.values()))
+          + ' edges removed, about ' + format(removed * song_graph.EDGE_BYTES / 2 ** 20, '.1f')
+          + ' MB saved')
+    for name, genre in graph.genres.items():
+        songs = genre.song_graph.songs
+        assert all(songs[other_id].neighbours.get(song_id) == weight
+                   for song_id, song in songs.items()
+                   for other_id, weight in song.neighbours.items()), name + ' is not symmetric'
+        parts_after = components(genre.song_graph)
+        pairs = {(parts_before[name][song_id], parts_after[song_id]) for song_id in songs}
+        assert len(pairs) == len(set(parts_before[name].values())) == len(
+            set(parts_after.values())), name + ' has different connected parts'
+    print('symmetric, same connected parts'.ljust(32) + 'True')
+
+    after = time_modes()
+    for mode in computations.GEN_MODES:
+        print(mode.ljust(32) + format(before[mode], '9.3f') + ' ms -> '
+              + format(after[mode], '9.3f') + ' ms   ' + format(before[mode] / after[mode], '.1f')
+              + 'x')
+
+
+def components(graph: song_graph.SongGraph) -> dict[str, str]:
+    """Return a map from the id of every song of graph to an id representing its connected part"""
+    parts = sparsify.UnionFind(graph.songs)
+    for song_id, song in graph.songs.items():
+        for other_id in song.neighbours:
+            parts.union(song_id, other_id)
+    return {song_id: parts.find(song_id) for song_id in graph.songs}
+
+
+def bench_page_rank(graph: song_graph.GenreGraph, all_songs: dict, runs: int = 5,
+                    num_seeds: int = 3, seed: int = 0) -> None:
+    """Time the page rank mode against level gen (bfs_gen) on seed songs from the largest genre,
+    and check how close the ranks are to fully converged ones"""
+    rand = random.Random(seed)
+    largest = max(graph.genres.values(), key=lambda genre: len(genre.song_graph.songs))
+    songs = list(largest.song_graph.songs.values())
+    seed_lists = [[rand.choice(songs) for _ in range(num_seeds)] for _ in range(runs)]
+    print('largest genre: ' + largest.name + ' (' + str(len(songs)) + ' songs, '
+          + str(sparsify.count_edges(largest.song_graph)) + ' edges)')
+
+    if not largest.song_graph.has_transitions():
+        preferences = dict(computations.DEFAULT_PREFERENCES)
+        preferences['gen_mode'] = 'page rank'
+        budget = computations.Budget(max_expansions=len(songs) // 2)
+        start = time.perf_counter()
+        walked = computations.recommend(graph, all_songs, seed_lists[0], preferences,
+                                        budget=budget)
+        took = (time.perf_counter() - start) * 1000
+        assert not largest.song_graph.has_transitions() and walked != []
+        assert budget.expansions <= len(songs) // 2 + 1
+        print('walks (matrix over budget)'.ljust(32) + format(took, '9.1f') + ' ms   '
+              + str(budget.expansions) + ' steps')
+
+    start = time.perf_counter()
+    matrix = largest.song_graph.get_transitions()
+    print('transition matrix'.ljust(32) + format((time.perf_counter() - start) * 1000, '9.1f')
+          + ' ms   ' + str(len(matrix.columns)) + ' steps')
+
+    for mode in ['level gen', 'page rank']:
+        preferences = dict(computations.DEFAULT_PREFERENCES)
+        preferences['gen_mode'] = mode
+        preferences['energy'] = 50
+        seed_iter = iter(seed_lists)
+        report(mode, time_runs(lambda: computations.recommend(graph, all_songs,
+                                                              list(next(seed_iter)),
+                                                              preferences), runs))
+
+    iterations = []
+    overlaps = []
+    walk_overlaps = []
+    for seeds in seed_lists:
+        restarts = [0.0] * len(matrix.ids)
+        for song in seeds:
+            restarts[matrix.positions[song.information['id']]] += 1 / len(seeds)
+        rank, used = computations.page_rank(matrix, restarts)
+        exact, _ = computations.page_rank(matrix, restarts, tolerance=1e-12, max_iterations=500)
+        top = sorted(range(len(rank)), key=lambda i: rank[i], reverse=True)[:20]
+        exact_top = sorted(range(len(exact)), key=lambda i: exact[i], reverse=True)[:20]
+        walked = computations.walk_rank(largest.song_graph, seeds)
+        walked_top = sorted(walked, key=walked.__getitem__, reverse=True)[:20]
+        iterations.append(used)
+        overlaps.append(len(set(top) & set(exact_top)) / 20)
+        walk_overlaps.append(len({matrix.positions[song_id] for song_id in walked_top}
+                                 & set(exact_top)) / 20)
+    print('iterations'.ljust(32) + 'mean ' + format(statistics.mean(iterations), '.1f')
+          + '   top 20 matching converged ranks ' + format(statistics.mean(overlaps), '.0%')
+          + ', by walks ' + format(statistics.mean(walk_overlaps), '.0%'))
+
+
+def bench_filters(graph: song_graph.GenreGraph, all_songs: dict, runs: int = 5,
+                  num_seeds: int = 3, seed: int = 0) -> None:
+    """Time finding the songs a filter allows in the bitmaps of the FilterIndex against checking
+    every song, then time every generation mode with and without the filter and check the
+    filtered playlists only have songs the filter allows"""
+    rand = random.Random(seed)
+    seed_lists = [random_seeds(graph, rand, num_seeds) for _ in range(runs)]
+    song_filter = song_filters.SongFilter(explicit=False, modes=[1], years=(1990, 2005),
+                                          min_popularity=50)
+    largest = max(graph.genres.values(), key=lambda genre: len(genre.song_graph.songs))
+    songs = largest.song_graph.songs
+
+    graph.filter_index = None
+    start = time.perf_counter()
+    for genre in graph.genres:
+        graph.get_filter_index().bitmaps(genre)
+    print('filter index'.ljust(32) + format((time.perf_counter() - start) * 1000, '9.1f')
+          + ' ms for ' + str(len(all_songs)) + ' songs')
+    scanned = []
+    report('scan ' + largest.name, time_runs(lambda: scanned.append(
+        [song_id for song_id, song in songs.items() if song_filter.allows(song)]), runs))
+    looked_up = []
+    report('bitmaps ' + largest.name, time_runs(lambda: looked_up.append(
+        graph.get_filter_index().matcher(song_filter).song_ids(largest.name, songs)), runs))
+    print(str(len(looked_up[0])) + ' of ' + str(len(songs)) + ' songs allowed, same as scan: '
+          + str(sorted(looked_up[0]) == sorted(scanned[0])))
+
+    for mode in computations.GEN_MODES:
+        preferences = dict(computations.DEFAULT_PREFERENCES)
+        preferences['gen_mode'] = mode
+        preferences['acousticness'] = 50
+        for label, mode_filter in [(mode, None), (mode + ' (filtered)', song_filter)]:
+            seed_iter = iter(seed_lists)
+            playlists = []
+            random.seed(seed)
+            report(label, time_runs(lambda: playlists.append(computations.recommend(
+                graph, all_songs, list(next(seed_iter)), preferences, mode_filter)), runs))
+        if not all(song_filter.allows(song) for playlist in playlists for song in playlist):
+            print('    a filtered playlist has a song the filter doesn\'t allow')
+
+
+def bench_budget(graph: song_graph.GenreGraph, all_songs: dict, seconds: float = 0.05,
+                 runs: int = 5, num_seeds: int = 3, seed: int = 0) -> None:
+    """Time every generation mode without a budget and with a time limit of seconds, and count
+    how many playlists were truncated and how many songs they have"""
+    rand = random.Random(seed)
+    seed_lists = [random_seeds(graph, rand, num_seeds) for _ in range(runs)]
+
+    for mode in computations.GEN_MODES:
+        preferences = dict(computations.DEFAULT_PREFERENCES)
+        preferences['gen_mode'] = mode
+        preferences['acousticness'] = 50
+        for label, limit in [(mode, None), (mode + ' (' + format(seconds, 'g') + ' s)', seconds)]:
+            seed_iter = iter(seed_lists)
+            results = []
+
+            def generate() -> None:
+                """Generate a playlist with a new budget and keep it"""
+                budget = computations.Budget(limit)
+                playlist = computations.recommend(graph, all_songs, list(next(seed_iter)),
+                                                  preferences, budget=budget)
+                results.append((budget.truncated, len(playlist)))
+
+            random.seed(seed)
+            times = time_runs(generate, runs)
+            print(label.ljust(32) + 'median ' + format(statistics.median(times), '9.3f')
+                  + ' ms   max ' + format(max(times), '9.3f') + ' ms   truncated '
+                  + str(sum(truncated for truncated, _ in results)) + '/' + str(runs)
+                  + '   songs ' + format(statistics.mean(size for _, size in results), '.1f'))
+
+
+def bench_spotify(num_tracks: int = 1000, latency: float = 0.005) -> None:
+    """Time converting spotify tracks into Song vertices against a StubSpotify: one track at a
+    time (like spot_song_to_vert), in batches sent one request at a time, and in batches sent at
+    the same time. The last one is also run with every 5th request rate limited, and then again
+    with the lookups it cached."""
+    import spotify_cache
+    import spotify_client
+    import spotify_methods
+    graph = song_graph.GenreGraph()
+    spotify_methods.get_genre_props()
+
+    with tempfile.TemporaryDirectory() as directory:
+        runs = [('one track at a time', 1, 1, 0, 'cold'),
+                ('batched, 1 in flight', 50, 1, 0, 'cold'),
+                ('batched, 8 in flight', 50, 8, 0, 'cold'),
+                ('batched, 8 in flight, 429s', 50, 8, 5, 'cold'),
+                ('batched, cached', 50, 8, 0, 'warm')]
+        cache = None
+        for label, batch_size, in_flight, rate_limit_every, cache_state in runs:
+            if cache_state == 'cold':
+                cache = spotify_cache.SpotifyCache(os.path.join(directory, label + '.sqlite'))
+            client = StubSpotify(num_tracks=num_tracks, latency=latency,
+                                 rate_limit_every=rate_limit_every)
+            concurrent_client = spotify_client.ConcurrentSpotify(client, in_flight)
+            tracks = list(client.tracks_by_id.values())
+            start = time.perf_counter()
+            converted = 0
+            for i in range(0, len(tracks), batch_size):
+                converted += len(spotify_methods.spot_songs_to_verts(
+                    tracks[i:i + batch_size], graph, {}, concurrent_client, cache))
+            total = time.perf_counter() - start
+            print(label.ljust(32) + str(converted) + ' tracks in ' + format(total * 1000, '8.1f')
+                  + ' ms, requests: ' + str(sum(client.calls.values()))
+                  + ', retried: ' + str(concurrent_client.retries))
+            expected = 0 if cache_state == 'warm' else expected_requests(tracks, batch_size)
+            assert sum(client.calls.values()) == expected + concurrent_client.retries
+
+        stats = cache.stats()
+        print('cache'.ljust(32) + 'hit rate ' + format(stats['hit_rate'], '.2f') + ', saved about '
+              + format(stats['seconds_saved'] * 1000, '.1f') + ' ms')
+        cache.close()
+
+    # identical requests sent while the first is in flight share its response
+    client = StubSpotify(num_tracks=10, latency=max(latency, 0.05))
+    concurrent_client = spotify_client.ConcurrentSpotify(client, 8)
+    futures = [concurrent_client.submit('audio_features', list(client.tracks_by_id))
+               for _ in range(8)]
+    responses = [future.result() for future in futures]
+    assert client.calls == {'audio_features': 1} and concurrent_client.coalesced == 7
+    assert all(response is responses[0] for response in responses)
+    print('8 identical requests'.ljust(32) + 'sent 1, coalesced '
+          + str(concurrent_client.coalesced))
+
+
+def expected_requests(tracks: list[dict], batch_size: int) -> int:
+    """Return how many requests spot_songs_to_verts should send to convert tracks batch_size at a
+    time, starting from an empty cache: a request for every AUDIO_FEATURES_CHUNK tracks of each
+    batch, and one for every ARTISTS_CHUNK artists of it that no earlier batch looked up"""
+    import spotify_methods
+    try:
+        looked_up = {artist for artist, genres in song_graph.get_artist_genres().local().items()
+                     if genres != []}
+    except OSError:
+        looked_up = set()
+    requests = 0
+    for i in range(0, len(tracks), batch_size):
+        batch = tracks[i:i + batch_size]
+        artists = {spotify_methods.main_artist(track)['name'] for track in batch} - looked_up
+        looked_up.update(artists)
+        requests += -(-len(batch) // spotify_methods.AUDIO_FEATURES_CHUNK)
+        requests += -(-len(artists) // spotify_methods.ARTISTS_CHUNK)
+    return requests
+
+
+def bench_playlist(num_tracks: int = 5000, num_playlists: int = 120,
+                   latency: float = 0.005) -> None:
+    """Time pulling a num_tracks track playlist (the last of num_playlists playlists, so it is on
+    the last page of playlists) from a StubSpotify, and how long until the first batch of songs
+    is ready"""
+    import spotify_cache
+    import spotify_methods
+    client = StubSpotify(num_tracks=num_tracks, num_artists=num_tracks // 10, latency=latency)
+    for i in range(num_playlists - 1):
+        client.add_playlist('playlist ' + str(i), list(client.tracks_by_id)[:10])
+    client.add_playlist('big playlist', list(client.tracks_by_id))
+    spotify_methods.get_genre_props()
+
+    with tempfile.TemporaryDirectory() as directory:
+        cache = spotify_cache.SpotifyCache(os.path.join(directory, 'cache.sqlite'))
+        start = time.perf_counter()
+        first_batch = None
+        songs = 0
+        for batch in spotify_methods.stream_playlist('big playlist', song_graph.GenreGraph(), {},
+                                                     client=client, cache=cache):
+            if first_batch is None:
+                first_batch = time.perf_counter() - start
+            songs += len(batch)
+        total = time.perf_counter() - start
+        cache.close()
+
+    print('first batch'.ljust(32) + format(first_batch * 1000, '.1f') + ' ms')
+    print('whole playlist'.ljust(32) + str(songs) + ' of ' + str(num_tracks) + ' songs in '
+          + format(total * 1000, '.1f') + ' ms, requests: ' + str(client.calls))
+
+
+def bench_retries(requests: int = 32, max_in_flight: int = 4, retry_after: int = 1) -> None:
+    """Send requests through spotipy's HTTP path (a spotipy client with the pooled session of
+    spotify_client.make_session, as spotify_methods.get_client makes it) to a local
+    RateLimitedServer whose first request is answered with 429. Checks that ConcurrentSpotify
+    waits the Retry-After time and retries, and that the session reuses its connections. Without
+    spotipy the requests are sent by a LocalSpotify instead, and without requests by urllib (so
+    connections aren't reused and that isn't checked)."""
+    import spotify_client
+    server = RateLimitedServer(1, retry_after)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    prefix = 'http://127.0.0.1:' + str(server.server_address[1]) + '/v1/'
+    try:
+        session = spotify_client.make_session(max_in_flight)
+    except ImportError:
+        session = None
+    try:
+        import spotipy
+        client = spotipy.Spotify(auth='local', requests_session=session, retries=0,
+                                 status_retries=0)
+        client.prefix = prefix
+        sender = 'spotipy'
+    except ImportError:
+        client = LocalSpotify(prefix, session)
+        sender = 'requests' if session is not None else 'urllib'
+    concurrent_client = spotify_client.ConcurrentSpotify(client, max_in_flight)
+
+    start = time.perf_counter()
+    concurrent_client.call('audio_features', ['track0'])
+    took = time.perf_counter() - start
+    concurrent_client.map('audio_features', [(['track' + str(i)],) for i in range(requests)])
+    server.shutdown()
+    server.server_close()
+
+    assert concurrent_client.retries == 1 and took >= retry_after
+    assert server.requests == requests + 2
+    print('429 with Retry-After'.ljust(32) + 'retried after ' + format(took, '.2f') + ' s ('
+          + sender + ')')
+    if session is None:
+        print('pooled session'.ljust(32) + 'skipped, requests is not installed')
+        return
+    assert len(server.connections) <= max_in_flight
+    print('pooled session'.ljust(32) + str(server.requests) + ' requests on '
+          + str(len(server.connections)) + ' connections')
+
+
+def bench_transport(requests: int = 16, max_in_flight: int = 4, retry_after: int = 1) -> None:
+    """Record requests sent through spotipy to a local RateLimitedServer (whose first request is
+    answered with 429) with spotify_transport.RecordingSession, then replay them with the client
+    spotify_methods.get_client makes for the 'replay' transport. Checks that the replay sends
+    nothing, answers every request (the 429 included) like the recording and is retried the same
+    way. Skipped if spotipy isn't installed."""
+    import spotify_client
+    import spotify_methods
+    try:
+        import spotipy
+        import spotify_transport
+    except ImportError:
+        print('transport'.ljust(32) + 'skipped, spotipy is not installed')
+        return
+    server = RateLimitedServer(1, retry_after)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    prefix = 'http://127.0.0.1:' + str(server.server_address[1]) + '/v1/'
+    calls = [(['track' + str(i)],) for i in range(requests)]
+    previous = (spotify_methods.TRANSPORT, spotify_methods.CASSETTE,
+                spotify_methods.REPLAY_LATENCY)
+
+    with tempfile.TemporaryDirectory() as directory:
+        cassette = os.path.join(directory, 'cassette.jsonl')
+        session = spotify_transport.RecordingSession(
+            cassette, spotify_client.make_session(max_in_flight))
+        client = spotipy.Spotify(auth='local', requests_session=session, retries=0,
+                                 status_retries=0)
+        client.prefix = prefix
+        recording = spotify_client.ConcurrentSpotify(client, max_in_flight)
+        recorded = [recording.call('audio_features', ['track0'])]
+        recorded.extend(recording.map('audio_features', calls))
+        sent = server.requests
+        server.shutdown()
+        server.server_close()
+
+        spotify_methods.configure_transport('replay', cassette, 0)
+        try:
+            client = spotify_methods.get_client()
+            client.prefix = prefix
+            replaying = spotify_client.ConcurrentSpotify(client, max_in_flight)
+            start = time.perf_counter()
+            replayed = [replaying.call('audio_features', ['track0'])]
+            took = time.perf_counter() - start
+            replayed.extend(replaying.map('audio_features', calls))
+            answered = client._session.replayed
+        finally:
+            spotify_methods.configure_transport(*previous)
+
+    assert isinstance(client._session, spotify_transport.ReplaySession)
+    assert replayed == recorded and answered == sent == requests + 2
+    assert replaying.retries == recording.retries == 1 and took >= retry_after
+    print('record'.ljust(32) + str(sent) + ' requests, ' + str(recording.retries) + ' retried')
+    print('replay'.ljust(32) + str(answered) + ' requests answered from the cassette, '
+          + str(replaying.retries) + ' retried, none sent')
+
+
+def bench_write(num_tracks: int = 1000, latency: float = 0.005) -> None:
+    """Time writing a num_tracks track playlist to a StubSpotify, then writing it again (which
+    should add nothing)"""
+    import spotify_methods
+    client = StubSpotify(num_tracks=num_tracks, latency=latency)
+    for i in range(100):
+        client.add_playlist('playlist ' + str(i), [])
+    tracks = list(client.tracks_by_id)
+
+    for label in ['write', 'write again']:
+        client.calls.clear()
+        start = time.perf_counter()
+        playlist_id = spotify_methods.generate_playlist('generated', tracks, client)
+        total = time.perf_counter() - start
+        print(label.ljust(32) + format(total * 1000, '.1f') + ' ms, playlist has '
+              + str(len(client.playlists[playlist_id]['tracks'])) + ' tracks, requests: '
+              + str(client.calls))
+
+
+def bench_search(num_tracks: int = 2000, latency: float = 0.02, runs: int = 20) -> None:
+    """Time a search against a StubSpotify, converting every result into a Song vertex (the old
+    way) and returning unconverted results"""
+    import spotify_cache
+    import spotify_methods
+    client = StubSpotify(num_tracks=num_tracks, latency=latency)
+    spotify_methods.get_genre_props()
+    graph = song_graph.GenreGraph()
+    queries = ['Track ' + str(i) for i in range(0, num_tracks, num_tracks // runs)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        cache = spotify_cache.SpotifyCache(os.path.join(directory, 'cache.sqlite'))
+        query_iter = iter(queries)
+
+        def convert_all() -> None:
+            """Search and convert every result"""
+            results = spotify_methods.find_track_options(next(query_iter), graph, {}, '', False,
+                                                         client)
+            spotify_methods.spot_songs_to_verts([result.track for result in results], graph, {},
+                                                client, cache)
+
+        client.calls.clear()
+        report('search, convert results', time_runs(convert_all, runs))
+        print(' ' * 32 + 'requests: ' + str(client.calls))
+
+        query_iter = iter(queries)
+        client.calls.clear()
+        report('search, lazy results', time_runs(lambda: spotify_methods.find_track_options(
+            next(query_iter), graph, {}, '', False, client), runs))
+        print(' ' * 32 + 'requests: ' + str(client.calls))
+        cache.close()
+
+
+# if __name__ == '__main__':
+#     import python_ta.contracts
+#     python_ta.contracts.check_all_contracts()
+#
+#     import doctest
+#     doctest.testmod()
+#
+#     import python_ta
+#     python_ta.check_all(config={
+#         'max-line-length': 100,
+#         'disable': ['E1136'],
+#         'extra-imports': ['song_graph', 'computations', 'service', 'asyncio', 'random',
+#                           'datetime', 'statistics', 'time', 'subprocess', 'sys', 'os',
+#                           'tempfile', 'threading', 'spotify_methods', 'spotify_client',
+#                           'spotify_cache', 'sparsify', 'itertools',
+#                           'http.server', 'spotipy', 'graph_store', 'catalog_delta',
+#                           'collections', 'math', 'spotify_transport',
+#                           'json', 'urllib.error', 'urllib.request', 'catalog_search',
+#                           'dedup', 'overlays', 'song_filters'],
+#         'max-nested-blocks': 4,
+#         'allowed-io': ['report', 'bench_modes', 'bench_imports', 'bench_service',
+#                        'bench_spotify', 'bench_playlist', 'bench_write', 'bench_search',
+#                        'bench_catalog', 'bench_store', 'bench_insert', 'bench_sparsify',
+#                        'bench_page_rank', 'bench_filters', 'bench_budget', 'bench_retries',
+#                        'bench_delta', 'bench_transport']
+#     })
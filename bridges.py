@@ -0,0 +1,124 @@
+"""
+Pairs of similar songs that bridge neighbouring genres, so searches can leave the song graph of a
+genre along a song to song edge.
+"""
+from __future__ import annotations
+import bisect
+import heapq
+import song_graph
+
+# Number of song pairs bridging each pair of neighbouring genres, see BridgeIndex
+BRIDGE_PAIRS = 5
+
+
+class BridgeIndex:
+    """
+    The most similar pairs of songs between neighbouring genres, so searches can move from the
+    song graph of one genre to the song graph of a similar genre along a song to song edge.
+
+    For every edge of the genre graph, the BRIDGE_PAIRS pairs of songs (one from each genre) with
+    the closest ratings are bridges between the two genres, weighted by the difference of their
+    ratings like the edges of a song graph. Each song of the smaller genre is looked up in the
+    rating order of the larger one and paired with the BRIDGE_PAIRS songs on either side of it
+    (a song can't be in one of the best pairs with a song further away), so finding the bridges
+    of an edge takes about min(size) * log(max(size)) steps.
+
+    The bridges of a genre (and the ids of its songs) are found the first time the genre is looked
+    up (or for every genre at once by build) and kept for every later lookup. Songs inserted after
+    that aren't bridged or sampled.
+
+    Instance attributes:
+        - genres: maps genre name to Genre, the genres of the graph the index is for
+    """
+    genres: dict[str, song_graph.Genre]
+    _pairs: dict[tuple[str, str], list[tuple[float, str, str]]]
+    _bridges: dict[str, dict[str, list[tuple[str, str, float]]]]
+    _ids: dict[str, tuple[str, ...]]
+
+    def __init__(self, genres: dict[str, song_graph.Genre]) -> None:
+        """
+        Initialize the index from a mapping of genre name to Genre
+        """
+        self.genres = genres
+        self._pairs = {}
+        self._bridges = {}
+        self._ids = {}
+
+    def pairs(self, genre_1: str, genre_2: str) -> list[tuple[float, str, str]]:
+        """
+        Return the bridges between genre_1 and genre_2 as (weight, id of the song of genre_1,
+        id of the song of genre_2), from lowest to highest weight
+        """
+        key = (genre_1, genre_2) if genre_1 < genre_2 else (genre_2, genre_1)
+        if key not in self._pairs:
+            small = self.genres[key[0]].song_graph.get_rating_order()
+            large = self.genres[key[1]].song_graph.get_rating_order()
+            flipped = len(small) > len(large)
+            if flipped:
+                small, large = large, small
+            candidates = []
+            for rating, song_id in small:
+                position = bisect.bisect_left(large, (rating,))
+                for other in range(max(position - BRIDGE_PAIRS, 0),
+                                   min(position + BRIDGE_PAIRS, len(large))):
+                    weight = abs(large[other][0] - rating)
+                    if flipped:
+                        candidates.append((weight, large[other][1], song_id))
+                    else:
+                        candidates.append((weight, song_id, large[other][1]))
+            self._pairs[key] = heapq.nsmallest(BRIDGE_PAIRS, candidates)
+
+        if key[0] == genre_1:
+            return self._pairs[key]
+        return [(weight, id_2, id_1) for weight, id_1, id_2 in self._pairs[key]]
+
+    def genre_bridges(self, genre: str) -> dict[str, list[tuple[str, str, float]]]:
+        """
+        Return the bridges from genre to the genres next to it, mapping the id of every bridged
+        song of genre to its bridges as (genre, id of the song bridged to, weight)
+        """
+        if genre not in self._bridges:
+            by_song = {}
+            for other_genre in self.genres[genre].neighbours:
+                for weight, song_id, other_id in self.pairs(genre, other_genre):
+                    by_song.setdefault(song_id, []).append((other_genre, other_id, weight))
+            self._bridges[genre] = by_song
+        return self._bridges[genre]
+
+    def bridges(self, song: song_graph.Song) -> list[tuple[str, str, float]]:
+        """
+        Return the bridges from song to the genres next to its genre, see genre_bridges
+        """
+        return self.genre_bridges(song.genre).get(song.information['id'], [])
+
+    def build(self) -> None:
+        """
+        Find the bridges of every genre now, rather than during the first searches
+        """
+        for genre in self.genres:
+            self.genre_bridges(genre)
+
+    def song_ids(self, genre: str) -> tuple[str, ...]:
+        """
+        Return the ids of the songs of genre, e.g. for picking one at random without copying
+        the songs of the genre into a list every time
+        """
+        if genre not in self._ids:
+            self._ids[genre] = tuple(self.genres[genre].song_graph.songs)
+        return self._ids[genre]
+
+
+# if __name__ == '__main__':
+#     import python_ta.contracts
+#     python_ta.contracts.check_all_contracts()
+#
+#     import doctest
+#     doctest.testmod()
+#
+#     import python_ta
+#     python_ta.check_all(config={
+#         'max-line-length': 100,
+#         'disable': ['E1136'],
+#         'extra-imports': ['bisect', 'heapq', 'song_graph'],
+#         'max-nested-blocks': 4
+#     })
@@ -0,0 +1,194 @@
+"""
+Incremental updates of a saved genre graph from a refreshed songs file.
+
+Rebuilding the graph with create_genre_graph takes minutes, even when a refresh of the songs file
+only adds or changes a few songs. Instead, the refreshed file is diffed against the graph by song
+id, and only the difference (a CatalogDelta) is applied:
+    - removed songs are taken out of their genre's song graph along with their edges
+    - added songs are given a genre and inserted into its song graph
+    - changed songs are removed and added again, since their genre and rating may have changed
+
+Genre edges only depend on the genres file, so they are left as they are.
+
+Every delta applied is appended to a log next to the saved graph. Loading the graph replays the log
+on top of it, so the (large) saved graph only has to be written again when the log is compacted.
+"""
+import datetime
+import json
+import os
+import time
+from typing import Any, Optional
+import song_graph
+
+
+class CatalogDelta:
+    """
+    The difference between the songs of a graph and a refreshed songs file.
+
+    Instance attributes:
+        - added: songs that aren't in the graph, with their genres set
+        - removed: ids of songs of the graph that aren't in the file anymore
+        - changed: songs whose properties or information changed, as they are in the file and
+          with their genres set
+    """
+    added: list[song_graph.Song]
+    removed: list[str]
+    changed: list[song_graph.Song]
+
+    def __init__(self, added: list[song_graph.Song], removed: list[str],
+                 changed: list[song_graph.Song]) -> None:
+        """Initialize the delta"""
+        self.added = added
+        self.removed = removed
+        self.changed = changed
+
+    def __len__(self) -> int:
+        """Return the number of songs the delta adds, removes or changes"""
+        return len(self.added) + len(self.removed) + len(self.changed)
+
+    def to_json(self) -> dict[str, Any]:
+        """Return the delta as a json object, see from_json"""
+        return {'added': [song_to_json(song) for song in self.added],
+                'removed': self.removed,
+                'changed': [song_to_json(song) for song in self.changed]}
+
+    @staticmethod
+    def from_json(record: dict[str, Any]) -> 'CatalogDelta':
+        """Return the delta to_json returned record for"""
+        return CatalogDelta([song_from_json(song) for song in record['added']],
+                            list(record['removed']),
+                            [song_from_json(song) for song in record['changed']])
+
+
+def song_to_json(song: song_graph.Song) -> dict[str, Any]:
+    """Return song (with its genre) as a json object"""
+    information = dict(song.information)
+    if 'release_date' in information:
+        information['release_date'] = information['release_date'].isoformat()
+    return {'name': song.name, 'genre': song.genre, 'properties': song.properties,
+            'information': information}
+
+
+def song_from_json(record: dict[str, Any]) -> song_graph.Song:
+    """Return the song song_to_json returned record for"""
+    information = dict(record['information'])
+    if 'release_date' in information:
+        information['release_date'] = datetime.datetime.fromisoformat(
+            information['release_date'])
+    song = song_graph.Song(record['properties'], information, record['name'])
+    song.genre = record['genre']
+    return song
+
+
+def delta_log_file(graph_file: str) -> str:
+    """Return the file the deltas applied to the graph saved at graph_file are logged to"""
+    return os.path.splitext(graph_file)[0] + '.delta.jsonl'
+
+
+def diff_catalog(graph: song_graph.GenreGraph, all_songs: dict, songs_file: str,
+                 artists_file: str, genres_file: str) -> CatalogDelta:
+    """
+    Return the difference between the songs of graph and the songs in songs_file. Added and
+    changed songs are given genres the way create_genre_graph does.
+
+    Preconditions:
+        - songs_file, artists_file and genres_file are formatted like the files create_genre_graph
+          takes
+        - all_songs maps the id of every song in graph to its genre
+    """
+    songs = song_graph.load_songs(songs_file)
+    removed = [song_id for song_id in all_songs if song_id not in songs]
+    added = []
+    changed = []
+    for song_id, song in songs.items():
+        if song_id not in all_songs:
+            added.append(song)
+        else:
+            old = graph.genres[all_songs[song_id]].song_graph.songs[song_id]
+            if old.properties != song.properties or old.information != song.information \
+                    or old.name != song.name:
+                changed.append(song)
+
+    if added != [] or changed != []:
+        genres_to_prop = song_graph.load_genres(genres_file)
+        artists_to_genre = song_graph.get_artist_genres(artists_file).local()
+        for song in added + changed:
+            song_graph.assign_genre(song, artists_to_genre, genres_to_prop)
+    return CatalogDelta(added, removed, changed)
+
+
+def apply_delta(graph: song_graph.GenreGraph, all_songs: dict, delta: CatalogDelta,
+                threshold: Optional[float] = None) -> None:
+    """
+    Apply delta to graph (and all_songs) in place. Songs are connected within threshold, by
+    default the threshold the song graph of their genre was made with (see
+    song_graph.budget_thresholds for why that differs between genres). Added songs whose genre
+    isn't in the graph are skipped.
+
+    Only the song graphs of the genres the delta touches are changed, so this takes time
+    proportional to the size of the delta rather than the size of the graph. graph must not be
+    in use by other threads, see graph_store.GraphStore for changing a graph that is.
+
+    Preconditions:
+        - threshold is not None or the song graphs were made by song_graph.create_song_graph
+    """
+    gone = {}
+    for song_id in delta.removed + [song.information['id'] for song in delta.changed]:
+        if song_id in all_songs:
+            gone.setdefault(all_songs.pop(song_id), []).append(song_id)
+    for genre, song_ids in gone.items():
+        songs = graph.genres[genre].song_graph.songs
+        if graph.dedup_index is not None:  # dropping songs from it is cheaper than a rebuild
+            for song_id in song_ids:
+                graph.dedup_index.remove(songs[song_id])
+        graph.genres[genre].song_graph.remove_songs(song_ids)
+    if gone != {}:
+        # The catalog, bridge and filter indexes can't drop songs, they are rebuilt when next
+        # needed
+        graph.catalog_index = None
+        graph.bridge_index = None
+        graph.filter_index = None
+
+    new = [song for song in delta.added + delta.changed
+           if song.genre in graph.genres and song.information['id'] not in all_songs]
+    graph.insert_songs(new, threshold)
+    for song in new:
+        all_songs[song.information['id']] = song.genre
+
+
+def append_to_log(log_file: str, delta: CatalogDelta) -> None:
+    """Append delta to the log at log_file"""
+    record = delta.to_json()
+    record['time'] = time.time()
+    with open(log_file, 'a') as log:
+        log.write(json.dumps(record) + '\n')
+
+
+def replay_log(log_file: str, graph: song_graph.GenreGraph, all_songs: dict) -> int:
+    """Apply every delta in the log at log_file to graph, in the order they were logged, and
+    return the number of deltas applied"""
+    if not os.path.exists(log_file):
+        return 0
+    applied = 0
+    with open(log_file) as log:
+        for line in log:
+            if line.strip() != '':
+                apply_delta(graph, all_songs, CatalogDelta.from_json(json.loads(line)))
+                applied += 1
+    return applied
+
+
+# if __name__ == '__main__':
+#     import python_ta.contracts
+#     python_ta.contracts.check_all_contracts()
+#
+#     import doctest
+#     doctest.testmod()
+#
+#     import python_ta
+#     python_ta.check_all(config={
+#         'max-line-length': 100,
+#         'disable': ['E1136'],
+#         'extra-imports': ['song_graph', 'datetime', 'json', 'os', 'time'],
+#         'max-nested-blocks': 4
+#     })
@@ -0,0 +1,261 @@
+"""
+Searching the songs already in a genre graph by name and artist, without going to spotify.
+"""
+from __future__ import annotations
+import bisect
+import copy
+import heapq
+import itertools
+import re
+import unicodedata
+from typing import Iterable, Optional
+import song_graph
+
+# The most songs CatalogIndex.search checks one by one before intersecting postings instead
+SCAN_LIMIT = 200
+
+
+def search_tokens(text: str) -> list[str]:
+    """
+    Return the words of text normalised for searching: lower case, without accents and with
+    apostrophes dropped (so "Don't" and "dont" are the same word)
+
+    >>> search_tokens("Beyoncé - Don't Stop (Remix)")
+    ['beyonce', 'dont', 'stop', 'remix']
+    """
+    text = text.casefold()
+    if not text.isascii():
+        text = unicodedata.normalize('NFKD', text)
+        text = ''.join(char for char in text if not unicodedata.combining(char))
+    return re.findall(r'\w+', text.replace("'", '').replace('’', ''))
+
+
+class CatalogIndex:
+    """
+    Inverted index over the names and artists of songs, used to search the songs that are
+    already in the graph without going to spotify.
+
+    Every word of a song's name (and of its artists' names) maps to the songs that have it. A
+    query matches the songs that have all of its words, the words of the query may be the start of
+    a word (e.g. 'deutsch' matches 'deutschland'), and matches are ranked by popularity.
+
+    The songs given when the index is built are numbered from most to least popular, so the
+    postings (lists of song numbers) are in order of popularity and a search can stop as soon as
+    it has found limit matches. Songs added later are numbered after them and are always checked.
+
+    A view of the index (see view) shares its songs and postings but only searches the songs that
+    were in it when the view was made, so songs can be added to a new view (with add_many) while
+    older ones are searched from other threads.
+
+    Instance attributes:
+        - songs: the indexed songs, songs[i] is song number i
+        - postings: maps 'name' and 'artist' to a mapping of word to the numbers of the songs with
+          that word in their name / the name of one of their artists, in increasing order
+        - vocabulary: every word in postings, sorted (for prefix lookups)
+        - size: the number of songs searches look at, songs[:size]. Songs after them were added
+          through a later view.
+
+    Representation invariants:
+        - self.vocabulary == sorted(set(self.postings['name']) | set(self.postings['artist']))
+        - all(posting == sorted(posting) for field in self.postings.values()
+              for posting in field.values())
+    """
+    songs: list[song_graph.Song]
+    postings: dict[str, dict[str, list[int]]]
+    vocabulary: list[str]
+    size: int
+    _tokens: dict[str, list[tuple[str, ...]]]
+    _rank: list[float]
+    _ranked: int
+
+    def __init__(self, songs: Iterable[song_graph.Song] = ()) -> None:
+        """
+        Initialize the index with the given songs
+        """
+        self.songs = []
+        self.postings = {'name': {}, 'artist': {}}
+        self._tokens = {'name': [], 'artist': []}
+        self._rank = []
+        for song in sorted(songs, key=lambda s: -float(s.information.get('popularity', 0))):
+            self._index(song)
+        self._ranked = len(self.songs)
+        self.size = len(self.songs)
+        self.vocabulary = sorted(set(self.postings['name']) | set(self.postings['artist']))
+
+    def _index(self, song: song_graph.Song) -> None:
+        """
+        Add song to the postings (but not to the vocabulary)
+        """
+        number = len(self.songs)
+        self.songs.append(song)
+        self._rank.append(-float(song.information.get('popularity', 0)))
+
+        tokens = {'name': tuple(dict.fromkeys(search_tokens(song.name))),
+                  'artist': tuple(dict.fromkeys(itertools.chain.from_iterable(
+                      search_tokens(artist) for artist in song.information['artists'])))}
+        for field in tokens:
+            self._tokens[field].append(tokens[field])
+            postings = self.postings[field]
+            for token in tokens[field]:
+                if token in postings:
+                    postings[token].append(number)
+                else:
+                    postings[token] = [number]
+
+    def add(self, song: song_graph.Song) -> None:
+        """
+        Add a song to the index
+
+        Preconditions:
+            - song is not already in the index
+        """
+        self._index(song)
+        self.size = len(self.songs)
+        for token in self._tokens['name'][-1] + self._tokens['artist'][-1]:
+            position = bisect.bisect_left(self.vocabulary, token)
+            if position == len(self.vocabulary) or self.vocabulary[position] != token:
+                self.vocabulary.insert(position, token)
+
+    def view(self) -> CatalogIndex:
+        """
+        Return a view of the index that searches the songs in it now, see the class docstring
+        """
+        view = copy.copy(self)
+        view.vocabulary = self.vocabulary
+        return view
+
+    def add_many(self, songs: Iterable[song_graph.Song]) -> None:
+        """
+        Add songs to the index without changing what earlier views of it find: the songs are
+        only counted in this view's size, and the vocabulary is replaced rather than changed
+
+        Preconditions:
+            - no song is already in the index
+            - no view of the index was made after this one
+        """
+        vocabulary = list(self.vocabulary)
+        for song in songs:
+            self._index(song)
+            for token in self._tokens['name'][-1] + self._tokens['artist'][-1]:
+                position = bisect.bisect_left(vocabulary, token)
+                if position == len(vocabulary) or vocabulary[position] != token:
+                    vocabulary.insert(position, token)
+        self.vocabulary = vocabulary
+        self.size = len(self.songs)
+
+    def expand(self, prefix: str) -> list[str]:
+        """
+        Return every indexed word starting with prefix. Single letters only match themselves,
+        so a query like 'a' doesn't turn into most of the vocabulary.
+        """
+        if len(prefix) < 2:
+            return [prefix]
+        words = []
+        position = bisect.bisect_left(self.vocabulary, prefix)
+        while position < len(self.vocabulary) and self.vocabulary[position].startswith(prefix):
+            words.append(self.vocabulary[position])
+            position += 1
+        return words
+
+    def search(self, song_name: str, artist: str = '', limit: int = 10) -> list[song_graph.Song]:
+        """
+        Return up to limit songs matching the query, most popular first.
+
+        Every word of song_name has to (start) a word of the song's name, and every word of
+        artist has to (start) a word of one of its artists. If artist is empty the words of
+        song_name may be in the name or the artists, like 'Deutschland Rammstein'.
+        """
+        name_fields = ('name',) if artist.strip() != '' else ('name', 'artist')
+        terms = [(token, name_fields) for token in search_tokens(song_name)]
+        terms.extend((token, ('artist',)) for token in search_tokens(artist))
+        if terms == []:
+            return []
+
+        # Only the songs of the rarest word are looked at, the other words are checked on each
+        postings = [[self.postings[field][word] for field in fields
+                     for word in self.expand(prefix) if word in self.postings[field]]
+                    for prefix, fields in terms]
+        rarest = min(range(len(terms)), key=lambda i: sum(len(p) for p in postings[i]))
+        others = terms[:rarest] + terms[rarest + 1:]
+
+        matches = self._scan(postings[rarest], others, limit)
+        if matches is None:  # few of the songs with the rarest word match, intersect instead
+            matches = self._intersect(terms, postings)
+
+        best = heapq.nsmallest(limit, matches, key=self._rank.__getitem__)
+        return [self.songs[number] for number in best]
+
+    def _intersect(self, terms: list[tuple[str, tuple[str, ...]]],
+                   postings: list[list[list[int]]]) -> set[int]:
+        """
+        Return every song that matches all terms, postings[i] are the postings of terms[i].
+        Once only a few songs are left they are checked one by one instead of going through the
+        postings of very common words.
+        """
+        order = sorted(range(len(terms)), key=lambda i: sum(len(p) for p in postings[i]))
+        matches = {number for number in itertools.chain.from_iterable(postings[order[0]])
+                   if number < self.size}
+        for i in order[1:]:
+            if len(matches) * 64 < sum(len(p) for p in postings[i]):
+                matches = {number for number in matches if self._matches(number, [terms[i]])}
+            else:
+                matches.intersection_update(itertools.chain.from_iterable(postings[i]))
+        return matches
+
+    def _scan(self, postings: list[list[int]], terms: list[tuple[str, tuple[str, ...]]],
+              limit: int) -> Optional[list[int]]:
+        """
+        Return the songs in postings that match terms: the first limit of them in order of
+        popularity, and every added song that does. Returns None instead if that needs more than
+        SCAN_LIMIT songs to be checked.
+        """
+        matches = []
+        previous = -1
+        for scanned, number in enumerate(heapq.merge(*postings)):
+            if number >= self._ranked or len(matches) == limit:
+                break
+            if scanned == SCAN_LIMIT:
+                return None
+            if number != previous and self._matches(number, terms):
+                matches.append(number)
+            previous = number
+
+        added = {number for posting in postings
+                 for number in posting[bisect.bisect_left(posting, self._ranked):
+                                       bisect.bisect_left(posting, self.size)]}
+        matches.extend(number for number in added if self._matches(number, terms))
+        return matches
+
+    def _matches(self, number: int, terms: list[tuple[str, tuple[str, ...]]]) -> bool:
+        """
+        Return whether song number has a word starting with prefix in one of the fields, for every
+        prefix, fields in terms (a single letter prefix has to be the whole word, like in expand)
+        """
+        for prefix, fields in terms:
+            found = False
+            for field in fields:
+                tokens = self._tokens[field][number]
+                if prefix in tokens or (len(prefix) > 1
+                                        and any(token.startswith(prefix) for token in tokens)):
+                    found = True
+                    break
+            if not found:
+                return False
+        return True
+
+
+# if __name__ == '__main__':
+#     import python_ta.contracts
+#     python_ta.contracts.check_all_contracts()
+#
+#     import doctest
+#     doctest.testmod()
+#
+#     import python_ta
+#     python_ta.check_all(config={
+#         'max-line-length': 100,
+#         'disable': ['E1136'],
+#         'extra-imports': ['bisect', 'copy', 'heapq', 'itertools', 're', 'unicodedata',
+#                           'song_graph'],
+#         'max-nested-blocks': 4
+#     })
@@ -0,0 +1,525 @@
+"""
+Command line entry point for Dotify. Runs without the GUI or any interactive prompts, so it can be
+used from scripts and batch jobs.
+
+Examples:
+    python cli.py build --threshold 0.05
+    python cli.py update --songs Data/data.csv
+    python cli.py calibrate --thresholds 0.01 0.05 0.1 --edge-budget 50000000
+    python cli.py build --threshold 0.1 --memory-limit 4096
+    python cli.py build --threshold 0.05 --max-degree 32
+    python cli.py recommend --seeds seeds.txt --mode 'level gen' --out playlist.csv
+    python cli.py recommend --seeds seeds.txt --no-explicit --years 1990-2005 --time-limit 2
+    python cli.py stats
+    python cli.py bench --synthetic
+    python cli.py --spotify record search 'Deutschland' --artist Rammstein
+    python cli.py --spotify replay search 'Deutschland' --artist Rammstein
+    python cli.py serve --port 8000
+    python cli.py gui
+"""
+import argparse
+import csv
+import gc
+import os
+import sys
+import time
+from typing import Optional, TextIO, Tuple
+import catalog_delta
+import computations
+import graph_io
+import song_filters
+import song_graph
+
+BENCH_SUITES = ['modes', 'imports', 'service', 'spotify', 'playlist', 'write', 'search',
+                'catalog', 'store', 'insert', 'sparsify', 'pagerank', 'filters', 'budget',
+                'retries', 'delta', 'transport']
+
+
+def get_graph(args: argparse.Namespace) -> Tuple[song_graph.GenreGraph, dict]:
+    """
+    Return the genre graph to work with. If a threshold was given the graph is built from the data
+    files, otherwise the saved graph (see the build command) is loaded with the updates logged
+    since it was saved (see the update command).
+
+    The graph is kept until the process exits, so it is frozen out of the garbage collector's
+    generations (gc.freeze). Otherwise every full collection walks its millions of objects, which
+    can stall a playlist generation for hundreds of milliseconds past its time budget.
+    """
+    if args.threshold is not None:
+        graph, all_songs = song_graph.create_genre_graph(args.songs, args.artists, args.genres,
+                                                         args.threshold)
+    elif not os.path.exists(args.graph):
+        sys.exit('No saved graph at ' + args.graph + ', run build or pass --threshold')
+    else:
+        graph, all_songs = graph_io.load_graph(args.graph)
+        catalog_delta.replay_log(catalog_delta.delta_log_file(args.graph), graph, all_songs)
+    gc.freeze()
+    return graph, all_songs
+
+
+def get_graph_if_saved(args: argparse.Namespace) -> Tuple[song_graph.GenreGraph, dict]:
+    """Return the genre graph like get_graph, or an empty graph if there is no saved graph"""
+    if args.threshold is None and not os.path.exists(args.graph):
+        return song_graph.GenreGraph(), {}
+    return get_graph(args)
+
+
+def read_seeds(seed_file: str, graph: song_graph.GenreGraph, all_songs: dict,
+               genre_file: str = song_graph.GENRE_DATA) -> list[song_graph.Song]:
+    """
+    Return the seed songs listed in seed_file.
+
+    seed_file either has one Spotify track id (or track uri / url) per line, or is a csv file
+    formatted like song_graph.SONG_DATA. Ids that aren't in the graph are skipped, csv rows that
+    aren't in the graph are given their most likely genre (of the genres in genre_file).
+    """
+    with open(seed_file, encoding="ISO-8859-1") as seed_data:
+        first_line = seed_data.readline()
+
+    if 'id' in next(csv.reader([first_line]), []):
+        seeds = []
+        genres_to_prop = song_graph.load_genres(genre_file)
+        for song_id, song in song_graph.load_songs(seed_file).items():
+            if song_id in all_songs:
+                seeds.append(graph.genres[all_songs[song_id]].song_graph.songs[song_id])
+            else:
+                song_graph.song_to_genre(song, song_graph.GENRES, genres_to_prop)
+                seeds.append(song)
+        return seeds
+
+    seeds = []
+    with open(seed_file) as seed_data:
+        for line in seed_data:
+            song_id = line.strip().split('?')[0].split('/')[-1].split(':')[-1]
+            if song_id == '':
+                continue
+            elif song_id in all_songs:
+                seeds.append(graph.genres[all_songs[song_id]].song_graph.songs[song_id])
+            else:
+                print('Skipping ' + song_id + ', it is not in the graph', file=sys.stderr)
+    return seeds
+
+
+def write_playlist(songs: list[song_graph.Song], out: TextIO) -> None:
+    """Write songs to out as csv rows of id, name and artists"""
+    writer = csv.writer(out)
+    writer.writerow(['id', 'name', 'artists'])
+    for song in songs:
+        writer.writerow([song.information['id'], song.name,
+                         ', '.join(song.information['artists'])])
+
+
+def get_preferences(args: argparse.Namespace) -> dict:
+    """Return the preferences given on the command line, formatted like DEFAULT_PREFERENCES"""
+    preferences = dict(computations.DEFAULT_PREFERENCES)
+    preferences['gen_mode'] = args.mode
+    preferences['bias'] = args.bias
+    for pref in args.pref:
+        key, _, value = pref.partition('=')
+        if key not in preferences or list(preferences).index(key) > 5:
+            sys.exit('Unknown preference ' + key)
+        preferences[key] = int(value)
+    return preferences
+
+
+def get_song_filter(args: argparse.Namespace) -> song_filters.SongFilter:
+    """Return the filter on the songs of the playlist given on the command line"""
+    years = None
+    if args.years is not None:
+        first, _, last = args.years.partition('-')
+        if not first.isdigit() or not (last or first).isdigit():
+            sys.exit('--years must be a year or a range of years like 1990-2005')
+        years = (int(first), int(last or first))
+    modes = None if args.song_mode is None else [{'minor': 0, 'major': 1}[args.song_mode]]
+    return song_filters.SongFilter(not args.no_explicit, modes, args.keys, years,
+                                   args.min_popularity)
+
+
+def get_edge_budget(args: argparse.Namespace) -> Optional[int]:
+    """Return the most song edges the graph may have, going by --edge-budget and --memory-limit"""
+    budgets = []
+    if args.edge_budget is not None:
+        budgets.append(args.edge_budget)
+    if args.memory_limit is not None:
+        budgets.append(int(args.memory_limit * 2 ** 20) // song_graph.EDGE_BYTES)
+    return min(budgets, default=None)
+
+
+def build(args: argparse.Namespace) -> None:
+    """Build the graph from the data files and save it"""
+    graph, all_songs = song_graph.create_genre_graph(args.songs, args.artists, args.genres,
+                                                     args.threshold, get_edge_budget(args))
+    if args.max_degree is not None:
+        import sparsify
+        edges = sparsify.sparsify_graph(graph, args.max_degree)
+        removed = sum(old - new for old, new in edges.values())
+        print('Removed ' + str(removed) + ' of ' + str(sum(old for old, _ in edges.values()))
+              + ' song edges (about ' + str(removed * song_graph.EDGE_BYTES // 2 ** 20)
+              + ' MB)', file=sys.stderr)
+    graph_io.save_graph(args.graph, graph, all_songs)
+    log_file = catalog_delta.delta_log_file(args.graph)
+    if os.path.exists(log_file):  # the updates it logged are in the new graph
+        os.remove(log_file)
+    print('Saved graph to ' + args.graph, file=sys.stderr)
+
+
+def calibrate(args: argparse.Namespace) -> None:
+    """Print how many song edges (and how much memory) the graph would have with each threshold,
+    and the thresholds an edge budget would give each genre, without making any edges"""
+    if args.synthetic:
+        import benchmarks
+        graph, _ = benchmarks.synthetic_graph(args.num_genres, args.songs_per_genre, 0.0)
+        g_to_songs = {genre.name: list(genre.song_graph.songs.values())
+                      for genre in graph.genres.values()}
+    else:
+        g_to_songs, _ = song_graph.genres_to_songs(args.songs, args.artists, args.genres)
+    ratings = {genre: sorted(song_graph.get_song_rating(song) for song in songs)
+               for genre, songs in g_to_songs.items()}
+
+    print('threshold    song edges    memory (MB)  densest genre')
+    for threshold in args.thresholds:
+        edges = {genre: song_graph.count_edges(ratings[genre], threshold) for genre in ratings}
+        densest = max(edges, key=edges.get)
+        print(format(threshold, '<12g') + ' ' + format(sum(edges.values()), '>10') + ' '
+              + format(sum(edges.values()) * song_graph.EDGE_BYTES / 2 ** 20, '>14.1f') + '  '
+              + densest + ' (' + str(edges[densest]) + ')')
+
+    edge_budget = get_edge_budget(args)
+    if edge_budget is not None:
+        thresholds = song_graph.budget_thresholds(ratings, edge_budget, max(args.thresholds))
+        edges = {genre: song_graph.count_edges(ratings[genre], thresholds[genre])
+                 for genre in ratings}
+        print('with a budget of ' + str(edge_budget) + ' edges: ' + str(sum(edges.values()))
+              + ' edges, the most lowered thresholds are:')
+        for genre in sorted(thresholds, key=thresholds.get)[:10]:
+            print('    ' + genre + ': ' + format(thresholds[genre], 'g') + ' (' + str(edges[genre])
+                  + ' edges for ' + str(len(ratings[genre])) + ' songs)')
+
+
+def update(args: argparse.Namespace) -> None:
+    """Update the saved graph with the songs added, removed or changed in the songs file since it
+    was built. The update is logged rather than saving the whole graph again, unless --compact is
+    given."""
+    graph, all_songs = get_graph(args)
+    start = time.perf_counter()
+    delta = catalog_delta.diff_catalog(graph, all_songs, args.songs, args.artists, args.genres)
+    diffed = time.perf_counter()
+    catalog_delta.apply_delta(graph, all_songs, delta)
+    applied = time.perf_counter()
+    print(str(len(delta.added)) + ' added, ' + str(len(delta.removed)) + ' removed, '
+          + str(len(delta.changed)) + ' changed (diff ' + format(diffed - start, '.2f')
+          + ' s, apply ' + format(applied - diffed, '.2f') + ' s)', file=sys.stderr)
+
+    log_file = catalog_delta.delta_log_file(args.graph)
+    if args.compact:
+        graph_io.save_graph(args.graph, graph, all_songs)
+        if os.path.exists(log_file):
+            os.remove(log_file)
+        print('Saved graph to ' + args.graph, file=sys.stderr)
+    elif len(delta) > 0:
+        catalog_delta.append_to_log(log_file, delta)
+        print('Logged update to ' + log_file, file=sys.stderr)
+
+
+def recommend(args: argparse.Namespace) -> None:
+    """Generate a playlist from the seed songs and write it out"""
+    graph, all_songs = get_graph(args)
+    seeds = read_seeds(args.seeds, graph, all_songs, args.genres)
+    budget = computations.Budget(args.time_limit, args.max_expansions)
+    playlist = computations.recommend(graph, all_songs, seeds, get_preferences(args),
+                                      get_song_filter(args), budget)
+    if budget.truncated:
+        print('Ran out of budget after ' + str(budget.expansions)
+              + ' expansions, the playlist has the songs found by then', file=sys.stderr)
+    if args.out == '-':
+        write_playlist(playlist, sys.stdout)
+    else:
+        with open(args.out, 'w', newline='') as out:
+            write_playlist(playlist, out)
+
+
+def stats(args: argparse.Namespace) -> None:
+    """Print the size of the graph"""
+    graph, all_songs = get_graph(args)
+    genre_edges = sum(len(genre.neighbours) for genre in graph.genres.values()) // 2
+    song_edges = 0
+    max_degree = 0
+    for genre in graph.genres.values():
+        for song in genre.song_graph.songs.values():
+            song_edges += song.get_degree()
+            max_degree = max(max_degree, song.get_degree())
+    song_edges //= 2
+
+    print('genres:       ' + str(len(graph.genres)))
+    print('genre edges:  ' + str(genre_edges))
+    print('songs:        ' + str(len(all_songs)))
+    print('song edges:   ' + str(song_edges))
+    print('max degree:   ' + str(max_degree))
+    print('largest genres:')
+    largest = sorted(graph.genres.values(), key=lambda g: len(g.song_graph.songs), reverse=True)
+    for genre in largest[:10]:
+        print('    ' + genre.name + ': ' + str(len(genre.song_graph.songs)))
+
+
+def bench(args: argparse.Namespace) -> None:
+    """Run the benchmarks"""
+    import benchmarks
+    if args.suite == 'imports':
+        benchmarks.bench_imports(runs=args.runs)
+        return
+    elif args.suite == 'spotify':
+        benchmarks.bench_spotify()
+        return
+    elif args.suite == 'playlist':
+        benchmarks.bench_playlist()
+        return
+    elif args.suite == 'retries':
+        benchmarks.bench_retries()
+        return
+    elif args.suite == 'transport':
+        benchmarks.bench_transport()
+        return
+    elif args.suite == 'write':
+        benchmarks.bench_write()
+        return
+    elif args.suite == 'search':
+        benchmarks.bench_search()
+        return
+
+    if args.synthetic:
+        graph, all_songs = benchmarks.synthetic_graph(args.num_genres, args.songs_per_genre,
+                                                      args.threshold or 0.05)
+        gc.freeze()  # like get_graph does
+    else:
+        graph, all_songs = get_graph(args)
+    if args.suite == 'service':
+        benchmarks.bench_service(graph, all_songs)
+    elif args.suite == 'catalog':
+        benchmarks.bench_catalog(graph)
+    elif args.suite == 'delta':
+        benchmarks.bench_delta(graph, all_songs)
+    elif args.suite == 'store':
+        benchmarks.bench_store(graph, all_songs)
+    elif args.suite == 'insert':
+        benchmarks.bench_insert(graph, all_songs)
+    elif args.suite == 'pagerank':
+        benchmarks.bench_page_rank(graph, all_songs, runs=args.runs)
+    elif args.suite == 'filters':
+        benchmarks.bench_filters(graph, all_songs, runs=args.runs)
+    elif args.suite == 'budget':
+        benchmarks.bench_budget(graph, all_songs, runs=args.runs)
+    elif args.suite == 'sparsify':
+        benchmarks.bench_sparsify(graph, all_songs, args.max_degree or 32, runs=args.runs)
+    else:
+        benchmarks.bench_modes(graph, all_songs, runs=args.runs)
+
+
+def serve(args: argparse.Namespace) -> None:
+    """Serve recommendations over HTTP until interrupted"""
+    import asyncio
+    import logging
+    import service
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    graph, all_songs = get_graph(args)
+    rec_service = service.RecommendationService(graph, all_songs, args.max_concurrent,
+                                                slo=service.DEFAULT_SLO if args.slo is None
+                                                else args.slo)
+    try:
+        asyncio.run(service.serve_forever(rec_service, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+def gui(args: argparse.Namespace) -> None:
+    """Start the GUI on the graph"""
+    import main
+    graph, all_songs = get_graph(args)
+    if args.slo is not None:
+        main.PLAYLIST_SLO = args.slo
+    main.open_tk(graph, all_songs)
+
+
+def search(args: argparse.Namespace) -> None:
+    """Search for a song and print the results. Like the GUI, the songs in the graph are searched
+    first and spotify only if none of them match (or if --remote is given)."""
+    graph, all_songs = get_graph_if_saved(args)
+    start = time.perf_counter()
+    songs = [] if args.remote else graph.get_catalog_index().search(args.query, args.artist)
+    if songs == []:
+        import spotify_methods
+        results = spotify_methods.find_track_options(args.query, graph, all_songs, args.artist,
+                                                     prefetch_top=False)
+        songs = [song for song in (result.to_vertex(graph, all_songs) for result in results)
+                 if song is not None]
+    took = time.perf_counter() - start
+    write_playlist(songs, sys.stdout)
+    print('took ' + format(took * 1000, '.1f') + ' ms', file=sys.stderr)
+
+
+def pull(args: argparse.Namespace) -> None:
+    """Print the songs of one of the user's spotify playlists"""
+    import spotify_methods
+    graph, all_songs = get_graph_if_saved(args)
+    start = time.perf_counter()
+    songs = spotify_methods.pull_playlist(args.name, graph, all_songs)
+    took = time.perf_counter() - start
+    write_playlist(songs, sys.stdout)
+    print('took ' + format(took * 1000, '.1f') + ' ms', file=sys.stderr)
+
+
+def add_budget_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add the arguments limiting the size of the graph to parser"""
+    parser.add_argument('--edge-budget', type=int, default=None,
+                        help='most song edges, dense genres get smaller thresholds to fit')
+    parser.add_argument('--memory-limit', type=float, default=None, metavar='MB',
+                        help='most memory the song edges may take, like --edge-budget')
+
+
+def get_parser() -> argparse.ArgumentParser:
+    """Return the argument parser for the command line"""
+    parser = argparse.ArgumentParser(prog='dotify', description='Dotify music recommendations')
+    parser.add_argument('--graph', default=song_graph.GRAPH_DATA,
+                        help='saved graph to use (default: %(default)s)')
+    parser.add_argument('--threshold', type=float, default=None,
+                        help='build the graph with this threshold instead of loading it')
+    parser.add_argument('--songs', default=song_graph.SONG_DATA)
+    parser.add_argument('--artists', default=song_graph.ARTIST_DATA_W_GENRES)
+    parser.add_argument('--genres', default=song_graph.GENRE_DATA)
+    parser.add_argument('--spotify', default=None, choices=['live', 'record', 'replay'],
+                        help='use spotify, record requests to the cassette, or replay them from '
+                             'it without the network')
+    parser.add_argument('--cassette', default=None,
+                        help='file requests are recorded to / replayed from')
+    parser.add_argument('--replay-latency', default=None,
+                        help="seconds every replayed request takes, or 'recorded' (default)")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = commands.add_parser('build', help='build the graph and save it')
+    add_budget_arguments(build_parser)
+    build_parser.add_argument('--max-degree', type=int, default=None,
+                              help='keep at most this many of the strongest edges of every song, '
+                                   'see sparsify.py')
+    build_parser.set_defaults(function=build)
+
+    calibrate_parser = commands.add_parser(
+        'calibrate', help='predict the size of the graph for thresholds without building it')
+    calibrate_parser.add_argument('--thresholds', type=float, nargs='+',
+                                  default=[0.001, 0.005, 0.01, 0.05, 0.1])
+    calibrate_parser.add_argument('--synthetic', action='store_true',
+                                  help='calibrate random songs instead of the data files')
+    calibrate_parser.add_argument('--num-genres', type=int, default=50)
+    calibrate_parser.add_argument('--songs-per-genre', type=int, default=500)
+    add_budget_arguments(calibrate_parser)
+    calibrate_parser.set_defaults(function=calibrate)
+
+    update_parser = commands.add_parser('update',
+                                        help='update the saved graph from a refreshed songs file')
+    update_parser.add_argument('--compact', action='store_true',
+                               help='save the updated graph instead of logging the update')
+    update_parser.set_defaults(function=update)
+
+    rec_parser = commands.add_parser('recommend', help='generate a playlist from seed songs')
+    rec_parser.add_argument('--seeds', required=True,
+                            help='file of Spotify track ids or csv rows of songs')
+    rec_parser.add_argument('--mode', default='level gen', choices=computations.GEN_MODES)
+    rec_parser.add_argument('--bias', type=float, default=0,
+                            help='bias towards new genres (new genre mode only), 0 to 1')
+    rec_parser.add_argument('--pref', action='append', default=[], metavar='KEY=VALUE',
+                            help='preference weight from 0 to 100, e.g. energy=80')
+    rec_parser.add_argument('--no-explicit', action='store_true', help='leave out explicit songs')
+    rec_parser.add_argument('--years', metavar='FIRST-LAST',
+                            help='only songs released in these years, e.g. 1990-2005')
+    rec_parser.add_argument('--min-popularity', type=float,
+                            help='only songs at least this popular, 0 to 100')
+    rec_parser.add_argument('--song-mode', choices=['major', 'minor'],
+                            help='only songs in major (or minor) mode')
+    rec_parser.add_argument('--keys', type=int, nargs='+', choices=range(12), metavar='KEY',
+                            help='only songs in these keys, 0 (C) to 11 (B)')
+    rec_parser.add_argument('--time-limit', type=float, metavar='SECONDS',
+                            help='return the best playlist found after this long')
+    rec_parser.add_argument('--max-expansions', type=int,
+                            help='return the best playlist found after expanding this many songs')
+    rec_parser.add_argument('--out', default='-', help='output file (default: stdout)')
+    rec_parser.set_defaults(function=recommend)
+
+    stats_parser = commands.add_parser('stats', help='print the size of the graph')
+    stats_parser.set_defaults(function=stats)
+
+    bench_parser = commands.add_parser('bench', help='run the benchmarks')
+    bench_parser.add_argument('suite', nargs='?', default='modes', choices=BENCH_SUITES)
+    bench_parser.add_argument('--synthetic', action='store_true',
+                              help='benchmark a random graph instead of the real one')
+    bench_parser.add_argument('--num-genres', type=int, default=50)
+    bench_parser.add_argument('--songs-per-genre', type=int, default=500)
+    bench_parser.add_argument('--runs', type=int, default=5)
+    bench_parser.add_argument('--max-degree', type=int, default=None,
+                              help='degree the sparsify suite caps the graph to (default 32)')
+    bench_parser.set_defaults(function=bench)
+
+    search_parser = commands.add_parser('search', help='search the graph, then spotify, for a song')
+    search_parser.add_argument('query')
+    search_parser.add_argument('--artist', default='')
+    search_parser.add_argument('--remote', action='store_true',
+                               help="search spotify even if songs in the graph match")
+    search_parser.set_defaults(function=search)
+
+    pull_parser = commands.add_parser('pull', help="print one of the user's spotify playlists")
+    pull_parser.add_argument('name')
+    pull_parser.set_defaults(function=pull)
+
+    serve_parser = commands.add_parser('serve', help='serve recommendations over HTTP')
+    serve_parser.add_argument('--host', default='127.0.0.1')
+    serve_parser.add_argument('--port', type=int, default=8000)
+    serve_parser.add_argument('--max-concurrent', type=int, default=4,
+                              help='playlists generated at the same time')
+    serve_parser.add_argument('--slo', type=float,
+                              help='seconds a playlist may take, after that the best one found '
+                                   'so far is sent (default: service.DEFAULT_SLO)')
+    serve_parser.set_defaults(function=serve)
+
+    gui_parser = commands.add_parser('gui', help='start the GUI')
+    gui_parser.add_argument('--slo', type=float,
+                            help='seconds a playlist may take, after that the best one found so '
+                                 'far is used')
+    gui_parser.set_defaults(function=gui)
+
+    return parser
+
+
+def run(argv: Optional[list[str]] = None) -> None:
+    """Run the command line with the given arguments (sys.argv by default)"""
+    args = get_parser().parse_args(argv)
+    if args.command == 'build' and args.threshold is None:
+        sys.exit('build needs --threshold')
+    if args.command == 'update' and args.threshold is not None:
+        sys.exit('update works on the saved graph, it takes no --threshold')
+    if args.spotify is not None or args.cassette is not None or args.replay_latency is not None:
+        import spotify_methods
+        spotify_methods.configure_transport(args.spotify or spotify_methods.TRANSPORT,
+                                            args.cassette, args.replay_latency)
+    args.function(args)
+
+
+if __name__ == '__main__':
+    run()
+
+
+# if __name__ == '__main__':
+#     import python_ta.contracts
+#     python_ta.contracts.check_all_contracts()
+#
+#     import doctest
+#     doctest.testmod()
+#
+#     import python_ta
+#     python_ta.check_all(config={
+#         'max-line-length': 100,
+#         'disable': ['E1136'],
+#         'extra-imports': ['song_graph', 'computations', 'argparse', 'csv', 'os', 'sys',
+#                           'benchmarks', 'main', 'service', 'asyncio', 'logging', 'time',
+#                           'spotify_methods', 'catalog_delta', 'sparsify', 'gc',
+#                           'graph_io', 'song_filters'],
+#         'max-nested-blocks': 4,
+#         'allowed-io': ['build', 'recommend', 'stats', 'read_seeds', 'write_playlist', 'run',
+#                        'search', 'pull', 'update', 'calibrate']
+#     })
@@ -3,13 +3,135 @@ import collections
 import math
 import random
 import datetime
+import itertools
+import time
 from typing import Union, Optional
+import genre_distances
+import overlays
+import random_walks
+import song_filters
 import song_graph
 
 WEIGHTS = {'acousticness': 1, 'danceability': 1, 'energy': 1, 'instrumentalness': 1, 'key': 1 / 9,
            'mode': 1, 'liveness': 1, 'loudness': 1 / 59, 'speechiness': 1, 'tempo': 1 / 145,
            'valence': 1}
 
+# Generation modes, see recommend
+GEN_MODES = ['level gen', 'custom gen', 'artist pref', 'new genre', 'unique songs',
+             'recent songs', 'page rank']
+
+# Personalized page rank (see page_rank_gen): the chance a walk carries on rather than restarting,
+# how much the preferences weigh in the ranking of the songs, and when to stop
+DAMPING = 0.75
+PRIOR_MIX = 0.5
+TOLERANCE = 1e-4
+MAX_ITERATIONS = 30
+# Walks started from each input song when a genre is ranked by walking it (see walk_rank)
+WALKS = 200
+
+# Most times find_uniquely_connected and get_new_songs shuffle the input songs looking for more
+# songs, so they stop when a filter (or a small graph) leaves fewer than they want
+MAX_SHUFFLES = 50
+
+# The first six keys are the preference sliders (see par_rating), order matters
+DEFAULT_PREFERENCES = {'acousticness': 0,
+                       'danceability': 0,
+                       'energy': 0,
+                       'instrumentalness': 0,
+                       'key': 0,
+                       'liveness': 0,
+                       'gen_mode': 'new genre',
+                       'bias': 0}
+
+
+class Budget:
+    """
+    Limits on the work generating one playlist may do: a time limit, and a limit on the number of
+    songs expanded (songs whose neighbours are looked at, songs scored, or rows of a page rank
+    iteration). The generators call spend as they go, and once it returns False they stop and
+    return the best playlist they have found so far. truncated tells the caller whether that
+    happened.
+
+    Instance attributes:
+        - deadline: the time.perf_counter() time to stop at, None for no time limit
+        - max_expansions: the most songs that may be expanded, None for no limit
+        - expansions: the number of songs expanded so far
+        - truncated: whether the generation ran out of budget
+    """
+    deadline: Optional[float]
+    max_expansions: Optional[int]
+    expansions: int
+    truncated: bool
+
+    def __init__(self, seconds: Optional[float] = None,
+                 max_expansions: Optional[int] = None) -> None:
+        """Initialize the budget, the time limit of seconds starts now"""
+        self.deadline = None if seconds is None else time.perf_counter() + seconds
+        self.max_expansions = max_expansions
+        self.expansions = 0
+        self.truncated = False
+
+    def spend(self, expansions: int = 1) -> bool:
+        """Count expansions more songs expanded and return whether the generation may go on"""
+        if not self.truncated:
+            self.expansions += expansions
+            self.truncated = (self.max_expansions is not None
+                              and self.expansions > self.max_expansions) \
+                or (self.deadline is not None and time.perf_counter() > self.deadline)
+        return not self.truncated
+
+    def can_spend(self, expansions: int) -> bool:
+        """Return whether expansions more songs can be expanded without running out of budget"""
+        return not self.truncated and (self.deadline is None
+                                       or time.perf_counter() <= self.deadline) \
+            and (self.max_expansions is None
+                 or self.expansions + expansions <= self.max_expansions)
+
+
+def recommend(graph: song_graph.GenreGraph, all_songs: dict, playlist: list[song_graph.Song],
+              preferences: dict, song_filter: Optional[song_filters.SongFilter] = None,
+              budget: Optional[Budget] = None) -> list[song_graph.Song]:
+    """Return new songs for playlist using the generation mode in preferences['gen_mode'], only
+    songs song_filter allows if it is given. If budget runs out the best songs found by then are
+    returned, and budget.truncated is set.
+
+    The songs in playlist MAY already have a vertex in the graph or may not. Songs that aren't in
+    the graph yet are inserted into an overlay of the graph (see overlays.OverlayGraph) so the
+    search methods can start from them. Neither graph nor all_songs is changed, so recommend can
+    be called from several threads at once.
+
+    Preconditions:
+        - preferences is formatted like DEFAULT_PREFERENCES
+    """
+    overlay = overlays.OverlayGraph(graph, all_songs)
+    unseen = {song.information['id']: song for song in playlist
+              if song.information['id'] not in all_songs}
+    overlay.insert_songs(list(unseen.values()))
+    song_verts = [overlay.get_song(song) for song in playlist]
+
+    if song_verts == []:
+        return []
+    elif preferences['gen_mode'] == 'level gen':
+        return bfs_gen(overlay, song_verts, 2, song_filter, budget)
+    elif preferences['gen_mode'] == 'custom gen':
+        return par_gen(overlay, song_verts, 2, preferences, song_filter, budget)
+    elif preferences['gen_mode'] == 'artist pref':
+        return artist_gen(overlay, song_verts, song_filter, budget)
+    elif preferences['gen_mode'] == 'new genre':
+        if preferences['bias'] is not None:
+            return explore_new_genres(overlay, song_verts, preferences['bias'], preferences,
+                                      song_filter, budget)
+        return []
+    elif preferences['gen_mode'] == 'unique songs':
+        return find_uniquely_connected(overlay, song_verts, preferences, song_filter, budget)
+    elif preferences['gen_mode'] == 'recent songs':
+        return get_new_songs(overlay, song_verts, song_filter, budget)
+    elif preferences['gen_mode'] == 'page rank':
+        return page_rank_gen(overlay, song_verts, preferences, song_filter=song_filter,
+                             budget=budget)
+    else:
+        return []
+
 
 def par_rating(song: song_graph.Song, weights: dict) -> float:
     """Based on user preferences, this function returns a weighted score on a song for the user"""
@@ -31,8 +153,25 @@ def sim_par_rating(song: song_graph.Song, other_id: str, pref_weights: dict) ->
     return ret_score
 
 
+def neighbours_of(graph: song_graph.GenreGraph, song: song_graph.Song,
+                  allowed: Optional[song_filters.SongMatcher] = None) \
+        -> list[tuple[song_graph.Song, float]]:
+    """Return the neighbours of song with the weights of the edges to them: the songs of its genre
+    it is connected to and the songs of neighbouring genres it is bridged to (see
+    bridges.BridgeIndex). Only the ones allowed allows are returned if it is given."""
+    songs = graph.genres[song.genre].song_graph.songs
+    neighbours = [(songs[song_id], weight) for song_id, weight in song.neighbours.items()]
+    for genre, song_id, weight in graph.get_bridge_index().bridges(song):
+        neighbours.append((graph.genres[genre].song_graph.songs[song_id], weight))
+    if allowed is not None and allowed.song_filter is not None:
+        neighbours = [(neighbour, weight) for neighbour, weight in neighbours
+                      if allowed.allows(neighbour)]
+    return neighbours
+
+
 def bfs_gen(graph: song_graph.GenreGraph, song_list: list[song_graph.Song],
-            n: int) -> list[song_graph.Song]:
+            n: int, song_filter: Optional[song_filters.SongFilter] = None,
+            budget: Optional[Budget] = None) -> list[song_graph.Song]:
     """This function uses a level-based generation technique to generate songs.
 
     The algorithm does the following PER base_song in song_list:
@@ -43,176 +182,353 @@ def bfs_gen(graph: song_graph.GenreGraph, song_list: list[song_graph.Song],
         3) repeat until song_per is reached (new songs needed per base_song)
 
     This is similar to breadth first search, in the manner that it goes down one level at a time
-    rather then recursively down one pathway (hence the name bfs)"""
-    visited = set.union({song.name for song in song_list},
-                        {song.information['id'] for song in song_list})
+    rather then recursively down one pathway (hence the name bfs)
+
+    Songs song_filter doesn't allow are never queued, so the search only goes through the songs
+    it allows. Every song popped off the queue is an expansion of budget. Songs of the same
+    recording (see dedup.DedupIndex) are only visited once."""
+    allowed = graph.get_filter_index().matcher(song_filter)
+    budget = budget or Budget()
+    visited = {song.group for song in song_list}
     ret = []
     for base_song in song_list:
         songs_so_far = 0
         q = collections.deque()
         q.append(base_song)
-        sg = graph.genres[base_song.genre].song_graph
-        while len(q) > 0:
+        while len(q) > 0 and budget.spend():
             popped = q.popleft()
-            if songs_so_far < n and popped.name not in visited \
-                    and popped.information['id'] not in visited:
+            if songs_so_far < n and popped.group not in visited:
                 ret.append(popped)
                 songs_so_far += 1
-            visited.add(popped.name)
-            visited.add(popped.information['id'])
+            visited.add(popped.group)
             nodes_to_add = []
-            for thing in popped.neighbours:
-                if sg.songs[thing].name and thing not in visited:
-                    nodes_to_add.append((sg.songs[thing], popped.neighbours[thing]))
+            for neighbour, weight in neighbours_of(graph, popped, allowed):
+                if neighbour.group not in visited:
+                    nodes_to_add.append((neighbour, weight))
             nodes_to_add = list(sorted(nodes_to_add, key=lambda x: x[1]))
             for el in nodes_to_add:
                 q.append(el[0])
 
             if songs_so_far >= n:
                 break
+        if budget.truncated:
+            break
 
     return ret
 
 
 def par_gen(graph: song_graph.GenreGraph, song_list: list[song_graph.Song],
-            n: int, parameters: dict) -> list[song_graph.Song]:
+            n: int, parameters: dict, song_filter: Optional[song_filters.SongFilter] = None,
+            budget: Optional[Budget] = None) -> list[song_graph.Song]:
     """This generation method uses parameter weight to generate songs. It tailors more
-    to the user's preferences."""
+    to the user's preferences. Only neighbours song_filter allows are rated. Every base song is
+    an expansion of budget."""
+    allowed = graph.get_filter_index().matcher(song_filter)
+    budget = budget or Budget()
     ret_playlist = []
-    visited = set.union({song.name for song in song_list},
-                        {song.information['id'] for song in song_list})
+    visited = {song.group for song in song_list}
     for base_song in song_list:
-        song_g = graph.genres[base_song.genre].song_graph
+        if not budget.spend():
+            break
         base_neighbours_w_scores = []
-        for song_id in base_song.neighbours:
-            if song_g.songs[song_id].name not in visited and song_id not in visited:
-                par_score = par_rating(song_g.songs[song_id], parameters)
-                base_neighbours_w_scores.append((song_id, par_score))
+        for neighbour, _ in neighbours_of(graph, base_song, allowed):
+            if neighbour.group not in visited:
+                par_score = par_rating(neighbour, parameters)
+                base_neighbours_w_scores.append((neighbour, par_score))
         base_neighbours_w_scores = sorted(base_neighbours_w_scores, key=lambda x: x[1])
         c = 0
         for i in range(len(base_neighbours_w_scores)):
             if c == n:
                 break
-            if base_neighbours_w_scores[i][0] not in visited \
-                    and song_g.songs[base_neighbours_w_scores[i][0]].name not in visited:
-                ret_playlist.append(song_g.songs[base_neighbours_w_scores[i][0]])
-                visited.add(song_g.songs[base_neighbours_w_scores[i][0]].name)
-                visited.add(base_neighbours_w_scores[i][0])
+            neighbour = base_neighbours_w_scores[i][0]
+            if neighbour.group not in visited:
+                ret_playlist.append(neighbour)
+                visited.add(neighbour.group)
                 c += 1
 
     return ret_playlist
 
 
-def artist_gen(graph: song_graph.GenreGraph, song_list: list[song_graph.Song]) \
-        -> list[song_graph.Song]:
+def artist_gen(graph: song_graph.GenreGraph, song_list: list[song_graph.Song],
+               song_filter: Optional[song_filters.SongFilter] = None,
+               budget: Optional[Budget] = None) -> list[song_graph.Song]:
     """This method uses recursion to generate songs, and involves the artist to make optimal
-    recommendations. """
+    recommendations. The recursion only goes through songs song_filter allows, every step of it
+    is an expansion of budget."""
+    allowed = graph.get_filter_index().matcher(song_filter)
+    budget = budget or Budget()
     ret = []
-    visited = set.union({base_song.name for base_song in song_list},
-                        {base_song.information['id'] for base_song in song_list})
+    visited = {base_song.group for base_song in song_list}
     for song in song_list:
-        sg = graph.genres[song.genre].song_graph
-        returned = rec(sg, song, visited, song.information['artists'], 0)
+        returned = rec(graph, song, visited, song.information['artists'], 0, allowed, budget)
         if returned is not None:
             ret.append(returned)
-            visited.add(returned.name)
-            visited.add(returned.information['id'])
+            visited.add(returned.group)
+        if budget.truncated:
+            break
     return ret
 
 
-def rec(graph: song_graph.SongGraph, song: song_graph.Song, visited: set,
-        artists: list, depth: int) -> Optional[song_graph.Song]:
+def rec(graph: song_graph.GenreGraph, song: song_graph.Song, visited: set[int],
+        artists: list, depth: int, allowed: Optional[song_filters.SongMatcher] = None,
+        budget: Optional[Budget] = None) -> Optional[song_graph.Song]:
     """This function is the RECURSIVE step that takes in a song and traverses the graph
-    to return one with the same artists"""
+    to return one with the same artists, going only through the songs allowed allows. It gives
+    up (returning None) when budget runs out."""
+    if budget is not None and not budget.spend():
+        return None
     if depth == 250:
         return song
 
-    if song.name not in visited and song.information['id'] not in visited:
+    if song.group not in visited:
         for art in song.information['artists']:
             if art in artists:
                 return song
-    visited.add(song.name)
-    visited.add(song.information['id'])
-    neighbours = [(graph.songs[n_id], song.neighbours[n_id]) for n_id in song.neighbours
-                  if graph.songs[n_id].name not in visited and n_id not in visited]
+    visited.add(song.group)
+    neighbours = [(neighbour, weight) for neighbour, weight in neighbours_of(graph, song, allowed)
+                  if neighbour.group not in visited]
     neighbours = list(sorted(neighbours, reverse=True, key=lambda x: x[1]))
 
     for tup in neighbours:
-        returned = rec(graph, tup[0], visited, artists, depth + 1)
-        if returned is not None:
+        returned = rec(graph, tup[0], visited, artists, depth + 1, allowed, budget)
+        if returned is not None or (budget is not None and budget.truncated):
             return returned
     return None
 
 
+def page_rank(matrix: random_walks.TransitionMatrix, restarts: list[float],
+              damping: float = DAMPING, tolerance: float = TOLERANCE,
+              max_iterations: int = MAX_ITERATIONS,
+              budget: Optional[Budget] = None) -> tuple[list[float], int]:
+    """
+    Return the personalized page rank of every song of matrix (the chance a random walk is at
+    it, when at every step the walk carries on with chance damping and otherwise restarts at a
+    song picked by restarts), and the number of iterations it took.
+
+    The ranks are worked out by power iteration: rank = damping * rank * matrix + (1 - damping) *
+    restarts, until the ranks change by less than tolerance in total or after max_iterations. Only
+    the rows of songs with a rank are multiplied, so the first iterations (when the walk is still
+    near the songs it restarts at) only look at a few rows. Walks at songs without neighbours
+    restart. The rows multiplied are expansions of budget, when it runs out the ranks of the last
+    iteration are returned.
+
+    Preconditions:
+        - len(restarts) == len(matrix.ids) and sum(restarts) == 1
+        - 0 <= damping < 1
+    """
+    starts, columns, chances = matrix.starts, matrix.columns, matrix.chances
+    rank = restarts
+    iterations = 0
+    while iterations < max_iterations:
+        iterations += 1
+        new_rank = [(1 - damping) * chance for chance in restarts]
+        stuck = 0.0
+        active = 0
+        for row, value in enumerate(rank):
+            if value != 0:
+                active += 1
+                start, end = starts[row], starts[row + 1]
+                if start == end:
+                    stuck += value
+                else:
+                    value *= damping
+                    for column, chance in zip(columns[start:end], chances[start:end]):
+                        new_rank[column] += value * chance
+        if stuck != 0:
+            new_rank = [value + damping * stuck * chance
+                        for value, chance in zip(new_rank, restarts)]
+        change = sum(abs(new - old) for new, old in zip(new_rank, rank))
+        rank = new_rank
+        if change < tolerance or (budget is not None and not budget.spend(active)):
+            break
+    return rank, iterations
+
+
+def matrix_rank(song_g: song_graph.SongGraph, seeds: list[song_graph.Song],
+                budget: Optional[Budget] = None) -> dict[str, float]:
+    """
+    Return the personalized page rank (see page_rank) of the songs of song_g, restarting at seeds
+    (at their neighbours for seeds that aren't in the matrix of song_g yet). Working out the
+    matrix, if it hasn't been, costs an expansion of budget per song.
+    """
+    built = song_g.has_transitions()
+    matrix = song_g.get_transitions()
+    if not built and budget is not None:
+        budget.spend(len(matrix.ids))
+    if matrix.ids == []:
+        return {}
+    restarts = [0.0] * len(matrix.ids)
+    for seed in seeds:
+        position = matrix.positions.get(seed.information['id'])
+        if position is not None:
+            restarts[position] += 1
+        elif seed.neighbours != {}:
+            near = [matrix.positions[song_id] for song_id in seed.neighbours
+                    if song_id in matrix.positions]
+            for position in near:
+                restarts[position] += 1 / len(near)
+    total = sum(restarts)
+    if total == 0:
+        return {}
+    rank, _ = page_rank(matrix, [chance / total for chance in restarts], budget=budget)
+    return dict(zip(matrix.ids, rank))
+
+
+def walk_rank(song_g: song_graph.SongGraph, seeds: list[song_graph.Song], walks: int = WALKS,
+              damping: float = DAMPING, budget: Optional[Budget] = None) -> dict[str, float]:
+    """
+    Return an estimate of the personalized page rank of the songs of song_g that random walks
+    from seeds reach, without working out its matrix: walks walks start at each seed, step like
+    a walk of TransitionMatrix and stop with chance 1 - damping at every step. The rank of a song
+    is the share of all steps taken at it. Every step is an expansion of budget, when it runs out
+    the steps so far are counted.
+    """
+    steps = {}
+    visits = collections.Counter()
+    for walk in range(walks * len(seeds)):
+        song_id = seeds[walk % len(seeds)].information['id']
+        while song_id is not None:
+            visits[song_id] += 1
+            if budget is not None and not budget.spend():
+                break
+            if song_id not in steps:
+                song_steps = random_walks.walk_steps(song_g.songs[song_id])
+                steps[song_id] = ([other_id for other_id, _ in song_steps],
+                                  list(itertools.accumulate(chance for _, chance in song_steps)))
+            ids, chances = steps[song_id]
+            if ids == [] or random.random() >= damping:
+                song_id = None
+            else:
+                song_id = random.choices(ids, cum_weights=chances)[0]
+        if budget is not None and budget.truncated:
+            break
+    total = sum(visits.values())
+    return {song_id: count / total for song_id, count in visits.items()}
+
+
+def page_rank_gen(graph: song_graph.GenreGraph, song_list: list[song_graph.Song],
+                  preferences: dict, n: int = 11,
+                  song_filter: Optional[song_filters.SongFilter] = None,
+                  budget: Optional[Budget] = None) -> list[song_graph.Song]:
+    """
+    Search method that returns the n songs a random walk from the songs in song_list is most
+    likely to be at (their personalized page rank, see page_rank), in the song graphs of their
+    genres.
+
+    The walks restart at the input songs (at their neighbours for songs that aren't in the
+    matrix of their genre yet). The preferences are a prior on the songs: each rank is weighted
+    by (1 - PRIOR_MIX) + PRIOR_MIX * the par_rating of the song / the average par_rating of the
+    ranked songs. They aren't a part of the restarts, as then every song would have a rank from the
+    first iteration on, instead of only the songs near the input songs. The ranks of each genre
+    are weighted by its share of the input songs.
+
+    The walks go through every song, but only the ranks of songs song_filter allows are weighted
+    and sorted. When budget runs out, the genres left aren't ranked. Working out the matrix of a
+    genre is charged to budget too (see matrix_rank), and a genre whose matrix would use up the
+    budget is ranked by walks instead (see walk_rank).
+
+    Preconditions:
+        - all([key in WEIGHTS for key in preferences])
+    """
+    allowed = graph.get_filter_index().matcher(song_filter)
+    visited = {song.group for song in song_list}
+    pref_weights = {key: preferences[key] / 100 for key in list(preferences)[:6]
+                    if preferences[key] != 0}
+    scores = []
+    for genre, seeds in song_graph.group_by_genre(song_list).items():
+        if budget is not None and budget.truncated:
+            break
+        song_g = graph.genres[genre].song_graph
+        if song_g.has_transitions() or budget is None or budget.can_spend(len(song_g.songs)):
+            rank = matrix_rank(song_g, seeds, budget)
+        else:  # working out the matrix would use up the budget
+            rank = walk_rank(song_g, seeds, budget=budget)
+
+        share = len(seeds) / len(song_list)
+        songs = song_g.songs
+        ranked = [(value * share, song_id) for song_id, value in rank.items()
+                  if value != 0 and allowed.allows(songs[song_id])]
+        if ranked != [] and pref_weights != {}:
+            prior = [sum(weight * songs[song_id].properties[key]
+                         for key, weight in pref_weights.items()) for _, song_id in ranked]
+            average = sum(prior) / len(prior)
+            if average > 0:
+                ranked = [(value * ((1 - PRIOR_MIX) + PRIOR_MIX * par / average), song_id)
+                          for (value, song_id), par in zip(ranked, prior)]
+        scores.extend((value, genre, song_id) for value, song_id in ranked)
+
+    ret = []
+    for _, genre, song_id in sorted(scores, reverse=True):
+        song = graph.genres[genre].song_graph.songs[song_id]
+        if song.group not in visited:
+            ret.append(song)
+            visited.add(song.group)
+            if len(ret) == n:
+                break
+    return ret
+
+
 def explore_new_genres(graph: song_graph.GenreGraph, song_list: list[song_graph.Song],
-                       bias: float, preferences: dict) -> list[song_graph.Song]:
+                       bias: float, preferences: dict,
+                       song_filter: Optional[song_filters.SongFilter] = None,
+                       budget: Optional[Budget] = None) -> list[song_graph.Song]:
     """
     Search method that returns a list of songs that can be biased to return new genres.
     bias is within range [0, 1], at 1 the method will return only songs that have a genre that
     are different to all genres of the songs in the input list, at 0 the method will just search
-    as normal.
+    as normal. Only songs song_filter allows are scored, each an expansion of budget. Songs of
+    the same recording as an input song or a song already picked (see dedup.DedupIndex)
+    are skipped.
 
     Preconditions:
         - 0 <= bias <= 1
         - all([key in WEIGHTS for key in preferences])
         - all{[genre in graph.genres for genre in viable_genres]}
     """
-    inputted_genres = set()
-    inputted_genres_g = set()
-    for song in song_list:
-        if song.genre not in inputted_genres:
-            inputted_genres.add(song.genre)
-            inputted_genres_g.add(graph.genres[song.genre])
-
-    genre_weights = []
-    for genre in graph.genres:
-        genre_weights.append((genre, get_genre_rating(graph.genres[genre], inputted_genres_g)))
-
-    genre_weights.sort(key=lambda x: x[1])
-
-    viable_genres = get_viable_genres(inputted_genres, genre_weights)
+    inputted_genres = {song.genre for song in song_list}
+    genre_index = graph.get_genre_index()
+    viable_genres = get_viable_genres(inputted_genres, genre_index)
     viable_genres.extend(inputted_genres)
-    songs_w_scores = get_songs_with_scores(viable_genres, song_list, graph, bias, preferences)
+    # score the genres closest to all of the input genres first, in case budget runs out
+    viable_genres = [genre for genre, _ in genre_index.centroid_ranking(inputted_genres,
+                                                                        viable_genres)]
+    songs_w_scores = get_songs_with_scores(viable_genres, song_list, graph, bias, preferences,
+                                           song_filter, budget)
     songs_w_scores.sort(key=lambda x: x[1])
 
-    temp_songs_w_scores = []
-    for i in range(0, len(songs_w_scores) - 1):
-        if songs_w_scores[i] != songs_w_scores[i + 1]:
-            temp_songs_w_scores.append(songs_w_scores[i])
-
-    songs_w_scores = temp_songs_w_scores
-
-    if 11 > len(songs_w_scores):
-        return [songs_w_scores[index][0] for index in range(0, len(songs_w_scores))]
-    else:
-        return [songs_w_scores[index][0] for index in range(0, 11)]
+    ret = []
+    visited = {song.group for song in song_list}
+    for song, _ in songs_w_scores:
+        if song.group not in visited:
+            ret.append(song)
+            visited.add(song.group)
+            if len(ret) == 11:
+                break
+    return ret
 
 
-def get_viable_genres(inputted_genres: set, genre_weights: list) -> list:
+def get_viable_genres(inputted_genres: set, genre_index: genre_distances.GenreIndex) -> list:
     """
-    Return a list of genres that are similar to the set of inputted_genres.
+    Return a list of genres that are similar to the set of inputted_genres: the nearest genres
+    of each of them (see genre_distances.GenreIndex.nearest) that aren't inputted genres themselves.
     """
-    viable_genres = []
-    spread = max(10 / len(inputted_genres), 1)
-    for i in range(0, len(genre_weights)):
-        if genre_weights[i][0] in inputted_genres:
-            offset = 1
-            while offset <= spread:
-                if i - offset > 0 and genre_weights[i - offset][0] not in inputted_genres:
-                    viable_genres.append(genre_weights[i - offset][0])
-                elif len(genre_weights) > i + offset and \
-                        genre_weights[i + offset][0] not in inputted_genres:
-                    viable_genres.append(genre_weights[i + offset][0])
-
-                offset += 1
-    return viable_genres
+    viable_genres = {}
+    spread = int(max(10 / len(inputted_genres), 1))
+    for genre in inputted_genres:
+        nearby = [other for other in genre_index.nearest(genre) if other not in inputted_genres]
+        viable_genres.update(dict.fromkeys(nearby[:spread]))
+    return list(viable_genres)
 
 
 def get_songs_with_scores(viable_genres: list, song_list: list, graph: song_graph.GenreGraph,
-                          bias: float, preferences: dict) -> list:
+                          bias: float, preferences: dict,
+                          song_filter: Optional[song_filters.SongFilter] = None,
+                          budget: Optional[Budget] = None) -> list:
     """
     Return a list of songs with their similarity scores from song_graphs that correspond to
-    genres in viable genres
+    genres in viable genres. Only the songs song_filter allows are scored, they are looked up in
+    the bitmaps of the graph's song_filters.FilterIndex rather than checked one by one. Scoring
+    stops when budget runs out.
 
     Preconditions:
         - all{[genre in graph.genres for genre in viable_genres]}
@@ -220,10 +536,16 @@ def get_songs_with_scores(viable_genres: list, song_list: list, graph: song_grap
         - all([key in WEIGHTS for key in preferences])
 
     """
+    allowed = graph.get_filter_index().matcher(song_filter)
+    budget = budget or Budget()
     songs_w_scores = []
     for genre in viable_genres:
         curr_song_graph = graph.genres[genre].song_graph
-        for song in curr_song_graph.songs:
+        if budget.truncated:
+            break
+        for song in allowed.song_ids(genre, curr_song_graph.songs):
+            if not budget.spend():
+                break
             scores = set()
             for inputted_song in song_list:
                 score = get_biased_sim_score(bias, preferences, curr_song_graph.songs[song],
@@ -298,28 +620,39 @@ def get_genre_rating(genre: song_graph.Genre, genre_list: set) -> float:
 
 
 def find_uniquely_connected(graph: song_graph.GenreGraph, song_list: list[song_graph.Song],
-                            preferences: dict) -> list[song_graph.Song]:
+                            preferences: dict,
+                            song_filter: Optional[song_filters.SongFilter] = None,
+                            budget: Optional[Budget] = None) -> list[song_graph.Song]:
     """
     Search method that returns songs that are uniquely connected to the input list. As in
     the songs that are similar to input song and similar to few other songs are the ones that
-    are returned. Done by comparing degrees.
+    are returned. Done by comparing degrees. Neighbours song_filter doesn't allow are skipped.
+    Every look at the neighbours of a song is an expansion of budget, when it runs out the songs
+    found so far are returned.
 
     Preconditions:
         - graph has all vertices and edges in it.
         - all([key in WEIGHTS for key in preferences])
     """
+    allowed = graph.get_filter_index().matcher(song_filter)
+    budget = budget or Budget()
     returned_songs = []
-    init_song_list = song_list.copy()
-    while len(returned_songs) < 11:
+    returned_groups = set()
+    init_groups = {song.group for song in song_list}
+    shuffles = 0
+    while len(returned_songs) < 11 and shuffles < MAX_SHUFFLES:
         min_songs, min_song = [], []
+        listed_groups = {song.group for song in song_list}
         for song in song_list:
+            if not budget.spend():
+                break
             degrees = []
             for neighbour in song.neighbours:
-                if graph.genres[song.genre].song_graph.songs[neighbour] not in song_list and \
-                        graph.genres[song.genre].song_graph.songs[neighbour] not in returned_songs:
-                    degrees.append((graph.genres[song.genre].song_graph.songs[neighbour],
-                                    graph.genres[song.genre].song_graph.songs[
-                                        neighbour].get_degree()))
+                neighbour_song = graph.genres[song.genre].song_graph.songs[neighbour]
+                if neighbour_song.group not in listed_groups \
+                        and neighbour_song.group not in returned_groups \
+                        and allowed.allows(neighbour_song):
+                    degrees.append((neighbour_song, neighbour_song.get_degree()))
 
             if degrees != []:
                 degrees.sort(key=lambda x: x[1])
@@ -329,7 +662,9 @@ def find_uniquely_connected(graph: song_graph.GenreGraph, song_list: list[song_g
                 min_song = degrees[i]
                 min_songs.append((min_song[0], min_song[1], song))
 
-        if min_songs != [] and min_song != []:
+        if budget.truncated:
+            break
+        elif min_songs != [] and min_song != []:
             scores = [(get_degree_sim_score(song_1=min_song_s[0], song_2=min_song_s[2],
                                             preferences=preferences, degree=min_song_s[1]),
                        min_song_s[0], min_song_s[2]) for min_song_s in min_songs]
@@ -337,13 +672,18 @@ def find_uniquely_connected(graph: song_graph.GenreGraph, song_list: list[song_g
             return_song = tuple_min[1]
             replaced_song = tuple_min[2]
 
-            if return_song not in init_song_list and return_song not in returned_songs:
+            if return_song.group not in init_groups and return_song.group not in returned_groups:
                 returned_songs.append(return_song)
+                returned_groups.add(return_song.group)
 
                 song_list.remove(replaced_song)
                 song_list.append(return_song)
             else:
                 shuffle_songs(song_list, graph)
+                shuffles += 1
+        else:
+            shuffle_songs(song_list, graph)
+            shuffles += 1
 
     if len(returned_songs) > 11:
         return returned_songs[0:11]
@@ -364,19 +704,12 @@ def shuffle_songs(song_list: list[song_graph.Song], graph: song_graph.GenreGraph
     """
     for i in range(0, max(len(song_list) // 2, 1)):
         index_to_replace = random.randint(0, len(song_list) - 1)
-        neighbours = graph.genres[song_list[i].genre].neighbours
-
-        sim_genres = []
-        for genre in list(neighbours):
-            sim_genres.append((get_genre_rating(graph.genres[song_list[i].genre],
-                                                {graph.genres[genre]}),
-                               graph.genres[genre]))
+        genre = graph.get_genre_index().nearest_neighbour(song_list[i].genre)
 
-        if sim_genres != []:
-            genre = min(sim_genres, key=lambda x: x[0])[1].name
-
-            if graph.genres[genre].song_graph.songs != {}:
-                sp_i = random.choice(list(graph.genres[genre].song_graph.songs))
+        if genre is not None:
+            song_ids = graph.get_bridge_index().song_ids(genre)
+            if song_ids != ():
+                sp_i = random.choice(song_ids)
                 song = graph.genres[genre].song_graph.songs[sp_i]
                 song_list[index_to_replace] = song
 
@@ -398,15 +731,18 @@ def get_degree_sim_score(song_1: song_graph.Song, song_2: song_graph.Song, prefe
     return ret_score
 
 
-def get_new_songs(graph: song_graph.GenreGraph, song_list: list[song_graph.Song])\
-        -> list[song_graph.Song]:
+def get_new_songs(graph: song_graph.GenreGraph, song_list: list[song_graph.Song],
+                  song_filter: Optional[song_filters.SongFilter] = None,
+                  budget: Optional[Budget] = None) -> list[song_graph.Song]:
     """
     Search method to return similar songs that are not older than a certain date.
     That date is the oldest of songs in song_list
 
     The search method looks at all neighbours of inputted songs calculates their similarity
     scores with respect to the entire list and takes every song posted after said date and then
-    takes the 11 most similar songs.
+    takes the 11 most similar songs. Neighbours song_filter doesn't allow aren't scored. Every
+    look at the neighbours of a song is an expansion of budget, when it runs out the songs scored
+    so far are returned.
 
     Preconditions:
         - graph has all vertices and edges in it.
@@ -416,30 +752,42 @@ def get_new_songs(graph: song_graph.GenreGraph, song_list: list[song_graph.Song]
         if song.information['release_date'] < min_date:
             min_date = song.information['release_date']
 
+    allowed = graph.get_filter_index().matcher(song_filter)
+    budget = budget or Budget()
+    input_groups = {song.group for song in song_list}
     songs_to_return = []
-    while len(songs_to_return) < 11:
+    shuffles = 0
+    while len(songs_to_return) < 11 and shuffles < MAX_SHUFFLES and not budget.truncated:
         all_genres = set()
         for song in song_list:
             all_genres.add(song.genre)
 
         sim_scores = []
         for song in song_list:
+            if not budget.spend():
+                break
             for neighbour in song.neighbours:
-                sim_scores.append((get_song_rating
-                                   (graph.genres[song.genre].song_graph.songs[neighbour],
-                                    song_list),
-                                   graph.genres[song.genre].song_graph.songs[neighbour]))
+                if allowed.allows(graph.genres[song.genre].song_graph.songs[neighbour]):
+                    sim_scores.append((get_song_rating
+                                       (graph.genres[song.genre].song_graph.songs[neighbour],
+                                        song_list),
+                                       graph.genres[song.genre].song_graph.songs[neighbour]))
 
         sim_scores.sort(key=lambda x: x[0])
 
-        songs_to_return = []
+        found = []
+        found_groups = set(input_groups)
         for tup_song in sim_scores:
-            if tup_song[1].information['release_date'] > min_date and tup_song[1] not in \
-                    songs_to_return:
-                songs_to_return.append(tup_song[1])
-
-        if len(songs_to_return) < 11:
+            if tup_song[1].information['release_date'] > min_date and tup_song[1].group not in \
+                    found_groups:
+                found.append(tup_song[1])
+                found_groups.add(tup_song[1].group)
+        if not budget.truncated or len(found) > len(songs_to_return):
+            songs_to_return = found
+
+        if len(songs_to_return) < 11 and not budget.truncated:
             shuffle_songs(song_list, graph)
+            shuffles += 1
 
     if len(songs_to_return) > 11:
         return songs_to_return[0:11]
@@ -461,7 +809,9 @@ def get_new_songs(graph: song_graph.GenreGraph, song_list: list[song_graph.Song]
 #         'extra-imports': ['pygame', 'networkx', 'pygame_visualization', 'song_graph',
 #                           'computations', 'tkinter', 'spotify_methods', 'random', 'main',
 #                           'spotipy', 'spotipy.oauth2', 'graph_visualization', 'datetime',
-#                           'csv', 'plotly.graph_objects', 'math', 'collections'],
+#                           'csv', 'plotly.graph_objects', 'math', 'collections', 'time',
+#                           'itertools', 'genre_distances', 'overlays', 'random_walks',
+#                           'song_filters'],
 #         'generated-members': ['pygame.*'],
 #         'max-nested-blocks': 4,
 #         'allowed-io': ['genres_to_songs', 'load_genres', 'load_artists_to_genres', 'load_songs',
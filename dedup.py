@@ -0,0 +1,157 @@
+"""
+Grouping the songs of a genre graph that are the same recording (e.g. a song and its remaster),
+so playlists don't repeat them.
+"""
+from __future__ import annotations
+import collections
+import re
+from typing import Iterable, MutableMapping
+import catalog_search
+import song_graph
+
+# Words that mark part of a title as naming a version of a recording, e.g. 'Song - Remastered
+# 2011', 'Song (Live at Wembley)' or 'Song [Mono Version]', see dedup_title
+VERSION_WORDS = {'remaster', 'remastered', 'live', 'version', 'mono', 'stereo', 'edit', 'mix',
+                 'demo', 'take', 'recording', 'recorded', 'bonus', 'single'}
+VERSION_PART = re.compile(r'\s*(?:\([^)]*\)|\[[^\]]*\]|\s-\s.*$)')
+
+
+def dedup_title(title: str) -> str:
+    """
+    Return title normalised for finding other versions of the same recording: the search_tokens
+    of title without the parts in brackets or after ' - ' that name a version (see VERSION_WORDS)
+
+    >>> dedup_title('Under Pressure - Remastered 2011')
+    'under pressure'
+    >>> dedup_title('Hey Jude (Live at the Hollywood Bowl) [Mono]')
+    'hey jude'
+    >>> dedup_title('Song 2 (feat. Someone)')
+    'song 2 feat someone'
+    """
+    if '(' in title or '[' in title or ' - ' in title:
+        short = VERSION_PART.sub(lambda part: part.group() if VERSION_WORDS.isdisjoint(
+            catalog_search.search_tokens(part.group())) else '', title)
+        if short.strip() != '':
+            title = short
+    return ' '.join(catalog_search.search_tokens(title))
+
+
+def dedup_key(song: song_graph.Song) -> tuple[str, str]:
+    """
+    Return the key of the group of song in a DedupIndex: the dedup_title of its name and the
+    normalised name of its first artist
+    """
+    artists = song.information.get('artists') or ['']
+    return dedup_title(song.name), ' '.join(catalog_search.search_tokens(artists[0]))
+
+
+class DedupIndex:
+    """
+    Groups of songs that are the same recording: songs whose titles are the same once lower cased
+    and stripped of version names like 'Remastered' or 'Live' (see dedup_title), by the same first
+    artist. Each group has an integer id, which is stored on its songs as Song.group, so searches
+    avoid repeats by keeping a set of ints rather than a set of titles.
+
+    Instance attributes:
+        - groups: maps (dedup_title of the name, normalised name of the first artist) to the id
+          of the group
+        - sizes: maps the id of every group to the number of songs added to it, a group is
+          dropped when its last song is removed
+    """
+    groups: MutableMapping[tuple[str, str], int]
+    sizes: MutableMapping[int, int]
+    _next_group: int
+
+    def __init__(self, songs: Iterable[song_graph.Song] = ()) -> None:
+        """
+        Initialize the index with the given songs
+        """
+        self.groups = {}
+        self.sizes = {}
+        self._next_group = 0
+        for song in songs:
+            self.add(song)
+
+    def group_of(self, song: song_graph.Song) -> int:
+        """
+        Return the id of the group of song, adding a new group if no song of it was seen before.
+        song isn't changed.
+        """
+        key = dedup_key(song)
+        group = self.groups.get(key)
+        if group is None:
+            group = self.groups[key] = self._next_group
+            self._next_group += 1
+        return group
+
+    def add(self, song: song_graph.Song) -> int:
+        """
+        Set the group of song, with a new id if no song of the group was added before, and
+        return it
+        """
+        song.group = self.group_of(song)
+        self.sizes[song.group] = self.sizes.get(song.group, 0) + 1
+        return song.group
+
+    def remove(self, song: song_graph.Song) -> None:
+        """
+        Remove a song that was added, dropping its group if it was the last song of it
+        """
+        key = dedup_key(song)
+        group = self.groups.get(key)
+        if group is not None:
+            self.sizes[group] = self.sizes.get(group, 1) - 1
+            if self.sizes[group] <= 0:
+                del self.groups[key]
+                del self.sizes[group]
+
+    def overlay(self) -> DedupIndex:
+        """
+        Return an index with the groups of this one, that new groups are added to instead of
+        this one (the ids carry on from this index's, so they don't clash)
+        """
+        index = DedupIndex()
+        index.groups = collections.ChainMap({}, self.groups)
+        index.sizes = collections.ChainMap({}, self.sizes)
+        index._next_group = self._next_group
+        return index
+
+    def layered(self) -> DedupIndex:
+        """
+        Return an index with the groups of this overlay and of its base, that shares the base's
+        mappings instead of copying them (see song_graph.stack_layer). Neither index is changed.
+
+        Preconditions:
+            - self was made by overlay
+        """
+        index = DedupIndex()
+        index.groups = song_graph.stack_layer(self.groups.maps[0], self.groups.maps[1])
+        index.sizes = song_graph.stack_layer(self.sizes.maps[0], self.sizes.maps[1])
+        index._next_group = self._next_group
+        return index
+
+    def copy(self) -> DedupIndex:
+        """
+        Return an index with the groups of this one (and of its base, if this is an overlay)
+        """
+        index = DedupIndex()
+        index.groups = dict(self.groups)
+        index.sizes = dict(self.sizes)
+        index._next_group = self._next_group
+        return index
+
+
+# if __name__ == '__main__':
+#     import python_ta.contracts
+#     python_ta.contracts.check_all_contracts()
+#
+#     import doctest
+#     doctest.testmod()
+#
+#     import python_ta
+#     python_ta.check_all(config={
+#         'max-line-length': 100,
+#         'disable': ['E1136'],
+#         'extra-imports': ['collections', 're', 'catalog_search', 'song_graph'],
+#         'max-nested-blocks': 4
+#     })
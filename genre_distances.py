@@ -0,0 +1,175 @@
+"""
+Precomputed distances between the genres of a genre graph, and the genres nearest to every genre.
+"""
+from __future__ import annotations
+import heapq
+import operator
+from typing import Iterable, Optional
+import song_graph
+
+# Number of genres kept in the nearest genre list of each genre, see GenreIndex
+NEAREST_GENRES = 32
+
+
+class GenreIndex:
+    """
+    Precomputed genre to genre distances, used so searches don't have to re-average the
+    properties of every genre on every request.
+
+    The distance between two genres is the same as computations.get_genre_rating, i.e. the
+    weighted sum of the differences of their average properties. Each genre's average properties
+    are stored once as a weighted vector so a distance is just the sum of the absolute differences
+    of two vectors.
+
+    Rows of the genre x genre distance matrix are filled in the first time a genre is looked up
+    and kept for every later lookup. The lists of the NEAREST_GENRES genres nearest to every genre,
+    and the nearest of its neighbours in the genre graph, are built with the graph (see
+    build_nearest), so they are saved along with it; for a genre they weren't built for they are
+    worked out the first time they are needed.
+
+    Instance attributes:
+        - names: all genre names, names[i] is the genre of row / column i of the matrix
+        - positions: maps genre name to its row in the matrix
+        - vectors: weighted average properties of each genre, in the same order as names
+
+    Representation invariants:
+        - len(self.names) == len(self.vectors) == len(self.positions)
+        - all(self.names[self.positions[name]] == name for name in self.names)
+    """
+    names: list[str]
+    positions: dict[str, int]
+    vectors: list[list[float]]
+    _rows: dict[int, list[float]]
+    _nearest: dict[int, list[str]]
+    _nearest_neighbour: dict[int, Optional[str]]
+    _genres: dict[str, song_graph.Genre]
+
+    def __init__(self, genres: dict[str, song_graph.Genre]) -> None:
+        """
+        Initialize the index from a mapping of genre name to Genre
+        """
+        self.names = list(genres)
+        self.positions = {name: i for i, name in enumerate(self.names)}
+        props = [prop for prop in song_graph.WEIGHTS]
+        self.vectors = [[song_graph.WEIGHTS[prop] * genres[name].average_properties[prop]
+                         for prop in props] for name in self.names]
+        self._rows = {}
+        self._nearest = {}
+        self._nearest_neighbour = {}
+        self._genres = genres
+
+    def distances(self, genre: str) -> list[float]:
+        """
+        Return the row of the distance matrix for genre, i.e. the distance from genre to every
+        genre in self.names
+        """
+        i = self.positions[genre]
+        if i not in self._rows:
+            vector = self.vectors[i]
+            self._rows[i] = self._row(i)
+        return self._rows[i]
+
+    def distance(self, genre_1: str, genre_2: str) -> float:
+        """
+        Return the distance between genre_1 and genre_2
+        """
+        return self.distances(genre_1)[self.positions[genre_2]]
+
+    def nearest(self, genre: str) -> list[str]:
+        """
+        Return the NEAREST_GENRES genres nearest to genre, from closest to furthest (genre itself
+        isn't included)
+        """
+        i = self.positions[genre]
+        if i not in self._nearest:
+            self._nearest[i] = self._nearest_to(i, self.distances(genre))
+        return self._nearest[i]
+
+    def nearest_neighbour(self, genre: str) -> Optional[str]:
+        """
+        Return the neighbour of genre in the genre graph that is nearest to it, or None if it
+        has no neighbours
+        """
+        i = self.positions[genre]
+        if i not in self._nearest_neighbour:
+            self._nearest_neighbour[i] = self._nearest_neighbour_in(i, self.distances(genre))
+        return self._nearest_neighbour[i]
+
+    def neighbours_changed(self, genre: str) -> None:
+        """
+        Forget the nearest neighbour of genre, as an edge of it was added
+        """
+        self._nearest_neighbour.pop(self.positions.get(genre), None)
+
+    def build_nearest(self) -> None:
+        """
+        Work out the nearest genres and nearest neighbour of every genre. The distance rows this
+        goes through aren't kept, as the whole matrix is much larger than the lists.
+        """
+        for i in range(len(self.names)):
+            if i not in self._nearest or i not in self._nearest_neighbour:
+                row = self._rows.get(i) or self._row(i)
+                self._nearest[i] = self._nearest_to(i, row)
+                self._nearest_neighbour[i] = self._nearest_neighbour_in(i, row)
+
+    def _row(self, i: int) -> list[float]:
+        """
+        Return row i of the distance matrix
+        """
+        vector = self.vectors[i]
+        return [sum(map(abs, map(operator.sub, vector, other))) for other in self.vectors]
+
+    def _nearest_to(self, i: int, row: list[float]) -> list[str]:
+        """
+        Return the names of the NEAREST_GENRES genres other than genre i with the lowest
+        distances in row, lowest first
+        """
+        closest = heapq.nsmallest(NEAREST_GENRES + 1, range(len(row)), key=row.__getitem__)
+        return [self.names[j] for j in closest if j != i][:NEAREST_GENRES]
+
+    def _nearest_neighbour_in(self, i: int, row: list[float]) -> Optional[str]:
+        """
+        Return the neighbour of genre i with the lowest distance in row, None if it has none
+        """
+        neighbours = self._genres[self.names[i]].neighbours
+        if neighbours == {}:
+            return None
+        return min(neighbours, key=lambda name: row[self.positions[name]])
+
+    def centroid_ranking(self, genres: set[str], candidates: Optional[Iterable[str]] = None) \
+            -> list[tuple[str, float]]:
+        """
+        Return every genre of candidates (every genre, if it isn't given) with its distance to
+        the average of the given genres, sorted from closest to furthest.
+
+        This gives the same ratings as calling computations.get_genre_rating(genre, genres) on
+        every genre, but the average of genres is only computed once.
+
+        Preconditions:
+            - genres != set()
+            - all(genre in self.positions for genre in genres)
+        """
+        members = [self.vectors[self.positions[genre]] for genre in genres]
+        centroid = [sum(column) / len(members) for column in zip(*members)]
+        names = self.names if candidates is None else list(dict.fromkeys(candidates))
+        ranking = [(name, sum(map(abs, map(operator.sub, self.vectors[self.positions[name]],
+                                           centroid))))
+                   for name in names]
+        ranking.sort(key=lambda x: x[1])
+        return ranking
+
+
+# if __name__ == '__main__':
+#     import python_ta.contracts
+#     python_ta.contracts.check_all_contracts()
+#
+#     import doctest
+#     doctest.testmod()
+#
+#     import python_ta
+#     python_ta.check_all(config={
+#         'max-line-length': 100,
+#         'disable': ['E1136'],
+#         'extra-imports': ['heapq', 'operator', 'song_graph'],
+#         'max-nested-blocks': 4
+#     })
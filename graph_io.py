@@ -0,0 +1,60 @@
+"""
+Saving genre graphs to files and loading them back, so they don't have to be rebuilt from the
+csv files every time.
+"""
+from __future__ import annotations
+import pickle
+from typing import Any, Tuple
+import song_graph
+
+# The classes saved with a graph that used to be in song_graph, by the module they are in now, so
+# graphs saved before they were moved still load
+MOVED = {'TransitionMatrix': 'random_walks', 'GenreIndex': 'genre_distances',
+         'BridgeIndex': 'bridges', 'FilterIndex': 'song_filters', 'CatalogIndex': 'catalog_search',
+         'DedupIndex': 'dedup'}
+
+
+class GraphUnpickler(pickle.Unpickler):
+    """Unpickles saved graphs, looking the classes in MOVED up in their new modules"""
+
+    def find_class(self, module: str, name: str) -> Any:
+        """Return the class called name in module, or in the module it was moved to"""
+        if module == 'song_graph' and name in MOVED:
+            module = MOVED[name]
+        return super().find_class(module, name)
+
+
+def save_graph(graph_file: str, graph: song_graph.GenreGraph, songs_to_g: dict) -> None:
+    """
+    Save a genre graph and its song id to genre mapping (as returned by create_genre_graph) to
+    graph_file so it doesn't have to be rebuilt from the csv files every time.
+    """
+    with open(graph_file, 'wb') as graph_data:
+        pickle.dump((graph, songs_to_g), graph_data, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def load_graph(graph_file: str) -> Tuple[song_graph.GenreGraph, dict]:
+    """
+    Load a genre graph and its song id to genre mapping saved with save_graph.
+
+    Preconditions:
+        - graph_file was written by save_graph
+    """
+    with open(graph_file, 'rb') as graph_data:
+        return GraphUnpickler(graph_data).load()
+
+
+# if __name__ == '__main__':
+#     import python_ta.contracts
+#     python_ta.contracts.check_all_contracts()
+#
+#     import doctest
+#     doctest.testmod()
+#
+#     import python_ta
+#     python_ta.check_all(config={
+#         'max-line-length': 100,
+#         'disable': ['E1136'],
+#         'extra-imports': ['pickle', 'song_graph'],
+#         'max-nested-blocks': 4
+#     })
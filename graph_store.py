@@ -0,0 +1,195 @@
+"""
+Versioned genre graph that can be read from many threads while new songs are inserted.
+
+Inserting a song into a GenreGraph changes the neighbours of songs that other threads may be
+iterating over, so instead of changing the graph a GraphStore makes a new version of it:
+    - readers take a snapshot (the current graph, its all_songs mapping and version number) and
+      use it for as long as they like, a snapshot never changes
+    - inserted songs are batched, and each batch makes a new version in which only the songs
+      the batch changes are new, layered over the previous version's which they share
+    - the new version replaces the current one in a single assignment, so readers never see half
+      of a batch and never need a lock
+"""
+import collections
+import threading
+from typing import Mapping, NamedTuple, Optional
+import overlays
+import song_graph
+
+
+class Snapshot(NamedTuple):
+    """A version of the graph, see GraphStore"""
+    graph: song_graph.GenreGraph
+    all_songs: Mapping[str, str]
+    version: int
+
+
+class SongLayers(collections.ChainMap):
+    """
+    The all_songs mapping of a version after the first: the songs each batch added, layered over
+    those of the version before (see song_graph.stack_layer). ChainMap works out its length by
+    going through every layer, so the length is kept instead.
+
+    Instance attributes:
+        - size: the number of songs in the mapping
+    """
+    size: int
+
+    def __len__(self) -> int:
+        """Return the number of songs in the mapping"""
+        return self.size
+
+
+class GraphStore:
+    """
+    A genre graph that is read through snapshots and changed in batches.
+
+    Instance attributes:
+        - batch_size: a batch is applied as soon as this many songs are waiting
+        - max_delay: seconds a song waits for more songs to batch it with
+        - thresh: the rating difference within which inserted songs are connected (like
+          SongGraph.sg_insert_song), None to use the threshold each song graph was made with
+        - inserted: number of songs inserted so far
+    """
+    batch_size: int
+    max_delay: float
+    thresh: Optional[float]
+    inserted: int
+    _current: Snapshot
+    _pending: dict[str, song_graph.Song]
+    _write_lock: threading.Lock
+    _pending_lock: threading.Lock
+    _timer: Optional[threading.Timer]
+
+    def __init__(self, graph: song_graph.GenreGraph, all_songs: dict, batch_size: int = 100,
+                 max_delay: float = 0.5, thresh: Optional[float] = None) -> None:
+        """Initialize the store with graph (and its song id to genre mapping) as version 0
+
+        Preconditions:
+            - thresh is not None or the song graphs were made by song_graph.create_song_graph
+        """
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.thresh = thresh
+        self.inserted = 0
+        self._current = Snapshot(graph, all_songs, 0)
+        self._pending = {}
+        self._write_lock = threading.Lock()
+        self._pending_lock = threading.Lock()
+        self._timer = None
+
+    def snapshot(self) -> Snapshot:
+        """Return the current version of the graph"""
+        return self._current
+
+    @property
+    def version(self) -> int:
+        """The number of the current version, it goes up by one for every batch applied"""
+        return self._current.version
+
+    def insert(self, song: song_graph.Song) -> None:
+        """Insert a song (with its genre set) into a later version of the graph. The song is
+        applied with the next batch, at the latest max_delay seconds from now."""
+        self.insert_many([song])
+
+    def insert_many(self, songs: list[song_graph.Song]) -> None:
+        """Insert songs into a later version of the graph, see insert"""
+        with self._pending_lock:
+            for song in songs:
+                self._pending[song.information['id']] = song
+            full = len(self._pending) >= self.batch_size
+            if not full and self._timer is None and self._pending != {}:
+                self._timer = threading.Timer(self.max_delay, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        if full:
+            self.flush()
+
+    def flush(self) -> int:
+        """Apply every waiting song as one batch and return the new version number"""
+        with self._write_lock:
+            with self._pending_lock:
+                songs = list(self._pending.values())
+                self._pending.clear()
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+            if songs != []:
+                self._current = apply_batch(self._current, songs, self.thresh)
+                self.inserted += len(songs)
+            return self._current.version
+
+
+def apply_batch(snapshot: Snapshot, songs: list[song_graph.Song],
+                thresh: Optional[float]) -> Snapshot:
+    """Return the next version of snapshot, with songs inserted. snapshot isn't changed.
+
+    The songs are inserted (in bulk) into an OverlayGraph of the snapshot. The overlay's songs
+    and groups are then layered over the snapshot's (see song_graph.stack_layer) rather than
+    copied into them, so a batch costs about as much as the genres and songs it changes. Songs
+    that are already in the graph or whose genre isn't are skipped."""
+    overlay = overlays.OverlayGraph(snapshot.graph, snapshot.all_songs)
+    added = [song for song in songs if song.information['id'] not in snapshot.all_songs
+             and song.genre in snapshot.graph.genres]
+    overlay.insert_songs(added, thresh)
+
+    graph = song_graph.GenreGraph()
+    graph.genres = dict(snapshot.graph.genres)
+    for name, overlay_genre in overlay.genres.maps[0].items():
+        changed = {}
+        for song_id, song in overlay_genre.song_graph.songs.maps[0].items():
+            if isinstance(song, overlays.OverlaySong):  # a song of the snapshot that got edges
+                copy = song_graph.Song(song.properties, song.information, song.name)
+                copy.genre = song.genre
+                copy.group = song.group
+                copy.neighbours = dict(song.base.neighbours)
+                copy.neighbours.update(song.neighbours.maps[0])
+                song = copy
+            changed[song_id] = song
+        base = overlay_genre.song_graph.base
+        genre = song_graph.Genre(song_graph.SongGraph(), overlay_genre.average_properties, name)
+        genre.song_graph.songs = song_graph.stack_layer(changed, base.songs)
+        genre.song_graph.rating_order = overlay_genre.song_graph.rating_order
+        genre.song_graph.threshold = overlay_genre.song_graph.threshold
+        # The new songs aren't in the transition matrix, but it is still right for the others and
+        # much slower to work out again than to leave them out (see computations.page_rank_gen)
+        genre.song_graph.transitions = base.transitions
+        genre.median_properties = overlay_genre.median_properties
+        genre.neighbours = overlay_genre.neighbours
+        graph.genres[name] = genre
+
+    # No genres were added, so the genre index still holds, and so do the bridges (the new songs
+    # just aren't bridged) and the filter bitmaps (the new songs are filtered one by one). The
+    # dedup index and the catalog index get the new songs in views of their own, so searches
+    # running on earlier versions don't see them.
+    graph.genre_index = snapshot.graph.genre_index
+    graph.bridge_index = snapshot.graph.bridge_index
+    graph.filter_index = snapshot.graph.filter_index
+    graph.dedup_index = snapshot.graph.dedup_index
+    if overlay.dedup_index is not None:
+        graph.dedup_index = overlay.dedup_index.layered()
+    graph.catalog_index = snapshot.graph.catalog_index
+    if graph.catalog_index is not None:
+        graph.catalog_index = graph.catalog_index.view()
+        graph.catalog_index.add_many([overlay.get_song(song) for song in added])
+
+    all_songs = SongLayers(*song_graph.stack_layer(overlay.all_songs.maps[0],
+                                                  snapshot.all_songs).maps)
+    all_songs.size = len(snapshot.all_songs) + len(overlay.all_songs.maps[0])
+    return Snapshot(graph, all_songs, snapshot.version + 1)
+
+
+# if __name__ == '__main__':
+#     import python_ta.contracts
+#     python_ta.contracts.check_all_contracts()
+#
+#     import doctest
+#     doctest.testmod()
+#
+#     import python_ta
+#     python_ta.check_all(config={
+#         'max-line-length': 100,
+#         'disable': ['E1136'],
+#         'extra-imports': ['song_graph', 'threading', 'collections', 'overlays'],
+#         'max-nested-blocks': 4
+#     })
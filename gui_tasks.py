@@ -0,0 +1,186 @@
+"""
+Runs the slow parts of the GUI (generating playlists, searching and talking to spotify) on worker
+threads so the window keeps responding while they run.
+
+tkinter widgets may only be used from the thread running the event loop, so workers never touch
+them: what a task reports and returns is put on a queue, and the event loop takes it off with
+window.after and calls the task's callbacks.
+
+Threads are used rather than processes because every task works on the same (large) genre graph,
+which a process would have to be sent a copy of.
+"""
+import concurrent.futures
+import queue
+import threading
+from typing import Any, Callable, Optional
+
+# How often the event loop checks for finished tasks, in milliseconds
+POLL_INTERVAL = 50
+SPINNER = '|/-\\'
+
+
+class Task:
+    """
+    A job running on a worker thread.
+
+    Instance attributes:
+        - key: identifies what the task does, two tasks with the same key are duplicates
+        - label: what the task does, shown while it runs
+        - on_done: called on the event loop thread with what the task returned (if not None)
+        - on_progress: called on the event loop thread with everything the task reports
+        - progress: text about how far the task has got, shown after its label
+    """
+    key: str
+    label: str
+    on_done: Optional[Callable[[Any], None]]
+    on_progress: Optional[Callable[[Any], None]]
+    progress: str
+    _cancelled: threading.Event
+    _results: queue.Queue
+
+    def __init__(self, key: str, label: str, on_done: Optional[Callable[[Any], None]],
+                 on_progress: Optional[Callable[[Any], None]], results: queue.Queue) -> None:
+        """Initialize the task, what it reports and returns is put on results"""
+        self.key = key
+        self.label = label
+        self.on_done = on_done
+        self.on_progress = on_progress
+        self.progress = ''
+        self._cancelled = threading.Event()
+        self._results = results
+
+    def cancel(self) -> None:
+        """Cancel the task: nothing it reports or returns from now on is passed on"""
+        self._cancelled.set()
+
+    def is_cancelled(self) -> bool:
+        """Return whether the task has been cancelled, long tasks should stop when it has"""
+        return self._cancelled.is_set()
+
+    def report(self, value: Any, progress: str = '') -> None:
+        """Pass value on to on_progress (from a worker thread) and show progress"""
+        self._results.put((self, 'progress', (value, progress)))
+
+
+class TaskRunner:
+    """
+    Runs tasks for the GUI on worker threads.
+
+    Only one task with the same key runs at a time: submitting a duplicate (e.g. clicking a button
+    twice) is ignored, unless the new task supersedes it (e.g. a new search), in which case the old
+    one is cancelled.
+
+    Instance attributes:
+        - window: the tkinter window whose event loop the callbacks are run on
+        - show_status: called with a line describing the running tasks whenever it changes
+        - running: the running tasks by key
+    """
+    window: Any
+    show_status: Callable[[str], None]
+    running: dict[str, Task]
+    _executor: concurrent.futures.ThreadPoolExecutor
+    _results: queue.Queue
+    _polling: bool
+    _ticks: int
+
+    def __init__(self, window: Any, show_status: Callable[[str], None], workers: int = 4) -> None:
+        """Initialize the runner for window with workers worker threads"""
+        self.window = window
+        self.show_status = show_status
+        self.running = {}
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+        self._results = queue.Queue()
+        self._polling = False
+        self._ticks = 0
+
+    def submit(self, key: str, label: str, work: Callable[[Task], Any],
+               on_done: Optional[Callable[[Any], None]] = None,
+               on_progress: Optional[Callable[[Any], None]] = None,
+               supersede: bool = False) -> Optional[Task]:
+        """
+        Run work(task) on a worker thread and call on_done with what it returns, work can pass
+        things to on_progress while it runs with task.report. Returns the task, or None if a task
+        with the same key is already running and this one doesn't supersede it.
+
+        Must be called from the event loop thread.
+        """
+        if key in self.running:
+            if not supersede:
+                return None
+            self.running.pop(key).cancel()
+
+        task = Task(key, label, on_done, on_progress, self._results)
+        self.running[key] = task
+        self._executor.submit(self._run, task, work)
+        self._update_status()
+        if not self._polling:
+            self._polling = True
+            self.window.after(POLL_INTERVAL, self._poll)
+        return task
+
+    def _run(self, task: Task, work: Callable[[Task], Any]) -> None:
+        """Run work on this worker thread and queue what it returns (or raises)"""
+        try:
+            self._results.put((task, 'done', work(task)))
+        except Exception as error:  # shown on the event loop thread instead of lost in the worker
+            self._results.put((task, 'error', error))
+
+    def _poll(self) -> None:
+        """Pass on everything the tasks have reported or returned, on the event loop thread"""
+        while True:
+            try:
+                task, kind, value = self._results.get_nowait()
+            except queue.Empty:
+                break
+            if task.is_cancelled():
+                continue
+            if kind == 'progress':
+                task.progress = value[1]
+                if task.on_progress is not None:
+                    task.on_progress(value[0])
+            else:
+                del self.running[task.key]
+                if kind == 'error':
+                    print(task.label + ' failed: ' + repr(value))
+                elif task.on_done is not None:
+                    task.on_done(value)
+
+        self._ticks += 1
+        self._update_status()
+        if self.running == {}:
+            self._polling = False
+        else:
+            self.window.after(POLL_INTERVAL, self._poll)
+
+    def _update_status(self) -> None:
+        """Show what is running, with a spinner so it is clear the window hasn't frozen"""
+        if self.running == {}:
+            self.show_status('')
+        else:
+            self.show_status(SPINNER[self._ticks % len(SPINNER)] + ' ' + ', '.join(
+                task.label + (' ' + task.progress if task.progress != '' else '')
+                for task in self.running.values()))
+
+    def shutdown(self) -> None:
+        """Cancel every task and stop the worker threads once they finish what they are doing"""
+        for task in self.running.values():
+            task.cancel()
+        self.running.clear()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+# if __name__ == '__main__':
+#     import python_ta.contracts
+#     python_ta.contracts.check_all_contracts()
+#
+#     import doctest
+#     doctest.testmod()
+#
+#     import python_ta
+#     python_ta.check_all(config={
+#         'max-line-length': 100,
+#         'disable': ['E1136'],
+#         'extra-imports': ['concurrent.futures', 'queue', 'threading'],
+#         'max-nested-blocks': 4,
+#         'allowed-io': ['TaskRunner._poll']
+#     })
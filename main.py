@@ -1,51 +1,37 @@
 """This runs the GUI for our project"""
 import tkinter as tk
+import gc
 import random
+from typing import Optional
 import spotify_methods
 import computations
+import gui_tasks
 import song_graph
-import pygame_visualization
+
+# Seconds a playlist may take to generate, after that the best playlist found so far is used
+PLAYLIST_SLO = 5.0
 
 ###################################
 #      FUNCTIONAL DEFINITIONS
 ###################################
 
 
-def make_playlist(playlist: list, preferences: dict,
-                  graph: song_graph.GenreGraph, all_songs: dict) -> list[song_graph.Song]:
+def make_playlist(playlist: list, preferences: dict, graph: song_graph.GenreGraph,
+                  all_songs: dict, slo: Optional[float] = None) -> list[song_graph.Song]:
     """This method generates you a new playlist!
 
     The song vertices currently stored aren't in the graph, they just represent the vertex. Now
     this song MAY have a vertex representation already in the graph or may not, so we need to
     first decide if we need ot add this new vertex in as a new vertex, or use the existing one!
 
-    Then, computations.py handles the playlist generation depending on the mode selected"""
-    # print("Making Playlist...")
-    song_verts = []
-    for song in playlist:
-        if not song.information['id'] in all_songs:
-            graph.insert_song(song)
-            all_songs[song.information['id']] = song.genre
-        song_verts.append(graph.get_song(song))
-    new_playlist = []
-    if song_verts != []:
-        if preferences['gen_mode'] == 'level gen':
-            new_playlist = computations.bfs_gen(graph, song_verts, 2)
-        elif preferences['gen_mode'] == 'custom gen':
-            new_playlist = computations.par_gen(graph, song_verts, 2, preferences)
-        elif preferences['gen_mode'] == 'artist pref':
-            new_playlist = computations.artist_gen(graph, song_verts)
-        elif preferences['gen_mode'] == 'new genre':
-            if preferences['bias'] is not None:
-                new_playlist = computations.explore_new_genres(graph, song_verts,
-                                                               preferences['bias'],
-                                                               preferences)
-        elif preferences['gen_mode'] == 'unique songs':
-            new_playlist = computations.find_uniquely_connected(graph, song_verts, preferences)
-        elif preferences['gen_mode'] == 'recent songs':
-            new_playlist = computations.get_new_songs(graph, song_verts)
-        else:
-            new_playlist = []
+    computations.recommend handles both of these, and the playlist generation depending on the
+    mode selected. It is given slo seconds (PLAYLIST_SLO by default), if it runs out of time the
+    playlist is made from the songs found by then."""
+    slo = PLAYLIST_SLO if slo is None else slo
+    budget = computations.Budget(slo)
+    new_playlist = computations.recommend(graph, all_songs, playlist, preferences, budget=budget)
+    if budget.truncated:
+        print('Ran out of time, the playlist only has the songs found in ' + str(slo) + ' seconds')
 
     playname_id = list(range(10))
     random.shuffle(playname_id)
@@ -60,19 +46,49 @@ def make_playlist(playlist: list, preferences: dict,
     return new_playlist
 
 
+def find_songs(song_name: str, artist_name: str, graph: song_graph.GenreGraph,
+               all_songs: dict, task: Optional[gui_tasks.Task] = None) -> list:
+    """Returns the search results for a song. Songs already in the graph are searched first
+    (see catalog_search.CatalogIndex), spotipy_methods.find_track_options is only called if none of
+    them match. If task is cancelled (e.g. by a newer search) no more spotify requests are sent
+    for it."""
+    search_results = graph.get_catalog_index().search(song_name, artist_name)
+    if search_results != [] or (task is not None and task.is_cancelled()):
+        return search_results
+    search_results = spotify_methods.find_track_options(song_name, graph, all_songs,
+                                                        artist_name, prefetch_top=False)
+    if search_results != [] and (task is None or not task.is_cancelled()):
+        search_results[0].prefetch(graph, all_songs)
+    return search_results
+
+
 ###################################
 #         EVENT METHODS
 ###################################
+# These run the slow work on a worker thread (see gui_tasks) and update the window when it's done
+
+
+def start_playlist(runner: gui_tasks.TaskRunner, playlist: list, preferences: dict,
+                   graph: song_graph.GenreGraph, all_songs: dict) -> None:
+    """Generates a playlist from the song list. Clicking start again while one is being
+    generated does nothing."""
+    seeds = list(playlist)
+    prefs = dict(preferences)
+    runner.submit('make playlist', 'Generating ' + prefs['gen_mode'],
+                  lambda task: make_playlist(seeds, prefs, graph, all_songs))
+
+
 def search_song(fields: tuple[tk.Entry, tk.Entry],
                 search_res: tk.Listbox, current_result: list,
-                graph: song_graph.GenreGraph, all_songs: dict) -> None:
-    """Searches for a song and updates results list. This method calls the
-    spotipy_methods.find_track_options and loads the results into a list"""
+                graph: song_graph.GenreGraph, all_songs: dict,
+                runner: gui_tasks.TaskRunner) -> None:
+    """Searches for a song and updates results list (see find_songs). The results are loaded
+    into a list. A new search replaces one that hasn't finished yet."""
     song_name = fields[0].get()
     artist_name = fields[1].get()
-    if song_name is not None:
-        search_results = spotify_methods.find_track_options(song_name, graph,
-                                                            all_songs, artist_name)
+
+    def show_results(search_results: list) -> None:
+        """Loads the search results into the list"""
         current_result.clear()
         search_res.delete(0, search_res.size())
         if len(search_results) > 0:  # found a song
@@ -81,21 +97,43 @@ def search_song(fields: tuple[tk.Entry, tk.Entry],
                                   + search_results[i].information['artists'][0])
                 current_result.append(search_results[i])
 
+    if song_name is not None:
+        runner.submit('search', 'Searching', lambda task: find_songs(song_name, artist_name,
+                                                                     graph, all_songs, task),
+                      on_done=show_results, supersede=True)
+
 
 def add_song(search_res: tk.Listbox,
-             playlist_res: tk.Listbox, current_results: list, playlist: list) -> None:
+             playlist_res: tk.Listbox, current_results: list, playlist: list,
+             graph: song_graph.GenreGraph, all_songs: dict,
+             runner: gui_tasks.TaskRunner) -> None:
     """This method adds a song to the playlist data and listview. Given a
     selected song from the search results list, you can add the selected song
-    to your song list."""
+    to your song list.
+
+    Search results from spotify are only converted into song vertices here, when they are
+    added (results from the graph already are song vertices)."""
+
+    def add_vertex(song: Optional[song_graph.Song]) -> None:
+        """Adds the song vertex to the song list"""
+        if song is None:  # spotify doesn't know how it sounds
+            return
+        playlist_res.insert('end', song.name + " by " + song.information['artists'][0])
+        playlist.append(song)
+
     cur_selection = search_res.curselection()
     if len(cur_selection) == 0:  # nothing selected
         pass
     else:
         selected_index = cur_selection[0]
         selected_song = current_results[selected_index]
-        playlist_res.insert('end', selected_song.name + " by "
-                            + selected_song.information['artists'][0])
-        playlist.append(selected_song)
+        if isinstance(selected_song, spotify_methods.TrackCandidate):
+            runner.submit('add ' + selected_song.information['id'],
+                          'Adding ' + selected_song.name,
+                          lambda task: selected_song.to_vertex(graph, all_songs),
+                          on_done=add_vertex)
+        else:
+            add_vertex(selected_song)
 
 
 def rem_song(playlist_res: tk.Listbox, playlist: list) -> None:
@@ -112,22 +150,35 @@ def rem_song(playlist_res: tk.Listbox, playlist: list) -> None:
 
 
 def pull_playlist(name_entry: tk.Entry, playlist_res: tk.Listbox, playlist: list,
-                  graph: song_graph.GenreGraph, all_songs: dict) -> None:
+                  graph: song_graph.GenreGraph, all_songs: dict,
+                  runner: gui_tasks.TaskRunner) -> None:
     """Pulls a playlist from tethered account. You can load a whole playlist into the song
     list. This function is for ease of the user."""
     name = name_entry.get()
-    if name is None:
-        # Error Message
-        return
-    else:
-        track_list = spotify_methods.pull_playlist(name, graph, all_songs)
-        if track_list == []:
-            return
+
+    def add_batch(track_list: list[song_graph.Song]) -> None:
+        """Adds a batch of the playlist's songs to the song list"""
         for i in range(len(track_list)):
             playlist_res.insert('end', track_list[i].name + ' by '
                                 + track_list[i].information['artists'][0])
             playlist.append(track_list[i])
 
+    def load(task: gui_tasks.Task) -> None:
+        """Loads the playlist, passing on each batch as it arrives"""
+        loaded = 0
+        for track_list in spotify_methods.stream_playlist(name, graph, all_songs):
+            if task.is_cancelled():
+                return
+            loaded += len(track_list)
+            task.report(track_list, str(loaded) + ' songs')
+
+    if name is None:
+        # Error Message
+        return
+    else:
+        # songs are shown as each batch arrives instead of after the whole playlist is loaded
+        runner.submit('pull ' + name, 'Loading ' + name, load, on_progress=add_batch)
+
 
 def clear(playlist_res: tk.Listbox, playlist: list) -> None:
     """Clears songs list"""
@@ -136,7 +187,11 @@ def clear(playlist_res: tk.Listbox, playlist: list) -> None:
 
 
 def visualize(graph: song_graph.GenreGraph) -> None:
-    """This method visualizes the given graph"""
+    """This method visualizes the given graph
+
+    pygame_visualization (and pygame, networkx and plotly with it) is only imported the first time
+    this is called, so starting the GUI doesn't pay for them"""
+    import pygame_visualization
     pygame_visualization.run(graph)
 
 
@@ -180,8 +235,7 @@ def open_pref(preferences: dict) -> None:
         new_slider.set(preferences[keys[i]])
         sliders[keys[i]] = new_slider
 
-    gen_choices = {'level gen', 'custom gen', 'artist pref',
-                   'new genre', 'unique songs', 'recent songs'}
+    gen_choices = computations.GEN_MODES
     choice_var = tk.StringVar(settings_window)
     choice_var.set(preferences['gen_mode'])
 
@@ -233,6 +287,15 @@ def get_window() -> tk.Tk:
     return window
 
 
+def set_status_label(window: tk.Tk) -> tk.Label:
+    """This is a header method to put the label showing what is running in the background"""
+    status_label = tk.Label(master=window, text='', background=BG_BLACK, foreground=WHITE,
+                            anchor='w')
+    status_label.config(font=("System", 7), width=30)
+    status_label.place(relx=0.02, rely=0.06, anchor='sw')
+    return status_label
+
+
 def set_song_header(window: tk.Tk) -> tk.Label:
     """This is a header method to put the song header"""
     song_header = tk.Label(master=window, text="Songs", background=HEADER_COL)
@@ -292,14 +355,16 @@ def set_art_field(window: tk.Tk) -> tk.Entry:
 
 def set_search_btn(window: tk.Tk, fields: tuple[tk.Entry, tk.Entry],
                    search_elements: tuple[tk.Listbox, list],
-                   graph: song_graph.GenreGraph, all_songs: dict) -> None:
+                   graph: song_graph.GenreGraph, all_songs: dict,
+                   runner: gui_tasks.TaskRunner) -> None:
     """This is a header method to set the search button on the GUI"""
     search_btn = tk.Button(master=window, text='Search',
                            command=lambda: search_song(fields=(fields[0], fields[1]),
                                                        search_res=search_elements[0],
                                                        current_result=search_elements[1],
                                                        graph=graph,
-                                                       all_songs=all_songs),
+                                                       all_songs=all_songs,
+                                                       runner=runner),
                            background=SEC1_COL)
     search_btn.config(font=('System', 9), width=7)
     search_btn.place(relx=0.5, rely=0.64, anchor='s')
@@ -347,33 +412,36 @@ def set_clear_btn(window: tk.Tk, playlist_res: tk.Listbox, playlist: list) -> No
 
 def set_add_play(window: tk.Tk, name_entry: tk.Entry,
                  playlist_elements: tuple[tk.Listbox, list],
-                 graph: song_graph.GenreGraph, all_songs: dict) -> None:
+                 graph: song_graph.GenreGraph, all_songs: dict,
+                 runner: gui_tasks.TaskRunner) -> None:
     """This method sets the add playlist button on the GUI"""
     add_play = tk.Button(master=window, text='Add Playlist',
                          command=lambda:
                          pull_playlist(name_entry,
                                        playlist_elements[0], playlist=playlist_elements[1],
-                                       graph=graph, all_songs=all_songs))
+                                       graph=graph, all_songs=all_songs, runner=runner))
     add_play.config(font=('System', 9), width=10)
     add_play.place(relx=0.2, rely=0.92, anchor='s')
 
 
 def set_add_song(window: tk.Tk, search_res: tk.Listbox, playlist_res: tk.Listbox,
-                 current_results: list, playlist: list) -> None:
+                 current_results: list, playlist: list, graph: song_graph.GenreGraph,
+                 all_songs: dict, runner: gui_tasks.TaskRunner) -> None:
     """This method sets the add song button on the GUI"""
     add_song_btn = tk.Button(master=window, text='Add Song',
                              command=lambda:
-                             add_song(search_res, playlist_res, current_results, playlist))
+                             add_song(search_res, playlist_res, current_results, playlist,
+                                      graph, all_songs, runner))
     add_song_btn.config(font=('System', 9), width=9)
     add_song_btn.place(relx=0.2, rely=0.98, anchor='s')
 
 
 def set_start_btn(window: tk.Tk, playlist: list, preferences: dict, graph: song_graph.GenreGraph,
-                  all_songs: dict) -> None:
+                  all_songs: dict, runner: gui_tasks.TaskRunner) -> None:
     """This method sets the start button on the GUI"""
     start_btn = tk.Button(master=window, text='START!',
-                          command=lambda: make_playlist(playlist, preferences, graph,
-                                                        all_songs))
+                          command=lambda: start_playlist(runner, playlist, preferences, graph,
+                                                         all_songs))
     start_btn.config(font=('System', 9), width=7)
     start_btn.place(relx=0.5, rely=0.98, anchor='s')
 
@@ -387,24 +455,27 @@ def set_rem_btn(window: tk.Tk, playlist_res: tk.Listbox, playlist: list) -> None
     rem_btn.place(relx=0.8, rely=0.98, anchor='s')
 
 
-def open_tk() -> None:
-    """This method starts the GUI"""
-    thresh = float(input("Enter the threshold you would like to work with: "))
-    print("Starting Sofware with a threshold of " + str(thresh))
+def open_tk(graph: Optional[song_graph.GenreGraph] = None, all_songs: Optional[dict] = None) \
+        -> None:
+    """This method starts the GUI
+
+    If no graph is given the user is asked for a threshold and the graph is built from the data
+    files (see cli.py to start the GUI from a saved graph instead)"""
+    if graph is None or all_songs is None:
+        thresh = float(input("Enter the threshold you would like to work with: "))
+        print("Starting Sofware with a threshold of " + str(thresh))
+        graph, all_songs = song_graph.create_genre_graph(song_graph.SONG_DATA,
+                                                         song_graph.ARTIST_DATA_W_GENRES,
+                                                         song_graph.GENRE_DATA, thresh)
+        gc.freeze()  # so full garbage collections don't walk the graph, see cli.get_graph
+    graph.get_catalog_index()  # so the first search doesn't have to wait for it
     playlist = []  # song list
-    preferences = {'acousticness': 0,  # user preferences
-                   'danceability': 0,
-                   'energy': 0,
-                   'instrumentalness': 0,
-                   'key': 0,
-                   'liveness': 0,
-                   'gen_mode': 'new genre',
-                   'bias': 0}
+    preferences = dict(computations.DEFAULT_PREFERENCES)  # user preferences
     current_result = []
-    graph, all_songs = song_graph.create_genre_graph('Data/data.csv', 'Data/data_w_genres.csv',
-                                                     'Data/data_by_genres.csv', thresh)
 
     window = get_window()
+    status_label = set_status_label(window)
+    runner = gui_tasks.TaskRunner(window, lambda text: status_label.config(text=text))
     set_song_header(window)
     set_vis_btn(window, graph=graph)
     playlist_res = set_playlist_res(window)
@@ -414,22 +485,32 @@ def open_tk() -> None:
     art_field = set_art_field(window)
     search_res = set_search_res(window)
     set_search_btn(window, fields=(song_field, art_field),
-                   search_elements=(search_res, current_result), graph=graph, all_songs=all_songs)
+                   search_elements=(search_res, current_result), graph=graph, all_songs=all_songs,
+                   runner=runner)
     set_load_play_header(window)
     name_entry = set_name_entry(window)
     set_settings_btn(window, preferences=preferences)
     set_clear_btn(window, playlist_res=playlist_res, playlist=playlist)
 
     set_add_play(window, name_entry=name_entry, playlist_elements=(playlist_res, playlist),
-                 graph=graph, all_songs=all_songs)
+                 graph=graph, all_songs=all_songs, runner=runner)
     set_add_song(window, playlist_res=playlist_res, search_res=search_res,
-                 current_results=current_result, playlist=playlist)
-    set_start_btn(window, playlist, preferences, graph, all_songs)
+                 current_results=current_result, playlist=playlist, graph=graph,
+                 all_songs=all_songs, runner=runner)
+    set_start_btn(window, playlist, preferences, graph, all_songs, runner)
     set_rem_btn(window, playlist_res=playlist_res, playlist=playlist)
+
+    def close() -> None:
+        """Stops the background work and closes the window"""
+        runner.shutdown()
+        window.destroy()
+
+    window.protocol('WM_DELETE_WINDOW', close)
     window.mainloop()
 
 
-open_tk()
+if __name__ == '__main__':
+    open_tk()
 
 # if __name__ == '__main__':
 #     import python_ta.contracts
@@ -445,7 +526,7 @@ open_tk()
 #         'extra-imports': ['pygame', 'networkx', 'pygame_visualization', 'song_graph',
 #                           'computations', 'tkinter', 'spotify_methods', 'random', 'main',
 #                           'spotipy', 'spotipy.oauth2', 'main', 'graph_visualization', 'datetime',
-#                           'csv', 'plotly.graph_objects'],
+#                           'csv', 'plotly.graph_objects', 'gui_tasks', 'gc'],
 #         'generated-members': ['pygame.*'],
 #         'max-nested-blocks': 4,
 #         'allowed-io': ['genres_to_songs', 'load_genres', 'load_artists_to_genres', 'load_songs',
@@ -0,0 +1,182 @@
+"""
+Copy on write views of a genre graph, that songs can be inserted into without changing the graph
+(see OverlayGraph).
+"""
+from __future__ import annotations
+import collections
+from typing import Any, Optional
+import dedup
+import random_walks
+import song_graph
+
+
+class OverlaySong(song_graph.Song):
+    """
+    A song of a base graph as seen through an OverlayGraph: the same song, but with the edges the
+    overlay added to it. The base song itself is left untouched.
+
+    Instance attributes:
+        - base: the song in the base graph
+    """
+    base: song_graph.Song
+
+    def __init__(self, base: song_graph.Song) -> None:
+        """
+        Initialize the view of base, with no edges added yet
+        """
+        super().__init__(base.properties, base.information, base.name)
+        self.base = base
+        self.genre = base.genre
+        self.group = base.group
+        self.neighbours = collections.ChainMap({}, base.neighbours)
+
+
+class OverlaySongGraph(song_graph.SongGraph):
+    """
+    A SongGraph of an OverlayGraph: the songs of a base SongGraph plus the songs inserted into
+    the overlay. Songs and edges are only ever added to the overlay, when an edge is added to a
+    song of the base graph it is replaced (in the overlay only) by an OverlaySong.
+
+    Instance attributes:
+        - base: the song graph of the base graph
+    """
+    base: song_graph.SongGraph
+
+    def __init__(self, base: song_graph.SongGraph) -> None:
+        """
+        Initialize the overlay of base, with nothing added to it yet
+        """
+        super().__init__()
+        self.base = base
+        self.songs = collections.ChainMap({}, base.songs)
+        # sg_insert_songs replaces the rating order instead of changing it, so it can be shared
+        self.rating_order = base.get_rating_order()
+        self.threshold = base.threshold
+
+    def has_transitions(self) -> bool:
+        """Return whether the TransitionMatrix of the base graph has been worked out"""
+        return self.base.has_transitions()
+
+    def get_transitions(self) -> random_walks.TransitionMatrix:
+        """Return the TransitionMatrix of the base graph, the songs inserted into the overlay
+        aren't in it"""
+        return self.base.get_transitions()
+
+    def add_edge(self, id_1: str, id_2: str, sim_score: float) -> None:
+        """
+        Add an edge between two songs, without changing the base graph
+        """
+        added, base = self.songs.maps
+        for song_id in (id_1, id_2):
+            if song_id not in added:
+                if song_id not in base:
+                    raise ValueError
+                added[song_id] = OverlaySong(base[song_id])
+        added[id_1].neighbours[id_2] = sim_score
+        added[id_2].neighbours[id_1] = sim_score
+
+
+class OverlayGraph:
+    """
+    A copy on write view of a GenreGraph for a single request.
+
+    Songs (e.g. the seeds of a request) are inserted into the overlay instead of the base graph,
+    so the base graph is never changed: requests can share it without locking, and songs that
+    are only needed for one request are dropped along with the overlay. Copies of the songs are
+    inserted, so the songs given aren't changed either.
+
+    Everything the overlay doesn't change (e.g. get_genre_index) is taken from the base graph.
+
+    Instance attributes:
+        - base: the shared genre graph
+        - genres: maps genre name to Genre, the genres songs were inserted into are overlays of
+          the base genres (see OverlaySongGraph)
+        - all_songs: maps the Spotify id of every song in the base graph and the overlay to its
+          genre
+        - dedup_index: overlay of the base graph's DedupIndex that the groups of inserted songs
+          are added to (see DedupIndex.overlay). None until a song is inserted.
+    """
+    base: song_graph.GenreGraph
+    genres: collections.ChainMap
+    all_songs: collections.ChainMap
+    dedup_index: Optional[dedup.DedupIndex]
+
+    def __init__(self, base: song_graph.GenreGraph, all_songs: dict) -> None:
+        """
+        Initialize the overlay of base, all_songs maps every song id in base to its genre
+        """
+        self.base = base
+        self.genres = collections.ChainMap({}, base.genres)
+        self.all_songs = collections.ChainMap({}, all_songs)
+        self.dedup_index = None
+
+    def __getattr__(self, name: str) -> Any:
+        """
+        Return the attributes the overlay doesn't have from the base graph
+        """
+        return getattr(self.base, name)
+
+    def get_song(self, song: song_graph.Song) -> song_graph.Song:
+        """Retrieves a song"""
+        return self.genres[song.genre].song_graph.songs[song.information['id']]
+
+    def insert_song(self, song: song_graph.Song, thresh: Optional[float] = 0.1) -> None:
+        """
+        Insert a song into the overlay, the same way GenreGraph.insert_song inserts it into a
+        graph
+
+        Preconditions:
+            - song.information['id'] not in self.all_songs
+        """
+        self.insert_songs([song], thresh)
+
+    def get_dedup_index(self) -> dedup.DedupIndex:
+        """
+        Return the overlay's dedup index, making it if needed
+        """
+        if self.dedup_index is None:
+            self.dedup_index = self.base.get_dedup_index().overlay()
+        return self.dedup_index
+
+    def insert_songs(self, songs: list[song_graph.Song], thresh: Optional[float] = 0.1) -> None:
+        """
+        Insert copies of many songs into the overlay at once, see SongGraph.sg_insert_songs
+
+        Preconditions:
+            - none of songs is in self.all_songs, and no song is in songs twice
+        """
+        dedup_index = self.get_dedup_index()
+        copies = []
+        for song in songs:
+            copy = song_graph.Song(song.properties, song.information, song.name)
+            copy.genre = song.genre
+            dedup_index.add(copy)
+            copies.append(copy)
+        songs = copies
+        for genre_name, genre_songs in song_graph.group_by_genre(songs).items():
+            if genre_name not in self.genres.maps[0]:
+                base_genre = self.base.genres[genre_name]
+                genre = song_graph.Genre(OverlaySongGraph(base_genre.song_graph),
+                                         base_genre.average_properties, base_genre.name)
+                genre.median_properties = base_genre.median_properties
+                genre.neighbours = base_genre.neighbours
+                self.genres[genre_name] = genre
+            self.genres[genre_name].song_graph.sg_insert_songs(genre_songs, thresh)
+            for song in genre_songs:
+                self.all_songs[song.information['id']] = genre_name
+
+
+# if __name__ == '__main__':
+#     import python_ta.contracts
+#     python_ta.contracts.check_all_contracts()
+#
+#     import doctest
+#     doctest.testmod()
+#
+#     import python_ta
+#     python_ta.check_all(config={
+#         'max-line-length': 100,
+#         'disable': ['E1136'],
+#         'extra-imports': ['collections', 'dedup', 'random_walks', 'song_graph'],
+#         'max-nested-blocks': 4
+#     })
@@ -0,0 +1,90 @@
+"""
+Song graphs as matrices of random walks on them, used by the page rank generation mode (see
+computations.page_rank_gen).
+"""
+from __future__ import annotations
+import array
+import heapq
+import operator
+import song_graph
+
+# Most neighbours of a song a random walk can step to, and how much less likely a step along an
+# edge is the larger its weight (see TransitionMatrix)
+WALK_DEGREE = 32
+WALK_SMOOTHING = 0.01
+
+
+def walk_steps(song: song_graph.Song) -> list[tuple[str, float]]:
+    """
+    Return the songs a random walk at song may step to, with how likely (in proportion) each step
+    is: its WALK_DEGREE closest neighbours, each with 1 / (weight + WALK_SMOOTHING)
+    """
+    neighbours = song.neighbours
+    if len(neighbours) > WALK_DEGREE:
+        steps = heapq.nsmallest(WALK_DEGREE, neighbours.items(), key=operator.itemgetter(1))
+    else:
+        steps = neighbours.items()
+    return [(other_id, 1 / (weight + WALK_SMOOTHING)) for other_id, weight in steps]
+
+
+class TransitionMatrix:
+    """
+    A song graph as the matrix of a random walk on it, in compressed sparse row form: a walk at
+    song i steps to song columns[k] with chance chances[k], for k from starts[i] up to (not
+    including) starts[i + 1].
+
+    A walk steps to one of the WALK_DEGREE closest neighbours of the song it is at (fewer edges
+    than that don't change the walk much, and keep the matrix small for dense genres), with a
+    chance proportional to 1 / (weight + WALK_SMOOTHING). A song with no neighbours has an empty
+    row.
+
+    Instance attributes:
+        - ids: the id of every song, ids[i] is the song of row / column i
+        - positions: maps song id to its row
+        - starts: where the row of every song starts in columns and chances, and where it ends
+        - columns: the songs a walk can step to, row by row
+        - chances: the chance of each step, row by row
+
+    Representation invariants:
+        - len(self.starts) == len(self.ids) + 1
+        - len(self.columns) == len(self.chances) == self.starts[-1]
+    """
+    ids: list[str]
+    positions: dict[str, int]
+    starts: array.array
+    columns: array.array
+    chances: array.array
+
+    def __init__(self, songs: dict[str, song_graph.Song]) -> None:
+        """
+        Initialize the matrix from a mapping of song id to Song, like SongGraph.songs
+        """
+        self.ids = list(songs)
+        self.positions = {song_id: i for i, song_id in enumerate(self.ids)}
+        self.starts = array.array('l', [0])
+        self.columns = array.array('l')
+        self.chances = array.array('d')
+        for song_id in self.ids:
+            steps = [(self.positions[other_id], affinity)
+                     for other_id, affinity in walk_steps(songs[song_id])
+                     if other_id in self.positions]
+            total = sum(affinity for _, affinity in steps)
+            self.columns.extend(column for column, _ in steps)
+            self.chances.extend(affinity / total for _, affinity in steps)
+            self.starts.append(len(self.columns))
+
+
+# if __name__ == '__main__':
+#     import python_ta.contracts
+#     python_ta.contracts.check_all_contracts()
+#
+#     import doctest
+#     doctest.testmod()
+#
+#     import python_ta
+#     python_ta.check_all(config={
+#         'max-line-length': 100,
+#         'disable': ['E1136'],
+#         'extra-imports': ['array', 'heapq', 'operator', 'song_graph'],
+#         'max-nested-blocks': 4
+#     })
@@ -0,0 +1,397 @@
+"""
+HTTP recommendation service. Serves recommendations from a genre graph that is loaded (or built)
+once, so other services don't have to go through the GUI.
+
+Endpoints:
+    - POST /recommend   body: {"seeds": [spotify ids], "gen_mode": "level gen",
+                               "bias": 0.5, "preferences": {"energy": 80, ...},
+                               "filter": {"explicit": false, "years": [1990, 2005],
+                                          "min_popularity": 50, "modes": [1], "keys": [0, 7]},
+                               "time_limit": 1.5}
+                        returns {"songs": [song, ...], "missing": [ids not in the graph],
+                                 "truncated": whether the time limit cut the search short}
+    - POST /songs       body: {"songs": [song, ...]} with songs formatted like
+                              catalog_delta.song_to_json
+                        queues the songs that aren't in the graph yet to be inserted into it,
+                        returns {"queued": number of songs queued, "version": graph version}
+    - GET /songs/<id>   returns the song with the given Spotify id
+    - GET /stats        returns the size and version of the graph and the request counts
+
+A playlist may take the service's slo (or the request's time_limit, if that is lower) seconds to
+generate, after that the best one found so far is sent back.
+
+Only seeds that are already in the graph are used, so nothing here talks to Spotify. The graph is
+kept in a graph_store.GraphStore, so songs added with POST /songs while the service runs show up
+in later requests (once their batch is applied) without disturbing the ones running.
+
+Start it with 'python cli.py serve'.
+"""
+import asyncio
+import concurrent.futures
+import json
+import logging
+import math
+import time
+from typing import Any, Optional, Tuple
+import catalog_delta
+import computations
+import graph_store
+import song_filters
+import song_graph
+
+LOGGER = logging.getLogger('dotify.service')
+
+MAX_BODY = 1024 * 1024
+DEFAULT_SLO = 2.0
+STATUS_TEXT = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+               413: 'Payload Too Large', 500: 'Internal Server Error'}
+
+
+class HTTPError(Exception):
+    """Raised while handling a request to send an error response back
+
+    Instance attributes:
+        - status: HTTP status code of the response
+        - message: explanation sent back with the response
+    """
+    status: int
+    message: str
+
+    def __init__(self, status: int, message: str) -> None:
+        """Initialize the error with the response status code and message"""
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def song_to_json(song: song_graph.Song) -> dict:
+    """Return the information about song that is sent back to clients"""
+    return {'id': song.information['id'],
+            'name': song.name,
+            'artists': song.information['artists'],
+            'genre': song.genre,
+            'year': song.information['release_date'].year,
+            'popularity': song.information['popularity']}
+
+
+def get_song_filter(record: Any) -> song_filters.SongFilter:
+    """Return the song filter of the "filter" object of a /recommend request body"""
+    if not isinstance(record, dict):
+        raise HTTPError(400, 'filter must be an object')
+    try:
+        modes, keys, years = record.get('modes'), record.get('keys'), record.get('years')
+        min_popularity = record.get('min_popularity')
+        return song_filters.SongFilter(
+            bool(record.get('explicit', True)),
+            None if modes is None else [int(mode) for mode in modes],
+            None if keys is None else [int(key) for key in keys],
+            None if years is None else (int(years[0]), int(years[1])),
+            None if min_popularity is None else float(min_popularity))
+    except (TypeError, ValueError, IndexError, KeyError):
+        raise HTTPError(400, 'filter must be like {"explicit": false, "years": [1990, 2005], '
+                             '"min_popularity": 50, "modes": [1], "keys": [0, 7]}')
+
+
+def get_bias(value: Any) -> Optional[float]:
+    """Return the "bias" of a /recommend request body, a number from 0 to 1 or null"""
+    if value is None:
+        return None
+    try:
+        bias = float(value)
+    except (TypeError, ValueError):
+        bias = -1.0
+    if not 0 <= bias <= 1:
+        raise HTTPError(400, 'bias must be a number from 0 to 1, or null')
+    return bias
+
+
+def get_time_limit(value: Any) -> float:
+    """Return the "time_limit" of a /recommend request body, a positive number of seconds"""
+    try:
+        time_limit = float(value)
+    except (TypeError, ValueError):
+        time_limit = -1.0
+    if isinstance(value, bool) or not (math.isfinite(time_limit) and time_limit > 0):
+        raise HTTPError(400, 'time_limit must be a positive number of seconds')
+    return time_limit
+
+
+def get_preference(key: str, value: Any) -> int:
+    """Return a value of the "preferences" object of a /recommend request body, a whole number
+    from 0 to 100 like the GUI's sliders"""
+    try:
+        preference = int(value)
+    except (TypeError, ValueError, OverflowError):
+        preference = -1
+    if isinstance(value, bool) or not 0 <= preference <= 100:
+        raise HTTPError(400, 'preference ' + key + ' must be a number from 0 to 100')
+    return preference
+
+
+def get_new_song(record: Any, genres: dict) -> song_graph.Song:
+    """Return the song of an item of the "songs" list of a POST /songs request body, genres are
+    the genres of the graph it is inserted into"""
+    try:
+        song = catalog_delta.song_from_json(record)
+        valid = song.genre in genres and isinstance(song.information['id'], str) \
+            and song.properties.keys() == song_graph.PROPERTIES \
+            and all(isinstance(value, (int, float)) and not isinstance(value, bool)
+                    for value in song.properties.values()) \
+            and song_graph.INFORMATION <= song.information.keys()
+    except (TypeError, ValueError, KeyError, AttributeError):
+        valid = False
+    if not valid:
+        raise HTTPError(400, 'songs must be formatted like catalog_delta.song_to_json, with '
+                             'every property and piece of information, in a genre of the graph')
+    return song
+
+
+def parse_body(body: bytes) -> dict:
+    """Return the json object of a request body"""
+    try:
+        request = json.loads(body or b'{}')
+    except ValueError:
+        raise HTTPError(400, 'body must be json')
+    if not isinstance(request, dict):
+        raise HTTPError(400, 'body must be a json object')
+    return request
+
+
+def route_name(path: str) -> str:
+    """Return the name requests to path are counted under, the same for every song id so the
+    counts don't grow with the requests"""
+    if path.startswith('/songs/'):
+        return '/songs/<id>'
+    elif path in {'/recommend', '/songs', '/stats'}:
+        return path
+    return 'other'
+
+
+class RecommendationService:
+    """
+    Serves recommendations over HTTP from a genre graph.
+
+    Generating a playlist can take a long time (e.g. the 'new genre' mode looks at every genre) so
+    it is run on a thread pool, which keeps the event loop free to accept other requests. At most
+    max_concurrent playlists are generated at once, the rest wait their turn.
+
+    Instance attributes:
+        - store: the genre graph recommendations are made from, every request uses the version
+          that was current when it started
+        - executor: thread pool playlists are generated on
+        - requests_served: number of requests handled so far, by route (see route_name)
+        - slo: the most seconds generating a playlist may take
+    """
+    store: graph_store.GraphStore
+    executor: concurrent.futures.ThreadPoolExecutor
+    requests_served: dict[str, int]
+    slo: float
+    _limit: Optional[asyncio.Semaphore]
+    _max_concurrent: int
+
+    def __init__(self, graph: song_graph.GenreGraph, all_songs: dict, max_concurrent: int = 4,
+                 workers: Optional[int] = None, slo: float = DEFAULT_SLO) -> None:
+        """Initialize the service, the thread pool has max_concurrent threads unless workers
+        is given"""
+        self.store = graph_store.GraphStore(graph, all_songs)
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers or
+                                                              max_concurrent)
+        self.requests_served = {}
+        self.slo = slo
+        self._max_concurrent = max_concurrent
+        self._limit = None
+
+    def get_song(self, song_id: str, snapshot: Optional[graph_store.Snapshot] = None) \
+            -> Optional[song_graph.Song]:
+        """Return the song vertex with the given id, or None if it isn't in the graph. The
+        current version of the graph is used unless snapshot is given."""
+        graph, all_songs, _ = snapshot or self.store.snapshot()
+        if song_id not in all_songs:
+            return None
+        return graph.genres[all_songs[song_id]].song_graph.songs.get(song_id)
+
+    def stats(self) -> dict:
+        """Return the size of the graph and how many requests have been served"""
+        graph, all_songs, version = self.store.snapshot()
+        return {'genres': len(graph.genres),
+                'songs': len(all_songs),
+                'genre_edges': sum(len(genre.neighbours)
+                                   for genre in graph.genres.values()) // 2,
+                'version': version,
+                'requests': dict(self.requests_served)}
+
+    def recommend(self, body: dict) -> dict:
+        """Generate a playlist for a /recommend request body. This is run on the executor."""
+        preferences = dict(computations.DEFAULT_PREFERENCES)
+        preferences['gen_mode'] = body.get('gen_mode', 'level gen')
+        if preferences['gen_mode'] not in computations.GEN_MODES:
+            raise HTTPError(400, 'gen_mode must be one of ' + ', '.join(computations.GEN_MODES))
+        preferences['bias'] = get_bias(body.get('bias', 0))
+        if not isinstance(body.get('preferences', {}), dict):
+            raise HTTPError(400, 'preferences must be an object')
+        for key, value in body.get('preferences', {}).items():
+            if key not in preferences or list(preferences).index(key) > 5:
+                raise HTTPError(400, 'unknown preference ' + str(key))
+            preferences[key] = get_preference(key, value)
+
+        song_filter = get_song_filter(body.get('filter', {}))
+        time_limit = min(get_time_limit(body.get('time_limit', self.slo)), self.slo)
+        snapshot = self.store.snapshot()
+        seeds, missing = [], []
+        for song_id in body.get('seeds', []):
+            song = self.get_song(song_id, snapshot)
+            if song is None:
+                missing.append(song_id)
+            else:
+                seeds.append(song)
+
+        budget = computations.Budget(time_limit)
+        songs = computations.recommend(snapshot.graph, snapshot.all_songs, seeds, preferences,
+                                       song_filter, budget)
+        return {'songs': [song_to_json(song) for song in songs], 'missing': missing,
+                'truncated': budget.truncated}
+
+    def add_songs(self, records: list) -> dict:
+        """Queue the songs of a POST /songs request body that aren't in the graph yet to be
+        inserted into it. This is run on the executor, as a full batch is applied right away."""
+        snapshot = self.store.snapshot()
+        songs = {}
+        for record in records:
+            song = get_new_song(record, snapshot.graph.genres)
+            if song.information['id'] not in snapshot.all_songs:
+                songs[song.information['id']] = song
+        self.store.insert_many(list(songs.values()))
+        return {'queued': len(songs), 'version': self.store.version}
+
+    async def route(self, method: str, path: str, body: bytes) -> Any:
+        """Handle a request and return the json response"""
+        if path == '/recommend':
+            if method != 'POST':
+                raise HTTPError(405, 'use POST')
+            request = parse_body(body)
+            if not isinstance(request.get('seeds', []), list):
+                raise HTTPError(400, 'body must be an object with a list of seeds')
+            async with self._limit:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self.executor, self.recommend, request)
+        elif path == '/songs':
+            if method != 'POST':
+                raise HTTPError(405, 'use POST')
+            request = parse_body(body)
+            if not isinstance(request.get('songs'), list):
+                raise HTTPError(400, 'body must be an object with a list of songs')
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, self.add_songs, request['songs'])
+        elif method != 'GET':
+            raise HTTPError(405, 'use GET')
+        elif path.startswith('/songs/'):
+            song = self.get_song(path[len('/songs/'):])
+            if song is None:
+                raise HTTPError(404, 'no song with that id')
+            return song_to_json(song)
+        elif path == '/stats':
+            return self.stats()
+        raise HTTPError(404, 'unknown path ' + path)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Read one request from the connection, answer it and close the connection"""
+        start = time.perf_counter()
+        method, path, status = '-', '-', 500
+        try:
+            method, path, body = await read_request(reader)
+            response = await self.route(method, path.split('?')[0], body)
+            status = 200
+        except HTTPError as error:
+            status, response = error.status, {'error': error.message}
+        except (asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+            return
+        except Exception:  # anything else is a bug, but the server should keep running
+            LOGGER.exception('error handling %s %s', method, path)
+            response = {'error': 'internal error'}
+
+        data = json.dumps(response).encode()
+        writer.write(('HTTP/1.1 ' + str(status) + ' ' + STATUS_TEXT.get(status, '') + '\r\n'
+                      + 'Content-Type: application/json\r\n'
+                      + 'Content-Length: ' + str(len(data)) + '\r\n'
+                      + 'Connection: close\r\n\r\n').encode() + data)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        writer.close()
+
+        route = route_name(path.split('?')[0])
+        self.requests_served[route] = self.requests_served.get(route, 0) + 1
+        LOGGER.info('%s %s %d %.1fms', method, path, status, (time.perf_counter() - start) * 1000)
+
+    async def start(self, host: str = '127.0.0.1', port: int = 8000) -> asyncio.AbstractServer:
+        """Start listening for requests and return the server"""
+        self._limit = asyncio.Semaphore(self._max_concurrent)
+        return await asyncio.start_server(self.handle, host, port)
+
+
+async def read_request(reader: asyncio.StreamReader) -> Tuple[str, str, bytes]:
+    """Read a HTTP request and return its method, path and body"""
+    request_line = (await reader.readline()).decode('latin-1').split()
+    if len(request_line) != 3:
+        raise HTTPError(400, 'bad request line')
+    method, path, _ = request_line
+
+    length = 0
+    while True:
+        line = (await reader.readline()).decode('latin-1').strip()
+        if line == '':
+            break
+        name, _, value = line.partition(':')
+        if name.strip().lower() == 'content-length':
+            if not value.strip().isdigit():
+                raise HTTPError(400, 'bad content length')
+            length = int(value)
+    if length > MAX_BODY:
+        raise HTTPError(413, 'body too large')
+
+    body = await reader.readexactly(length) if length > 0 else b''
+    return method.upper(), path, body
+
+
+async def call(host: str, port: int, method: str, path: str,
+               body: Optional[dict] = None) -> Tuple[int, Any]:
+    """Send a request to a running service and return the status code and json response.
+    Used for benchmarking and trying the service out locally."""
+    reader, writer = await asyncio.open_connection(host, port)
+    data = b'' if body is None else json.dumps(body).encode()
+    writer.write((method + ' ' + path + ' HTTP/1.1\r\nHost: ' + host + '\r\n'
+                  + 'Content-Length: ' + str(len(data)) + '\r\n\r\n').encode() + data)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+
+    head, _, payload = response.partition(b'\r\n\r\n')
+    return int(head.split()[1]), json.loads(payload)
+
+
+async def serve_forever(service: RecommendationService, host: str, port: int) -> None:
+    """Run the service until cancelled"""
+    server = await service.start(host, port)
+    LOGGER.info('serving on %s:%d', host, port)
+    async with server:
+        await server.serve_forever()
+
+
+# if __name__ == '__main__':
+#     import python_ta.contracts
+#     python_ta.contracts.check_all_contracts()
+#
+#     import doctest
+#     doctest.testmod()
+#
+#     import python_ta
+#     python_ta.check_all(config={
+#         'max-line-length': 100,
+#         'disable': ['E1136'],
+#         'extra-imports': ['song_graph', 'computations', 'graph_store', 'asyncio',
+#                           'concurrent.futures', 'json', 'logging', 'time', 'catalog_delta',
+#                           'math', 'song_filters'],
+#         'max-nested-blocks': 4
+#     })
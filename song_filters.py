@@ -0,0 +1,259 @@
+"""
+Filters on the attributes of songs (explicit, mode, key, release year and popularity), and the
+bitmap indexes of the songs of every genre that searches apply them with.
+"""
+from __future__ import annotations
+from typing import Iterable, Optional
+import song_graph
+
+# Widths of the release year and popularity buckets of FilterIndex
+YEAR_BUCKET = 5
+POPULARITY_BUCKET = 10
+
+
+class SongFilter:
+    """
+    Constraints on the songs a search may return, e.g. no explicit songs, released from 1990 to
+    2005, a popularity of at least 50 or major mode only. Searches don't call allows on every
+    song, they look the songs a filter allows up in the FilterIndex of the graph.
+
+    Instance attributes:
+        - explicit: whether explicit songs are allowed
+        - modes: the modes allowed (see Song), None for any
+        - keys: the keys allowed, None for any
+        - years: the first and last release year allowed, None for any
+        - min_popularity: the lowest popularity allowed, None for any
+    """
+    explicit: bool
+    modes: Optional[frozenset[int]]
+    keys: Optional[frozenset[int]]
+    years: Optional[tuple[int, int]]
+    min_popularity: Optional[float]
+
+    def __init__(self, explicit: bool = True, modes: Optional[Iterable[int]] = None,
+                 keys: Optional[Iterable[int]] = None, years: Optional[tuple[int, int]] = None,
+                 min_popularity: Optional[float] = None) -> None:
+        """Initialize the filter, by default it allows every song"""
+        self.explicit = explicit
+        self.modes = None if modes is None else frozenset(modes)
+        self.keys = None if keys is None else frozenset(keys)
+        self.years = years
+        self.min_popularity = min_popularity
+
+    def is_empty(self) -> bool:
+        """Return whether the filter allows every song"""
+        return self.explicit and self.modes is None and self.keys is None \
+            and self.years is None and self.min_popularity is None
+
+    def allows(self, song: song_graph.Song) -> bool:
+        """Return whether song passes the filter"""
+        if not self.explicit and song.information['explicit']:
+            return False
+        elif self.modes is not None and song.properties['mode'] not in self.modes:
+            return False
+        elif self.keys is not None and song.properties['key'] not in self.keys:
+            return False
+        elif self.years is not None \
+                and not self.years[0] <= song.information['release_date'].year <= self.years[1]:
+            return False
+        return self.min_popularity is None \
+            or song.information['popularity'] >= self.min_popularity
+
+
+def bitmap_positions(bitmap: int, size: int) -> Iterable[int]:
+    """Return the positions of the set bits of bitmap (of size bits), from lowest to highest.
+    The bitmap is read a byte at a time, as taking the lowest bit off a large int copies it.
+
+    >>> list(bitmap_positions(0b100101, 6))
+    [0, 2, 5]
+    """
+    for index, byte in enumerate(bitmap.to_bytes((size + 7) // 8, 'little')):
+        if byte != 0:
+            for bit in range(8):
+                if byte >> bit & 1:
+                    yield index * 8 + bit
+
+
+class FilterIndex:
+    """
+    Bitmaps of the songs of every genre by whether they are explicit, their mode, their key, their
+    release year (in buckets of YEAR_BUCKET years) and their popularity (in buckets of
+    POPULARITY_BUCKET), so the songs of a genre a SongFilter allows are found with a few ands and
+    ors of ints instead of by looking at every song.
+
+    The songs of a genre are numbered in the order of its song graph when the genre is first
+    looked up, and bit i of a bitmap is set if song i has the value (or a value in the bucket) of
+    the bitmap. Only the songs in the buckets at the ends of a range of years or popularities are
+    checked one by one. Songs inserted after the genre is looked up aren't in the bitmaps, see
+    SongMatcher for how they are filtered.
+
+    Instance attributes:
+        - genres: maps genre name to Genre, the genres of the graph the index is for
+    """
+    genres: dict[str, song_graph.Genre]
+    _ids: dict[str, tuple[str, ...]]
+    _positions: dict[str, dict[str, int]]
+    _bitmaps: dict[str, dict[tuple[str, int], int]]
+
+    def __init__(self, genres: dict[str, song_graph.Genre]) -> None:
+        """
+        Initialize the index from a mapping of genre name to Genre
+        """
+        self.genres = genres
+        self._ids = {}
+        self._positions = {}
+        self._bitmaps = {}
+
+    def bitmaps(self, genre: str) -> dict[tuple[str, int], int]:
+        """
+        Return the bitmaps of genre, mapping (attribute, value) to the bitmap of the songs with
+        that value. The values of 'year' and 'popularity' are bucket numbers (value // width).
+        """
+        if genre not in self._bitmaps:
+            ids = tuple(self.genres[genre].song_graph.songs)
+            songs = self.genres[genre].song_graph.songs
+            bitmaps = {}
+            for position, song_id in enumerate(ids):
+                song = songs[song_id]
+                bit = 1 << position
+                for key in [('explicit', int(song.information['explicit'])),
+                            ('mode', int(song.properties['mode'])),
+                            ('key', int(song.properties['key'])),
+                            ('year', song.information['release_date'].year // YEAR_BUCKET),
+                            ('popularity',
+                             int(song.information['popularity'] // POPULARITY_BUCKET))]:
+                    bitmaps[key] = bitmaps.get(key, 0) | bit
+            self._ids[genre] = ids
+            self._positions[genre] = {song_id: position for position, song_id in enumerate(ids)}
+            self._bitmaps[genre] = bitmaps
+        return self._bitmaps[genre]
+
+    def ids(self, genre: str) -> tuple[str, ...]:
+        """Return the ids of the songs of genre in the order they are numbered in its bitmaps"""
+        self.bitmaps(genre)
+        return self._ids[genre]
+
+    def position(self, genre: str, song_id: str) -> Optional[int]:
+        """Return the number of the song with song_id in the bitmaps of genre, or None if it
+        isn't in them"""
+        self.bitmaps(genre)
+        return self._positions[genre].get(song_id)
+
+    def allowed(self, genre: str, song_filter: SongFilter) -> int:
+        """Return the bitmap of the songs of genre song_filter allows"""
+        bitmaps = self.bitmaps(genre)
+        allowed = (1 << len(self._ids[genre])) - 1
+        if not song_filter.explicit:
+            allowed &= bitmaps.get(('explicit', 0), 0)
+        for attribute, values in [('mode', song_filter.modes), ('key', song_filter.keys)]:
+            if values is not None:
+                either = 0
+                for value in values:
+                    either |= bitmaps.get((attribute, value), 0)
+                allowed &= either
+        if song_filter.years is not None:
+            allowed &= self._in_range(genre, 'year', YEAR_BUCKET, song_filter)
+        if song_filter.min_popularity is not None:
+            allowed &= self._in_range(genre, 'popularity', POPULARITY_BUCKET, song_filter)
+        return allowed
+
+    def _in_range(self, genre: str, attribute: str, width: int, song_filter: SongFilter) -> int:
+        """Return the bitmap of the songs of genre whose year (or popularity) is in the range
+        song_filter allows: the buckets inside the range, and the songs of the buckets at its ends
+        that song_filter allows"""
+        if attribute == 'year':
+            low, high = song_filter.years
+        else:
+            low, high = song_filter.min_popularity, float('inf')
+        songs = self.genres[genre].song_graph.songs
+        ids = self._ids[genre]
+        size = len(ids)
+        in_range = 0
+        for (other, bucket), bitmap in self._bitmaps[genre].items():
+            if other != attribute or bucket * width > high or (bucket + 1) * width <= low:
+                continue
+            elif low <= bucket * width and (bucket + 1) * width - 1 <= high:
+                in_range |= bitmap
+            else:
+                for position in bitmap_positions(bitmap, size):
+                    song = songs[ids[position]]
+                    value = song.information['release_date'].year if attribute == 'year' \
+                        else song.information['popularity']
+                    if low <= value <= high:
+                        in_range |= 1 << position
+        return in_range
+
+    def matcher(self, song_filter: Optional[SongFilter]) -> SongMatcher:
+        """Return a SongMatcher for the songs song_filter allows (every song if it is None)"""
+        return SongMatcher(self, song_filter)
+
+
+class SongMatcher:
+    """
+    The songs a SongFilter allows, for one search. The bitmap of the songs a genre allows is
+    worked out from the FilterIndex the first time the search reaches the genre, so a song is
+    checked by testing its bit. Songs that aren't in the bitmaps (inserted since the index looked
+    the genre up) are checked with SongFilter.allows.
+
+    Instance attributes:
+        - index: the FilterIndex of the graph being searched
+        - song_filter: the filter, None if every song is allowed
+    """
+    index: FilterIndex
+    song_filter: Optional[SongFilter]
+    _allowed: dict[str, tuple[int, bytes]]
+
+    def __init__(self, index: FilterIndex, song_filter: Optional[SongFilter]) -> None:
+        """Initialize the matcher, an empty filter is treated like None"""
+        self.index = index
+        self.song_filter = None if song_filter is None or song_filter.is_empty() else song_filter
+        self._allowed = {}
+
+    def _genre_allowed(self, genre: str) -> tuple[int, bytes]:
+        """Return the bitmap of the songs of genre the filter allows, as an int and as bytes"""
+        if genre not in self._allowed:
+            allowed = self.index.allowed(genre, self.song_filter)
+            size = len(self.index.ids(genre))
+            self._allowed[genre] = (allowed, allowed.to_bytes((size + 7) // 8, 'little'))
+        return self._allowed[genre]
+
+    def allows(self, song: song_graph.Song) -> bool:
+        """Return whether song passes the filter"""
+        if self.song_filter is None:
+            return True
+        allowed = self._genre_allowed(song.genre)[1]
+        position = self.index.position(song.genre, song.information['id'])
+        if position is None:
+            return self.song_filter.allows(song)
+        return allowed[position >> 3] >> (position & 7) & 1 == 1
+
+    def song_ids(self, genre: str, songs: dict[str, song_graph.Song]) -> list[str]:
+        """Return the ids of the songs of genre the filter allows, songs being the songs of genre
+        in the graph searched (which can have songs the graph of the index doesn't, see
+        graph_store.apply_batch)"""
+        if self.song_filter is None:
+            return list(songs)
+        ids = self.index.ids(genre)
+        allowed = [ids[position]
+                   for position in bitmap_positions(self._genre_allowed(genre)[0], len(ids))]
+        if len(songs) != len(ids):
+            allowed.extend(song_id for song_id, song in songs.items()
+                           if self.index.position(genre, song_id) is None
+                           and self.song_filter.allows(song))
+        return allowed
+
+
+# if __name__ == '__main__':
+#     import python_ta.contracts
+#     python_ta.contracts.check_all_contracts()
+#
+#     import doctest
+#     doctest.testmod()
+#
+#     import python_ta
+#     python_ta.check_all(config={
+#         'max-line-length': 100,
+#         'disable': ['E1136'],
+#         'extra-imports': ['song_graph'],
+#         'max-nested-blocks': 4
+#     })
@@ -1,14 +1,31 @@
 """
 Song graph and related methods
+
+The indexes a GenreGraph keeps are in modules of their own: genre_distances, bridges,
+song_filters, catalog_search, dedup and random_walks. Overlays of a graph are in overlays, and
+saving and loading graphs is in graph_io.
 """
 from __future__ import annotations
+import bisect
+import collections
 import csv
 import datetime
-from typing import Union, Tuple, Optional
+from typing import Any, Callable, Mapping, Optional, Tuple, Union
+import bridges
+import catalog_search
+import dedup
+import genre_distances
+import random_walks
+import song_filters
 
 SONG_DATA = 'Data/data.csv'
 ARTIST_DATA_W_GENRES = 'Data/data_w_genres.csv'
 GENRE_DATA = 'Data/data_by_genres.csv'
+GRAPH_DATA = 'Data/graph.pickle'
+
+# Memory one edge of a song graph takes (an entry in the neighbours of both songs and the weight),
+# in bytes, as measured with tracemalloc
+EDGE_BYTES = 85
 
 PROPERTIES = {'acousticness', 'danceability', 'energy', 'instrumentalness', 'key', 'mode',
               'liveness', 'loudness', 'speechiness', 'tempo', 'valence'}
@@ -43,6 +60,9 @@ class Song:
             classify the song. See below for specifics
         - neighbours: add desc
         - name: name of the song, (this is in properties but is convenient to have nonetheless)
+        - genre: the genre the song is in, set when it is given one
+        - group: songs with the same group are the same recording (see DedupIndex), set when the
+          song is put in a graph
 
     Properties includes:
         - acousticness: relative measure of how acoustic a track is
@@ -82,6 +102,7 @@ class Song:
     neighbours: dict[str, Union[int, float]]
     name: str
     genre: str
+    group: int
 
     def __init__(self, properties: dict[str, Union[int, float]],
                  information: dict[str, Union[str, int, float, datetime.datetime, list[str]]],
@@ -108,14 +129,29 @@ class SongGraph:
 
     Instance attributes:
         _songs: maps spotify ID to song
+        rating_order: (rating, id) of every song, sorted. None until it is first needed
+        threshold: the threshold the graph was made with (see create_song_graph), None if it
+          wasn't made by create_song_graph
+        transitions: the graph as a matrix of random walk steps, see
+          random_walks.TransitionMatrix. None until it is first needed (and whenever songs are
+          added or removed)
+
+    Representation invariants:
+        - self.rating_order is None or len(self.rating_order) == len(self.songs)
     """
     songs: dict[str, Song]
+    rating_order: Optional[list[tuple[float, str]]]
+    threshold: Optional[float]
+    transitions: Optional[random_walks.TransitionMatrix]
 
     def __init__(self) -> None:
         """
         init for SongGraph
         """
         self.songs = {}
+        self.rating_order = None
+        self.threshold = None
+        self.transitions = None
 
     def add_song(self, song: Song) -> None:
         """
@@ -123,6 +159,7 @@ class SongGraph:
         """
         spotify_id = song.information['id']
         self.songs[spotify_id] = song
+        self.transitions = None
 
     def add_edge(self, id_1: str, id_2: str, sim_score: float) -> None:
         """
@@ -148,16 +185,81 @@ class SongGraph:
             return self.songs[song_id]
         return None
 
-    def sg_insert_song(self, song: Song, thresh: float = 0.1) -> None:
+    def remove_songs(self, song_ids: list[str]) -> None:
+        """
+        Remove songs (and their edges) from the graph
+
+        Preconditions:
+            - all(song_id in self.songs for song_id in song_ids)
+        """
+        for song_id in song_ids:
+            song = self.songs.pop(song_id)
+            for other_id in song.neighbours:
+                if other_id in self.songs:
+                    self.songs[other_id].neighbours.pop(song_id, None)
+        if self.rating_order is not None:
+            removed = set(song_ids)
+            self.rating_order = [pair for pair in self.rating_order if pair[1] not in removed]
+        self.transitions = None
+
+    def get_rating_order(self) -> list[tuple[float, str]]:
+        """Return the (rating, id) of every song sorted by rating, working it out if needed"""
+        if self.rating_order is None:
+            self.rating_order = sorted((get_song_rating(song), song_id)
+                                       for song_id, song in self.songs.items())
+        return self.rating_order
+
+    def has_transitions(self) -> bool:
+        """Return whether the TransitionMatrix of the graph has been worked out"""
+        return self.transitions is not None
+
+    def get_transitions(self) -> random_walks.TransitionMatrix:
+        """Return the TransitionMatrix of the graph, working it out if needed"""
+        if self.transitions is None:
+            self.transitions = random_walks.TransitionMatrix(self.songs)
+        return self.transitions
+
+    def sg_insert_song(self, song: Song, thresh: Optional[float] = 0.1) -> None:
         """This method inserts a song into the graph. Assume its not already here"""
-        self.add_song(song)
-        rating = get_song_rating(song)
-        for other_song in self.songs:
-            if self.songs[other_song].information['id'] != song.information['id']:
-                other_rating = get_song_rating(self.songs[other_song])
-                if other_rating - rating <= thresh:
-                    self.add_edge(song.information['id'], self.songs[other_song].information['id'],
-                                  abs(other_rating - rating))
+        self.sg_insert_songs([song], thresh)
+
+    def sg_insert_songs(self, songs: list[Song], thresh: Optional[float] = 0.1) -> None:
+        """
+        Insert songs into the graph, connecting each of them to every song (already in the graph
+        or being inserted) whose rating is within thresh of its own, like inserting them one by
+        one with sg_insert_song. If thresh is None the threshold the graph was made with is used.
+
+        The new songs are sorted by rating and merged into the rating order of the graph, then
+        each new song only looks at the songs next to it in that order, so this takes about
+        len(self.songs) + len(songs) * log(len(songs)) steps plus one per edge added, instead of
+        len(self.songs) steps for every song.
+
+        Preconditions:
+            - none of songs is already in the graph, and no song is in songs twice
+            - thresh is not None or self.threshold is not None
+        """
+        if thresh is None:
+            thresh = self.threshold
+        new = sorted((get_song_rating(song), song.information['id']) for song in songs)
+        # sorted finds the two sorted runs and merges them in one pass
+        order = sorted(self.get_rating_order() + new)
+        for song in songs:
+            self.add_song(song)
+
+        new_ids = {song_id for _, song_id in new}
+        for position, (rating, song_id) in enumerate(order):
+            if song_id in new_ids:
+                other = position + 1
+                while other < len(order) and order[other][0] - rating <= thresh:
+                    self.add_edge(song_id, order[other][1], order[other][0] - rating)
+                    other += 1
+                other = position - 1
+                while other >= 0 and rating - order[other][0] <= thresh:
+                    if order[other][1] not in new_ids:  # edges between new songs are added above
+                        self.add_edge(song_id, order[other][1], rating - order[other][0])
+                    other -= 1
+        self.rating_order = order
+        self.transitions = None
 
 
 class Genre:
@@ -202,14 +304,40 @@ class GenreGraph:
 
     Instance attributes:
         - _genres maps genre name to Genre object
+        - genre_index: precomputed distances between genres, see genre_distances.GenreIndex. None
+          until it is first needed (and whenever a genre is added)
+        - catalog_index: index for searching the songs of the graph by name and artist, see
+          catalog_search.CatalogIndex. None until it is first needed (and whenever a genre is
+          added)
+        - bridge_index: the most similar songs of neighbouring genres, see bridges.BridgeIndex.
+          None until it is first needed (and whenever a genre or genre edge is added)
+        - filter_index: bitmaps of the songs of every genre by their attributes, see
+          song_filters.FilterIndex. None until it is first needed (and whenever a genre is added)
+        - dedup_index: groups of songs that are the same recording, see dedup.DedupIndex. None
+          until it is first needed (and whenever a genre is added), it is built with the graph by
+          create_genre_graph
+        - threshold: the threshold the graph was made with (see create_genre_graph), None if it
+          wasn't made by create_genre_graph
     """
     genres: dict[str, Genre]
+    genre_index: Optional[genre_distances.GenreIndex]
+    catalog_index: Optional[catalog_search.CatalogIndex]
+    bridge_index: Optional[bridges.BridgeIndex]
+    filter_index: Optional[song_filters.FilterIndex]
+    dedup_index: Optional[dedup.DedupIndex]
+    threshold: Optional[float]
 
     def __init__(self) -> None:
         """
         init for SongGraph
         """
         self.genres = {}
+        self.genre_index = None
+        self.catalog_index = None
+        self.bridge_index = None
+        self.filter_index = None
+        self.dedup_index = None
+        self.threshold = None
 
     def add_genre(self, genre: Genre) -> None:
         """
@@ -217,6 +345,44 @@ class GenreGraph:
         """
         genre_name = genre.name
         self.genres[genre_name] = genre
+        self.genre_index = None
+        self.catalog_index = None
+        self.bridge_index = None
+        self.filter_index = None
+        self.dedup_index = None
+
+    def get_genre_index(self) -> genre_distances.GenreIndex:
+        """Return the GenreIndex of this graph, building it if needed"""
+        if self.genre_index is None:
+            self.genre_index = genre_distances.GenreIndex(self.genres)
+        return self.genre_index
+
+    def get_catalog_index(self) -> catalog_search.CatalogIndex:
+        """Return the CatalogIndex of the songs in this graph, building it if needed"""
+        if self.catalog_index is None:
+            self.catalog_index = catalog_search.CatalogIndex(
+                song for genre in self.genres.values() for song in genre.song_graph.songs.values())
+        return self.catalog_index
+
+    def get_bridge_index(self) -> bridges.BridgeIndex:
+        """Return the BridgeIndex of this graph, building it if needed"""
+        if self.bridge_index is None:
+            self.bridge_index = bridges.BridgeIndex(self.genres)
+        return self.bridge_index
+
+    def get_filter_index(self) -> song_filters.FilterIndex:
+        """Return the FilterIndex of this graph, building it if needed"""
+        if self.filter_index is None:
+            self.filter_index = song_filters.FilterIndex(self.genres)
+        return self.filter_index
+
+    def get_dedup_index(self) -> dedup.DedupIndex:
+        """Return the DedupIndex of the songs in this graph, building it (and setting the group
+        of every song) if needed"""
+        if self.dedup_index is None:
+            self.dedup_index = dedup.DedupIndex(song for genre in self.genres.values()
+                                                for song in genre.song_graph.songs.values())
+        return self.dedup_index
 
     def add_edge(self, genre_1: str, genre_2: str, sim_score: float) -> None:
         """
@@ -228,6 +394,10 @@ class GenreGraph:
         else:
             self.genres[genre_1].neighbours[genre_2] = sim_score
             self.genres[genre_2].neighbours[genre_1] = sim_score
+            self.bridge_index = None
+            if self.genre_index is not None:
+                self.genre_index.neighbours_changed(genre_1)
+                self.genre_index.neighbours_changed(genre_2)
 
     def get_song(self, song: Song) -> Song:
         """Retrieves a song"""
@@ -236,7 +406,59 @@ class GenreGraph:
     def insert_song(self, song: Song) -> None:
         """This method inserts a song into the graph
         you can set 'ret' to True if you want the song vertex returned for use"""
+        self.get_dedup_index().add(song)
         self.genres[song.genre].song_graph.sg_insert_song(song)
+        if self.catalog_index is not None:
+            self.catalog_index.add(song)
+
+    def insert_songs(self, songs: list[Song], thresh: Optional[float] = 0.1) -> None:
+        """Insert many songs into the graph at once, see SongGraph.sg_insert_songs
+
+        Preconditions:
+            - none of songs is already in the graph, and no song is in songs twice
+        """
+        dedup_index = self.get_dedup_index()
+        for song in songs:
+            dedup_index.add(song)
+        for genre, genre_songs in group_by_genre(songs).items():
+            self.genres[genre].song_graph.sg_insert_songs(genre_songs, thresh)
+        if self.catalog_index is not None:
+            for song in songs:
+                self.catalog_index.add(song)
+
+
+def stack_layer(top: dict, below: Mapping) -> collections.ChainMap:
+    """
+    Return a ChainMap of top over below, where below is a mapping or a ChainMap of layers made
+    by this function. top and below aren't changed.
+
+    Layers are merged (into new dicts) while a layer is at least half the size of the one below
+    it, so a mapping built up from n layers is at most log2(n) layers deep and every item is
+    copied at most log2(n) times.
+
+    >>> layers = stack_layer({'b': 2}, {'a': 1, 'c': 3, 'd': 4})
+    >>> len(layers.maps)
+    2
+    >>> layers = stack_layer({'c': 5, 'e': 6}, layers)
+    >>> len(layers.maps), layers['b'], layers['c']
+    (1, 2, 5)
+    """
+    maps = [top] + (list(below.maps) if isinstance(below, collections.ChainMap) else [below])
+    while len(maps) > 1 and 2 * len(maps[0]) >= len(maps[1]):
+        merged = dict(maps[1])
+        merged.update(maps[0])
+        maps[:2] = [merged]
+    return collections.ChainMap(*maps)
+
+
+def group_by_genre(songs: list[Song]) -> dict[str, list[Song]]:
+    """
+    Return songs grouped by their genre
+    """
+    groups = {}
+    for song in songs:
+        groups.setdefault(song.genre, []).append(song)
+    return groups
 
 
 def load_genres(genres_file: str) -> dict[str, dict[str, float]]:
@@ -302,6 +524,87 @@ def load_artists_to_genres(art_genres_file: str) -> dict[str, list[str]]:
     return artist_to_genres
 
 
+class ArtistGenres:
+    """
+    Looks up the genres of artists, trying three places in order:
+        1) the artists file (e.g. ARTIST_DATA_W_GENRES), loaded the first time it is needed and
+           then kept in memory
+        2) a persistent cache of lookups (see spotify_cache), if one is given
+        3) the network (a fetch function, e.g. a spotify search), if one is given
+
+    Artists the file has no genres for are looked up in the next places.
+
+    Instance attributes:
+        - artists_file: the artists file, formatted like data/data_w_genres.csv
+        - local_hits: number of artists found in the artists file
+        - remote_lookups: number of artists passed on to the cache / network
+    """
+    artists_file: str
+    local_hits: int
+    remote_lookups: int
+    _local: Optional[dict[str, list[str]]]
+
+    def __init__(self, artists_file: str) -> None:
+        """Initialize the lookup, the artists file isn't loaded yet"""
+        self.artists_file = artists_file
+        self.local_hits = 0
+        self.remote_lookups = 0
+        self._local = None
+
+    def local(self) -> dict[str, list[str]]:
+        """Return the mapping of artist to genres from the artists file, loading it if it hasn't
+        been loaded yet"""
+        if self._local is None:
+            self._local = load_artists_to_genres(self.artists_file)
+        return self._local
+
+    def resolve_many(self, artists: list[str], cache: Any = None,
+                     fetch: Optional[Callable[[list[str]], dict[str, list[str]]]] = None) \
+            -> dict[str, list[str]]:
+        """Return the genres of the given artists. Artists not in the artists file are looked up
+        with cache.read_through and fetch (which returns a mapping of artist to genres). Artists
+        whose genres aren't found are left out."""
+        try:
+            local = self.local()
+        except OSError:  # no artists file, e.g. running without the data set
+            local = {}
+
+        found = {}
+        missing = []
+        for artist in dict.fromkeys(artists):
+            if local.get(artist, []) != []:
+                found[artist] = local[artist]
+            else:
+                missing.append(artist)
+        self.local_hits += len(found)
+        self.remote_lookups += len(missing)
+
+        if missing != [] and cache is not None and fetch is not None:
+            found.update(cache.read_through('artist_genres', missing, fetch))
+        elif missing != [] and cache is not None:
+            found.update(cache.get_many('artist_genres', missing))
+        elif missing != [] and fetch is not None:
+            found.update(fetch(missing))
+        return found
+
+    def resolve(self, artist: str, cache: Any = None,
+                fetch: Optional[Callable[[list[str]], dict[str, list[str]]]] = None) -> list[str]:
+        """Return the genres of artist, or [] if they aren't found. See resolve_many."""
+        return self.resolve_many([artist], cache, fetch).get(artist, [])
+
+
+# maps artists file to the ArtistGenres of that file, see get_artist_genres
+_artist_genres = {}
+
+
+def get_artist_genres(artists_file: str = ARTIST_DATA_W_GENRES) -> ArtistGenres:
+    """Return the shared ArtistGenres of artists_file, so the file is only loaded once no matter
+    who needs it"""
+    if artists_file not in _artist_genres:
+        _artist_genres[artists_file] = ArtistGenres(artists_file)
+    return _artist_genres[artists_file]
+
+
 def song_to_genre(song: Song, genres: list[str], g_to_props: dict[str, dict[str, float]]) -> str:
     """
     Takes in a song and returns the genre it most likely is
@@ -486,7 +789,7 @@ def genres_to_songs(songs_file: str, artists_file: str, genres_file: str) -> Tup
     """
     genres_to_prop = load_genres(genres_file)
     print('Loading genres finished. Next, loading artists:')
-    artists_to_genre = load_artists_to_genres(artists_file)
+    artists_to_genre = get_artist_genres(artists_file).local()
     print('Loading artists finished. Next, loading Songs:')
     songs = load_songs(songs_file)
     print('loading songs finished. Next, assigning genres:')
@@ -499,23 +802,31 @@ def genres_to_songs(songs_file: str, artists_file: str, genres_file: str) -> Tup
         genre_to_songs[genre] = []
 
     for song in songs:
-        artist = songs[song].information['artists'][0]
+        genre = assign_genre(songs[song], artists_to_genre, genres_to_prop)
+        genre_to_songs[genre].append(songs[song])
+        songs_to_genre[songs[song].information['id']] = genre
 
-        if artist == 'n/a':
-            artist = songs[song].information['artists'][1]
+    return genre_to_songs, songs_to_genre
 
-        genres = artists_to_genre.get(artist, [])
-        # genres = artists_to_genre.get(artist)
 
-        if genres == []:
-            genre = song_to_genre(songs[song], GENRES, genres_to_prop)
-        else:
-            genre = song_to_genre(songs[song], genres, genres_to_prop)
+def assign_genre(song: Song, artists_to_genre: dict[str, list[str]],
+                 genres_to_prop: dict[str, dict[str, float]]) -> str:
+    """
+    Set song.genre to the genre (of the genres of its artist) the song is closest to, and return
+    it. If the artist's genres aren't known, the closest of the 50 most popular genres is used.
+    """
+    artist = song.information['artists'][0]
 
-        genre_to_songs[genre].append(songs[song])
-        songs_to_genre[songs[song].information['id']] = genre
+    if artist == 'n/a':
+        artist = song.information['artists'][1]
 
-    return genre_to_songs, songs_to_genre
+    genres = artists_to_genre.get(artist, [])
+    # genres = artists_to_genre.get(artist)
+
+    if genres == []:
+        return song_to_genre(song, GENRES, genres_to_prop)
+    else:
+        return song_to_genre(song, genres, genres_to_prop)
 
 
 def get_song_rating(song: Song) -> float:
@@ -567,11 +878,76 @@ def create_song_graph(songs: list[Song], threshold: float) -> SongGraph:
             weight = abs(song_ratings[song_index][0] - song_ratings[potential_songs][0])
             potential_songs += 1
 
+    graph.threshold = threshold
     return graph
 
 
+def count_edges(ratings: list[float], threshold: float) -> int:
+    """
+    Return the number of edges create_song_graph makes between songs with the given ratings,
+    without making them.
+
+    create_song_graph connects every song to the songs after it (in rating order) that are within
+    threshold of it and, if there are any, to the one song after those. The number of songs within
+    threshold is found with a binary search, so this takes len(ratings) * log(len(ratings)) steps
+    however many edges there are.
+
+    Preconditions:
+        - ratings is sorted
+    """
+    count = 0
+    last = len(ratings) - 1
+    for index in range(last):
+        within = bisect.bisect_left(ratings, ratings[index] + threshold, index + 1) - index - 1
+        if within > 0:
+            count += min(within + 1, last - index)
+    return count
+
+
+def budget_thresholds(genre_ratings: dict[str, list[float]], edge_budget: int,
+                      max_threshold: float, steps: int = 40) -> dict[str, float]:
+    """
+    Return a threshold for every genre such that the song graphs made with them have at most
+    edge_budget edges in total, going by count_edges.
+
+    Every genre gets the largest threshold up to max_threshold (of steps thresholds spaced evenly
+    on a log scale, down to max_threshold / 10000, or 0 for no edges) that keeps the average
+    degree of its songs under a cap, and the cap is the largest one that keeps the total within
+    edge_budget. So sparse genres keep max_threshold and only dense ones (like pop) are thinned.
+
+    Preconditions:
+        - every list in genre_ratings is sorted
+        - edge_budget >= 0 and max_threshold > 0
+    """
+    thresholds = [0.0] + [max_threshold * 10 ** (4 * (step - steps) / steps)
+                          for step in range(steps + 1)]
+    edges = {genre: [count_edges(ratings, threshold) for threshold in thresholds]
+             for genre, ratings in genre_ratings.items()}
+
+    def choose(degree: float) -> dict[str, int]:
+        """Return the index of the largest threshold keeping each genre under degree"""
+        return {genre: bisect.bisect_right(counts, degree * len(genre_ratings[genre]) / 2) - 1
+                for genre, counts in edges.items()}
+
+    def total(choice: dict[str, int]) -> int:
+        """Return the number of edges the song graphs have with the chosen thresholds"""
+        return sum(edges[genre][index] for genre, index in choice.items())
+
+    low, high = 0.0, float(max((len(ratings) for ratings in genre_ratings.values()), default=0))
+    if total(choose(high)) > edge_budget:
+        for _ in range(50):
+            middle = (low + high) / 2
+            if total(choose(middle)) <= edge_budget:
+                low = middle
+            else:
+                high = middle
+        high = low
+    return {genre: thresholds[index] for genre, index in choose(high).items()}
+
+
 def create_genre_graph(songs_file: str, artists_file: str, genres_file: str,
-                       threshold: float) -> Tuple[GenreGraph, dict]:
+                       threshold: float,
+                       edge_budget: Optional[int] = None) -> Tuple[GenreGraph, dict]:
     """
     Returns the main genre graph to be used to recommend songs.
 
@@ -581,6 +957,9 @@ def create_genre_graph(songs_file: str, artists_file: str, genres_file: str,
     The graph connects genres that have a rating within threshold of each other
     See below for the rating of a genre.
 
+    If an edge budget is given, the song graphs of dense genres are made with smaller thresholds
+    so there are at most edge_budget song edges in total, see budget_thresholds.
+
     Preconditions:
         - songs_file is a path to a csv file structured in the same way as 'Data/data.csv'
         - artists_file is a path to a csv file structured as 'Data/data_w_genres.csv' is.
@@ -588,13 +967,22 @@ def create_genre_graph(songs_file: str, artists_file: str, genres_file: str,
         - threshold > 0
     """
     g_to_songs, songs_to_g = genres_to_songs(songs_file, artists_file, genres_file)
-    print('Assigning Genres finished. Last, making graph.')
     genres_to_prop = load_genres(genres_file)
 
+    song_ratings = {genre: sorted(get_song_rating(song) for song in g_to_songs[genre])
+                    for genre in g_to_songs}
+    if edge_budget is None:
+        thresholds = dict.fromkeys(g_to_songs, threshold)
+    else:
+        thresholds = budget_thresholds(song_ratings, edge_budget, threshold)
+    edges = sum(count_edges(song_ratings[genre], thresholds[genre]) for genre in g_to_songs)
+    print('Assigning Genres finished. Last, making graph with ' + str(edges) + ' song edges (about '
+          + str(edges * EDGE_BYTES // 2 ** 20) + ' MB).')
+
     genre_graph = GenreGraph()
     ratings = []
     for genre in g_to_songs:
-        curr_song_graph = create_song_graph(g_to_songs[genre], threshold)
+        curr_song_graph = create_song_graph(g_to_songs[genre], thresholds[genre])
         curr_genre = Genre(curr_song_graph, genres_to_prop[genre], genre)
 
         genre_graph.add_genre(curr_genre)
@@ -615,6 +1003,10 @@ def create_genre_graph(songs_file: str, artists_file: str, genres_file: str,
             weight = abs(ratings[genre_index][0] - ratings[potential_genres][0])
             potential_genres += 1
 
+    genre_graph.get_genre_index().build_nearest()
+    genre_graph.get_bridge_index().build()
+    genre_graph.get_dedup_index()
+    genre_graph.threshold = threshold
     return genre_graph, songs_to_g
 
 
@@ -649,7 +1041,9 @@ def get_genre_rating(genre: Genre) -> float:
 #         'extra-imports': ['pygame', 'networkx', 'pygame_visualization', 'song_graph',
 #                           'computations', 'tkinter', 'spotify_methods', 'random', 'main',
 #                           'spotipy', 'spotipy.oauth2', 'main', 'graph_visualization', 'datetime',
-#                           'csv', 'plotly.graph_objects'],
+#                           'csv', 'plotly.graph_objects', 'bisect', 'collections', 'bridges',
+#                           'catalog_search', 'dedup', 'genre_distances', 'random_walks',
+#                           'song_filters'],
 #         'generated-members': ['pygame.*'],
 #         'max-nested-blocks': 4,
 #         'allowed-io': ['genres_to_songs', 'load_genres', 'load_artists_to_genres', 'load_songs',
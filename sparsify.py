@@ -0,0 +1,127 @@
+"""
+Caps the degree of the songs of a genre graph.
+
+Songs in a dense band of ratings are within the threshold of thousands of other songs, so
+create_song_graph gives them thousands of neighbours. Every traversal in computations looks at all
+of them, and the degrees find_uniquely_connected compares mostly say how dense the band is.
+
+An edge is kept only if it is one of the max_degree lowest weight edges of both of its songs, so the
+graph stays symmetric and no song keeps more than max_degree of these edges. Dropping edges can
+split a genre into parts, so afterwards the lowest weight dropped edges that join the parts back
+together are put back (Kruskal's algorithm on the parts), and every song can still reach the songs
+it could reach before. Those edges are the only ones that can take a song over max_degree, and
+there are few of them.
+
+Songs inserted after the graph is sparsified are connected as usual, without a cap.
+"""
+import heapq
+from typing import Iterable
+import song_graph
+
+
+class UnionFind:
+    """
+    Disjoint sets of song ids.
+
+    Instance attributes:
+        - parent: maps every id to its parent in its set, the id that is its own parent represents
+          the set
+    """
+    parent: dict[str, str]
+
+    def __init__(self, song_ids: Iterable[str]) -> None:
+        """Initialize every id in a set of its own"""
+        self.parent = {song_id: song_id for song_id in song_ids}
+
+    def find(self, song_id: str) -> str:
+        """Return the id representing the set song_id is in"""
+        parent = self.parent
+        while parent[song_id] != song_id:
+            parent[song_id] = parent[parent[song_id]]
+            song_id = parent[song_id]
+        return song_id
+
+    def union(self, id_1: str, id_2: str) -> bool:
+        """Join the sets of id_1 and id_2, return whether they were different sets"""
+        root_1, root_2 = self.find(id_1), self.find(id_2)
+        if root_1 == root_2:
+            return False
+        self.parent[root_1] = root_2
+        return True
+
+
+def count_edges(graph: song_graph.SongGraph) -> int:
+    """Return the number of edges of graph"""
+    return sum(len(song.neighbours) for song in graph.songs.values()) // 2
+
+
+def sparsify_song_graph(graph: song_graph.SongGraph, max_degree: int) -> tuple[int, int]:
+    """
+    Drop every edge of graph that isn't one of the max_degree lowest weight edges of both its
+    songs, except the ones needed to keep the parts of graph connected. Return the number of
+    edges before and after.
+
+    Preconditions:
+        - max_degree > 0
+        - graph is only used by this thread
+    """
+    songs = graph.songs
+    before = count_edges(graph)
+
+    strongest = {}
+    for song_id, song in songs.items():
+        if len(song.neighbours) <= max_degree:
+            strongest[song_id] = song.neighbours.keys()
+        else:
+            strongest[song_id] = set(heapq.nsmallest(max_degree, song.neighbours,
+                                                     key=song.neighbours.__getitem__))
+    kept = {song_id: {other_id: songs[song_id].neighbours[other_id]
+                      for other_id in strongest[song_id] if song_id in strongest[other_id]}
+            for song_id in songs}
+
+    parts = UnionFind(songs)
+    for song_id, neighbours in kept.items():
+        for other_id in neighbours:
+            parts.union(song_id, other_id)
+    part = {song_id: parts.find(song_id) for song_id in songs}
+    joining = sorted((weight, song_id, other_id) for song_id, song in songs.items()
+                     for other_id, weight in song.neighbours.items()
+                     if song_id < other_id and part[song_id] != part[other_id])
+    for weight, song_id, other_id in joining:
+        if parts.union(song_id, other_id):
+            kept[song_id][other_id] = weight
+            kept[other_id][song_id] = weight
+
+    for song_id, song in songs.items():
+        song.neighbours = kept[song_id]
+    graph.transitions = None
+    return before, count_edges(graph)
+
+
+def sparsify_graph(graph: song_graph.GenreGraph, max_degree: int) -> dict[str, tuple[int, int]]:
+    """
+    Sparsify the song graph of every genre of graph, see sparsify_song_graph. Return the number
+    of edges before and after of every genre.
+
+    Preconditions:
+        - max_degree > 0
+        - graph is only used by this thread
+    """
+    return {name: sparsify_song_graph(genre.song_graph, max_degree)
+            for name, genre in graph.genres.items()}
+
+
+# if __name__ == '__main__':
+#     import python_ta.contracts
+#     python_ta.contracts.check_all_contracts()
+#
+#     import doctest
+#     doctest.testmod()
+#
+#     import python_ta
+#     python_ta.check_all(config={
+#         'max-line-length': 100,
+#         'disable': ['E1136'],
+#         'extra-imports': ['song_graph', 'heapq'],
+#         'max-nested-blocks': 4
+#     })
@@ -0,0 +1,195 @@
+"""
+Persistent cache of spotify lookups, stored in a SQLite file.
+
+Track metadata, audio features and artist genres hardly ever change, so once they have been looked
+up they are kept on disk and later lookups (even in later runs) don't need the network. Keys
+spotify had nothing for are kept too (as entries without a value) so they aren't looked up again
+either. Every entry expires after the time to live of its kind, and once the cache holds more
+than max_entries the least recently used entries are dropped.
+"""
+import json
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Optional
+
+CACHE_FILE = 'Data/spotify_cache.sqlite'
+
+DAY = 24 * 60 * 60
+# How long entries of each kind are kept, in seconds
+TIME_TO_LIVE = {'track': 30 * DAY, 'audio_features': 365 * DAY, 'artist_genres': 7 * DAY}
+
+# SQLite limits the number of parameters in one query
+QUERY_CHUNK = 500
+
+
+class SpotifyCache:
+    """
+    Cache of spotify lookups. Entries are json values stored by kind (e.g. 'audio_features') and
+    key (e.g. a track id).
+
+    Instance attributes:
+        - path: the SQLite file the cache is stored in
+        - max_entries: the most entries kept, the least recently used ones are dropped after that
+        - hits: number of lookups answered by the cache
+        - misses: number of lookups that had to be fetched
+        - fetch_seconds: total time spent fetching misses
+        - fetched: number of entries fetched in fetch_seconds
+    """
+    path: str
+    max_entries: int
+    hits: int
+    misses: int
+    fetch_seconds: float
+    fetched: int
+    _connection: sqlite3.Connection
+    _lock: threading.Lock
+    _size: int
+
+    def __init__(self, path: str = CACHE_FILE, max_entries: int = 200000) -> None:
+        """Open (or create) the cache stored at path"""
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.fetch_seconds = 0.0
+        self.fetched = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute('CREATE TABLE IF NOT EXISTS entries ('
+                                 'kind TEXT, key TEXT, value TEXT, expires REAL, used REAL, '
+                                 'PRIMARY KEY (kind, key))')
+        self._connection.execute('CREATE INDEX IF NOT EXISTS entries_used ON entries (used)')
+        self._connection.commit()
+        # An upper bound on the number of entries, so it doesn't have to be counted on every put
+        self._size = self._connection.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+
+    def get_many(self, kind: str, keys: list[str]) -> dict[str, Any]:
+        """Return the cached values of the keys that are cached and haven't expired (keys
+        cached as having no value are left out)"""
+        return self._lookup(kind, keys)[0]
+
+    def _lookup(self, kind: str, keys: list[str]) -> tuple[dict[str, Any], set[str]]:
+        """Return the cached values of the keys that are cached and haven't expired, and the
+        keys cached as having no value"""
+        now = time.time()
+        found = {}
+        absent = set()
+        with self._lock:
+            for i in range(0, len(keys), QUERY_CHUNK):
+                chunk = keys[i:i + QUERY_CHUNK]
+                rows = self._connection.execute(
+                    'SELECT key, value FROM entries WHERE kind = ? AND expires > ? AND key IN ('
+                    + ', '.join('?' * len(chunk)) + ')', [kind, now] + chunk).fetchall()
+                for key, value in rows:
+                    if value is None:
+                        absent.add(key)
+                    else:
+                        found[key] = json.loads(value)
+            self._connection.executemany('UPDATE entries SET used = ? WHERE kind = ? AND key = ?',
+                                         [(now, kind, key) for key in [*found, *absent]])
+            self._connection.commit()
+        return found, absent
+
+    def get(self, kind: str, key: str) -> Optional[Any]:
+        """Return the cached value of key, or None if it isn't cached"""
+        return self.get_many(kind, [key]).get(key)
+
+    def put_many(self, kind: str, values: dict[str, Any]) -> None:
+        """Cache every key, value pair in values"""
+        self._put(kind, {key: json.dumps(value) for key, value in values.items()})
+
+    def put_absent(self, kind: str, keys: list[str]) -> None:
+        """Cache keys as having no value, so read_through doesn't fetch them again until they
+        expire"""
+        self._put(kind, dict.fromkeys(keys))
+
+    def _put(self, kind: str, values: dict[str, Optional[str]]) -> None:
+        """Store every key, value pair in values, a value of None marks a key with no value"""
+        now = time.time()
+        expires = now + TIME_TO_LIVE.get(kind, DAY)
+        with self._lock:
+            self._connection.executemany(
+                'INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)',
+                [(kind, key, value, expires, now) for key, value in values.items()])
+            self._size += len(values)
+            if self._size > self.max_entries:
+                self._evict()
+            self._connection.commit()
+
+    def put(self, kind: str, key: str, value: Any) -> None:
+        """Cache value as the value of key"""
+        self.put_many(kind, {key: value})
+
+    def read_through(self, kind: str, keys: list[str],
+                     fetch: Callable[[list[str]], dict[str, Any]]) -> dict[str, Any]:
+        """Return the values of keys, using the cache where possible. The missing keys are looked
+        up with fetch (which returns a mapping of key to value) and cached. Keys fetch has no
+        value for are left out, and cached as such (see put_absent)."""
+        keys = list(dict.fromkeys(keys))
+        found, absent = self._lookup(kind, keys)
+        missing = [key for key in keys if key not in found and key not in absent]
+        with self._lock:  # lookups of different kinds can run on different threads
+            self.hits += len(keys) - len(missing)
+            self.misses += len(missing)
+
+        if missing != []:
+            start = time.perf_counter()
+            fetched = fetch(missing)
+            with self._lock:
+                self.fetch_seconds += time.perf_counter() - start
+                self.fetched += len(missing)
+            self.put_many(kind, fetched)
+            self.put_absent(kind, [key for key in missing if key not in fetched])
+            found.update(fetched)
+        return found
+
+    def stats(self) -> dict[str, float]:
+        """Return the hit rate of the cache and an estimate of the time it saved (the average
+        time a fetch took for every hit)"""
+        lookups = self.hits + self.misses
+        per_fetch = self.fetch_seconds / self.fetched if self.fetched > 0 else 0.0
+        return {'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups > 0 else 0.0,
+                'seconds_saved': self.hits * per_fetch}
+
+    def clear(self) -> None:
+        """Remove every entry"""
+        with self._lock:
+            self._connection.execute('DELETE FROM entries')
+            self._connection.commit()
+            self._size = 0
+
+    def close(self) -> None:
+        """Close the SQLite file"""
+        with self._lock:
+            self._connection.close()
+
+    def _evict(self) -> None:
+        """Drop expired entries and, if there are still more than max_entries, the least recently
+        used ones down to 90% of max_entries"""
+        self._connection.execute('DELETE FROM entries WHERE expires <= ?', (time.time(),))
+        count = self._connection.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+        if count > self.max_entries:
+            self._connection.execute(
+                'DELETE FROM entries WHERE rowid IN '
+                '(SELECT rowid FROM entries ORDER BY used LIMIT ?)',
+                (count - self.max_entries * 9 // 10,))
+            count = self.max_entries * 9 // 10
+        self._size = count
+
+
+# if __name__ == '__main__':
+#     import python_ta.contracts
+#     python_ta.contracts.check_all_contracts()
+#
+#     import doctest
+#     doctest.testmod()
+#
+#     import python_ta
+#     python_ta.check_all(config={
+#         'max-line-length': 100,
+#         'disable': ['E1136'],
+#         'extra-imports': ['json', 'sqlite3', 'threading', 'time'],
+#         'max-nested-blocks': 4
+#     })
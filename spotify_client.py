@@ -0,0 +1,139 @@
+"""
+Concurrent layer over the spotipy client.
+
+Spotify requests are latency bound, so instead of sending them one at a time this sends up to
+max_in_flight of them at once on a thread pool. On top of that:
+    - when spotify answers 429 (too many requests) every request waits the Retry-After time
+      before being sent again, other errors worth retrying back off exponentially
+    - identical requests that are sent while one is already in flight share its response
+
+'python cli.py bench spotify' checks this against benchmarks.StubSpotify, 'python cli.py bench
+retries' through spotipy's HTTP path and the session of make_session, against a local server
+that answers 429 (it is skipped if spotipy isn't installed).
+"""
+import concurrent.futures
+import threading
+import time
+from typing import Any, Callable
+
+# HTTP statuses worth sending the request again for
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def make_session(pool_size: int) -> Any:
+    """Return a requests session that keeps up to pool_size connections alive"""
+    import requests
+    from requests.adapters import HTTPAdapter
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+class ConcurrentSpotify:
+    """
+    Sends requests through a spotipy client (or anything with the same methods) concurrently.
+
+    Instance attributes:
+        - client: the client requests are sent through
+        - max_in_flight: the most requests sent at the same time
+        - max_retries: how many times a request is retried before its error is raised
+        - backoff: seconds waited before the first retry of an error without a Retry-After,
+          doubled for every retry after that
+        - retries: number of requests that have been retried
+        - coalesced: number of requests that shared the response of one already in flight
+    """
+    client: Any
+    max_in_flight: int
+    max_retries: int
+    backoff: float
+    retries: int
+    coalesced: int
+    _executor: concurrent.futures.ThreadPoolExecutor
+    _in_flight: dict[str, concurrent.futures.Future]
+    _lock: threading.Lock
+    _paused_until: float
+
+    def __init__(self, client: Any, max_in_flight: int = 8, max_retries: int = 5,
+                 backoff: float = 0.5) -> None:
+        """Initialize the concurrent layer over client"""
+        self.client = client
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.retries = 0
+        self.coalesced = 0
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_in_flight)
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._paused_until = 0.0
+
+    def submit(self, method: str, *args: Any, **kwargs: Any) -> concurrent.futures.Future:
+        """Send client.method(*args, **kwargs) in the background and return a future of its
+        response. If the same request is already in flight its future is returned instead."""
+        key = repr((method, args, sorted(kwargs.items())))
+        with self._lock:
+            if key in self._in_flight:
+                self.coalesced += 1
+                return self._in_flight[key]
+            future = self._executor.submit(self._send, getattr(self.client, method), args,
+                                           kwargs)
+            self._in_flight[key] = future
+        future.add_done_callback(lambda _: self._done(key))
+        return future
+
+    def call(self, method: str, *args: Any, **kwargs: Any) -> Any:
+        """Send client.method(*args, **kwargs) and wait for its response"""
+        return self.submit(method, *args, **kwargs).result()
+
+    def map(self, method: str, arg_lists: list[tuple]) -> list[Any]:
+        """Send client.method(*args) for every args in arg_lists at the same time and return the
+        responses in the same order"""
+        futures = [self.submit(method, *args) for args in arg_lists]
+        return [future.result() for future in futures]
+
+    def _done(self, key: str) -> None:
+        """Forget a finished request so the next identical one is sent again"""
+        with self._lock:
+            self._in_flight.pop(key, None)
+
+    def _send(self, function: Callable, args: tuple, kwargs: dict) -> Any:
+        """Call function, retrying it when spotify says to"""
+        attempt = 0
+        while True:
+            wait = self._paused_until - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                return function(*args, **kwargs)
+            except Exception as error:  # spotipy raises SpotifyException with http_status
+                status = getattr(error, 'http_status', None)
+                if status not in RETRY_STATUSES or attempt >= self.max_retries:
+                    raise
+                delay = self.backoff * 2 ** attempt
+                headers = getattr(error, 'headers', None) or {}
+                with self._lock:
+                    if status == 429 and headers.get('Retry-After') is not None:
+                        delay = float(headers['Retry-After'])
+                        self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                    self.retries += 1
+                attempt += 1
+                time.sleep(delay)
+
+
+# if __name__ == '__main__':
+#     import python_ta.contracts
+#     python_ta.contracts.check_all_contracts()
+#
+#     import doctest
+#     doctest.testmod()
+#
+#     import python_ta
+#     python_ta.check_all(config={
+#         'max-line-length': 100,
+#         'disable': ['E1136'],
+#         'extra-imports': ['concurrent.futures', 'threading', 'time', 'requests',
+#                           'requests.adapters'],
+#         'max-nested-blocks': 4
+#     })
@@ -1,32 +1,266 @@
-"""This file contains all the spotipy methods we will use in this project"""
+"""This file contains all the spotipy methods we will use in this project
+
+spotipy (and requests) and the genre data are only loaded the first time they are needed (see
+get_client and get_genre_props) so importing this file is cheap.
+
+Requests can be recorded to a cassette file and replayed from it later without the network or
+credentials (see spotify_transport and configure_transport). The DOTIFY_SPOTIFY_TRANSPORT,
+DOTIFY_CASSETTE and DOTIFY_REPLAY_LATENCY environment variables set the starting transport."""
+import concurrent.futures
 import datetime
-from typing import Optional
-import spotipy
-from spotipy.oauth2 import SpotifyClientCredentials, SpotifyOAuth
+import os
+from typing import Any, Iterator, Optional, Union
 import song_graph
-
-G_TO_PROPS = song_graph.load_genres('Data/data_by_genres.csv')
+import spotify_cache
+import spotify_client
 
 # User Data
 MY_ID = '1b85b05bab6a4880b0918b422db19fea'
 SECRET_ID = '46a2286d8dbb4d1db0e89ce4315e3d0d'
 USERNAME = '772iyi0qo383twmj0wecb2wap'
-CRED_MGR = SpotifyClientCredentials(client_id=MY_ID, client_secret=SECRET_ID)
 # Authorization Token
 SCOPE = 'playlist-modify-public'
 REDIRECT_URL = 'http://localhost:8080'
-AUTH = SpotifyOAuth(client_id=MY_ID, client_secret=SECRET_ID, redirect_uri=REDIRECT_URL,
-                    scope=SCOPE, username=USERNAME)
-SP = spotipy.Spotify(client_credentials_manager=CRED_MGR, auth_manager=AUTH)
+# Most spotify requests sent at the same time
+MAX_IN_FLIGHT = 8
+
+# 'live' to use spotify, 'record' to use spotify and record to CASSETTE, 'replay' to replay
+# CASSETTE instead of using spotify
+TRANSPORTS = ['live', 'record', 'replay']
+TRANSPORT = os.environ.get('DOTIFY_SPOTIFY_TRANSPORT', 'live')
+CASSETTE_FILE = 'Data/spotify_cassette.jsonl'
+CASSETTE = os.environ.get('DOTIFY_CASSETTE', CASSETTE_FILE)
+# 'recorded' to replay requests as slowly as they were recorded, or a number of seconds
+REPLAY_LATENCY = os.environ.get('DOTIFY_REPLAY_LATENCY', 'recorded')
+
+_client = None
+_concurrent_client = None
+_cache = None
+_genre_props = None
+
+
+def configure_transport(transport: str, cassette: Optional[str] = None,
+                        latency: Union[str, float, None] = None) -> None:
+    """Switch to the given transport ('live', 'record' or 'replay'), see TRANSPORT. Clients
+    created before this are dropped so the next request uses the new transport."""
+    global TRANSPORT, CASSETTE, REPLAY_LATENCY, _client, _concurrent_client, _cache
+    if transport not in TRANSPORTS:
+        raise ValueError('transport must be one of ' + ', '.join(TRANSPORTS))
+    TRANSPORT = transport
+    CASSETTE = cassette or CASSETTE
+    REPLAY_LATENCY = latency if latency is not None else REPLAY_LATENCY
+    _client = None
+    _concurrent_client = None
+    _cache = None
+
+
+def get_client() -> Any:
+    """Return the spotipy client, creating it (and importing spotipy) on the first call"""
+    global _client
+    if _client is None:
+        import spotipy
+        import spotify_transport
+        if TRANSPORT == 'replay':
+            latency = REPLAY_LATENCY if REPLAY_LATENCY == 'recorded' else float(REPLAY_LATENCY)
+            # the token is never checked since nothing is sent
+            session = spotify_transport.ReplaySession(CASSETTE, latency)
+            _client = spotipy.Spotify(auth='replay', requests_session=session, retries=0,
+                                      status_retries=0)
+            return _client
+
+        from spotipy.oauth2 import SpotifyClientCredentials, SpotifyOAuth
+        cred_mgr = SpotifyClientCredentials(client_id=MY_ID, client_secret=SECRET_ID)
+        auth = SpotifyOAuth(client_id=MY_ID, client_secret=SECRET_ID, redirect_uri=REDIRECT_URL,
+                            scope=SCOPE, username=USERNAME)
+        session = spotify_client.make_session(MAX_IN_FLIGHT)
+        if TRANSPORT == 'record':
+            session = spotify_transport.RecordingSession(CASSETTE, session)
+        # retries are handled by spotify_client so spotipy's own are turned off
+        _client = spotipy.Spotify(client_credentials_manager=cred_mgr, auth_manager=auth,
+                                  requests_session=session, retries=0, status_retries=0)
+    return _client
+
+
+def get_concurrent_client() -> spotify_client.ConcurrentSpotify:
+    """Return the client used to send many spotify requests at once, creating it on the first
+    call"""
+    global _concurrent_client
+    if _concurrent_client is None:
+        _concurrent_client = spotify_client.ConcurrentSpotify(get_client(), MAX_IN_FLIGHT)
+    return _concurrent_client
+
+
+def get_cache() -> spotify_cache.SpotifyCache:
+    """Return the cache of spotify lookups, opening it on the first call"""
+    global _cache
+    if _cache is None and TRANSPORT == 'replay':
+        # replays start from an empty cache every time so they send the same requests
+        _cache = spotify_cache.SpotifyCache(':memory:')
+    elif _cache is None:
+        _cache = spotify_cache.SpotifyCache(spotify_cache.CACHE_FILE)
+    return _cache
+
+
+def as_concurrent(client: Any) -> spotify_client.ConcurrentSpotify:
+    """Return client as a ConcurrentSpotify, the shared one if client is None"""
+    if client is None:
+        return get_concurrent_client()
+    elif isinstance(client, spotify_client.ConcurrentSpotify):
+        return client
+    return spotify_client.ConcurrentSpotify(client, MAX_IN_FLIGHT)
+
+
+def get_genre_props() -> dict[str, dict[str, float]]:
+    """Return the average properties of every genre, loading them on the first call"""
+    global _genre_props
+    if _genre_props is None:
+        _genre_props = song_graph.load_genres(song_graph.GENRE_DATA)
+    return _genre_props
+
+
+# Most ids Spotify accepts in one audio features / artists / tracks request
+AUDIO_FEATURES_CHUNK = 100
+ARTISTS_CHUNK = 50
+TRACKS_CHUNK = 50
+# Most playlists / playlist tracks Spotify returns in one page
+PLAYLISTS_PAGE = 50
+PLAYLIST_PAGE = 100
+# Most tracks Spotify adds to a playlist in one request
+ADD_TRACKS_CHUNK = 100
+
+# maps the name of each playlist generated so far to its id
+_playlist_ids = {}
+# converts search results in the background, see TrackCandidate.prefetch
+_prefetcher = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+# looks up the genres of artists while the audio features are fetched, see spot_songs_to_verts
+_artist_lookups = concurrent.futures.ThreadPoolExecutor(max_workers=4)
+
+
+def chunks(items: list, size: int) -> list[list]:
+    """Split items into lists of at most size items"""
+    return [items[i:i + size] for i in range(0, len(items), size)]
 
 
 def spot_song_to_vert(song_data: dict, graph: song_graph.GenreGraph, all_songs: dict) \
         -> song_graph.Song:
     """This method converts a song into a Song vertex"""
-    if song_data['id'] in all_songs:  # return existing vertex
-        return graph.genres[all_songs[song_data['id']]].song_graph.songs[song_data['id']]
+    return spot_songs_to_verts([song_data], graph, all_songs)[0]
+
+
+def spot_songs_to_verts(tracks: list[dict], graph: song_graph.GenreGraph, all_songs: dict,
+                        client: Any = None, cache: Optional[spotify_cache.SpotifyCache] = None) \
+        -> list[song_graph.Song]:
+    """Converts a list of spotify tracks into Song vertices, in the same order.
+
+    Instead of asking spotify about every track on its own, the audio features of all the new
+    tracks are requested AUDIO_FEATURES_CHUNK at a time and the genres of their artists
+    ARTISTS_CHUNK at a time. Tracks already in the graph return their existing vertex and cost no
+    requests. Tracks spotify has no audio features for are left out. The artist lookups run in the
+    background while the audio features are fetched, so all of the requests are sent at the same
+    time (up to the client's max_in_flight). Requests are only sent for audio features that aren't
+    in the cache and artists that aren't in the artists data set or the cache (see
+    song_graph.ArtistGenres).
+
+    client is the spotipy client to use (the shared concurrent client by default) and cache the
+    cache of lookups (the shared one by default)."""
+    client = as_concurrent(client)
+    cache = cache or get_cache()
+    new_tracks = {}
+    for track in tracks:
+        if track['id'] not in all_songs:
+            new_tracks[track['id']] = track
+    cache.put_many('track', new_tracks)
+
+    artist_names = {}
+    artist_ids = {}
+    for track in new_tracks.values():
+        artist = main_artist(track)
+        if artist is not None and artist.get('id') is not None:
+            artist_names[track['id']] = artist['name']
+            artist_ids[artist['name']] = artist['id']
+
+    artist_lookup = _artist_lookups.submit(
+        song_graph.get_artist_genres().resolve_many, list(artist_ids), cache,
+        lambda names: fetch_artist_genres(names, artist_ids, client))
+    audio_features = cache.read_through('audio_features', list(new_tracks),
+                                        lambda ids: fetch_audio_features(ids, client))
+    artist_genres = artist_lookup.result()
+
+    songs = []
+    for track in tracks:
+        if track['id'] in all_songs:  # return existing vertex
+            songs.append(graph.genres[all_songs[track['id']]].song_graph.songs[track['id']])
+        elif track['id'] in audio_features:
+            new_song = song_graph.Song(information=track_information(track),
+                                       properties=audio_properties(audio_features[track['id']]),
+                                       name=track['name'])
+            genre = closest_genre(new_song, artist_genres.get(artist_names.get(track['id']), []))
+            if genre == '':
+                genre = song_graph.song_to_genre(new_song, song_graph.GENRES, get_genre_props())
+            new_song.genre = genre
+            songs.append(new_song)
+    return songs
+
+
+def fetch_audio_features(track_ids: list[str], client: spotify_client.ConcurrentSpotify) \
+        -> dict[str, dict]:
+    """Returns the audio features of the given tracks, mapped by track id. The requests for
+    every AUDIO_FEATURES_CHUNK tracks are sent at the same time."""
+    audio_features = {}
+    for response in client.map('audio_features',
+                               [(chunk,) for chunk in chunks(track_ids, AUDIO_FEATURES_CHUNK)]):
+        for audio_info in response:
+            if audio_info is not None:
+                audio_features[audio_info['id']] = audio_info
+    return audio_features
+
+
+def fetch_artist_genres(names: list[str], artist_ids: dict[str, str],
+                        client: spotify_client.ConcurrentSpotify) -> dict[str, list[str]]:
+    """Returns the genres of the artists with the given names, mapped by name. artist_ids maps
+    each name to its spotify id."""
+    ids_to_names = {artist_ids[name]: name for name in names}
+    artist_genres = {}
+    for response in client.map('artists',
+                               [(chunk,) for chunk in chunks(sorted(ids_to_names),
+                                                             ARTISTS_CHUNK)]):
+        for artist in response['artists']:
+            if artist is not None:
+                artist_genres[ids_to_names[artist['id']]] = artist['genres']
+    return artist_genres
+
+
+def get_tracks(track_ids: list[str], client: Any = None,
+               cache: Optional[spotify_cache.SpotifyCache] = None) -> list[dict]:
+    """Returns the spotify tracks with the given ids (leaving out ids spotify doesn't know),
+    looking them up TRACKS_CHUNK at a time unless they are cached"""
+    client = as_concurrent(client)
+    cache = cache or get_cache()
 
-    name = song_data['name']
+    def fetch(ids: list[str]) -> dict[str, dict]:
+        """Look the tracks up on spotify"""
+        found = {}
+        for response in client.map('tracks', [(chunk,) for chunk in chunks(ids, TRACKS_CHUNK)]):
+            for track in response['tracks']:
+                if track is not None:
+                    found[track['id']] = track
+        return found
+
+    tracks = cache.read_through('track', track_ids, fetch)
+    return [tracks[track_id] for track_id in track_ids if track_id in tracks]
+
+
+def main_artist(track: dict) -> Optional[dict]:
+    """Returns the artist of a spotify track whose genres are used for the track (the first one
+    that isn't 'n/a')"""
+    for artist in track['artists'][:2]:
+        if artist['name'] != 'n/a':
+            return artist
+    return None
+
+
+def track_information(song_data: dict) -> dict:
+    """Returns the information of a spotify track, formatted like Song.information"""
     date_list = list(map(int, song_data['album']['release_date'].split('-')))
     if len(date_list) >= 3:
         date = datetime.datetime(year=date_list[0], month=date_list[1], day=date_list[2])
@@ -36,69 +270,148 @@ def spot_song_to_vert(song_data: dict, graph: song_graph.GenreGraph, all_songs:
         date = datetime.datetime(year=date_list[0], month=1, day=1)
     else:  # should never happen
         date = datetime.datetime(1699, 6, 9)
-    information = {'artists': [person['name'] for person in song_data['artists']],
-                   'duration': song_data['duration_ms'],
-                   'explicit': song_data['explicit'], 'id': song_data['id'], 'name': name,
-                   'release_date': date,
-                   'year': date.year,
-                   'popularity': song_data['popularity']}
-    audio_info = SP.audio_features(information['id'])[0]
-    properties = {'acousticness': audio_info['acousticness'],
-                  'danceability': audio_info['danceability'],
-                  'energy': audio_info['energy'],
-                  'instrumentalness': audio_info['instrumentalness'],
-                  'key': audio_info['key'],
-                  'mode': audio_info['mode'],
-                  'liveness': audio_info['liveness'],
-                  'loudness': audio_info['loudness'],
-                  'speechiness': audio_info['speechiness'],
-                  'tempo': audio_info['tempo'],
-                  'valence': audio_info['valence']}
-    new_song = song_graph.Song(information=information, properties=properties, name=name)
-    genre = song_to_genre_guess(new_song)
-    if genre == 'None Found':
-        genre = song_graph.song_to_genre(new_song, song_graph.GENRES,
-                                         song_graph.load_genres(song_graph.GENRE_DATA))
-    new_song.genre = genre
-    return new_song
+    return {'artists': [person['name'] for person in song_data['artists']],
+            'duration': song_data['duration_ms'],
+            'explicit': song_data['explicit'], 'id': song_data['id'], 'name': song_data['name'],
+            'release_date': date,
+            'year': date.year,
+            'popularity': song_data['popularity']}
+
+
+def audio_properties(audio_info: dict) -> dict:
+    """Returns the properties of a track from its spotify audio features, formatted like
+    Song.properties"""
+    return {'acousticness': audio_info['acousticness'],
+            'danceability': audio_info['danceability'],
+            'energy': audio_info['energy'],
+            'instrumentalness': audio_info['instrumentalness'],
+            'key': audio_info['key'],
+            'mode': audio_info['mode'],
+            'liveness': audio_info['liveness'],
+            'loudness': audio_info['loudness'],
+            'speechiness': audio_info['speechiness'],
+            'tempo': audio_info['tempo'],
+            'valence': audio_info['valence']}
+
+
+class TrackCandidate:
+    """
+    A spotify search result that hasn't been converted into a Song vertex yet. Converting a track
+    needs its audio features and the genres of its artist, so it is only done for the results the
+    user actually picks (see to_vertex).
+
+    Instance attributes:
+        - track: the track, formatted the way spotify returns tracks
+        - name: name of the track
+        - information: the artists and id of the track, like Song.information
+        - client: the spotipy client used to convert the track (the shared one if None)
+    """
+    track: dict
+    name: str
+    information: dict
+    client: Any
+    _vertex: Optional[concurrent.futures.Future]
+
+    def __init__(self, track: dict, client: Any = None) -> None:
+        """Initialize the candidate from a spotify track"""
+        self.track = track
+        self.client = client
+        self.name = track['name']
+        self.information = {'artists': [person['name'] for person in track['artists']],
+                            'id': track['id']}
+        self._vertex = None
+
+    def prefetch(self, graph: song_graph.GenreGraph, all_songs: dict) -> None:
+        """Start converting the track in the background, so to_vertex doesn't have to wait"""
+        if self._vertex is None:
+            self._vertex = _prefetcher.submit(spot_songs_to_verts, [self.track], graph, all_songs,
+                                              self.client)
+
+    def to_vertex(self, graph: song_graph.GenreGraph, all_songs: dict) \
+            -> Optional[song_graph.Song]:
+        """Return the track as a Song vertex (None if spotify has no audio features for it)"""
+        if self._vertex is not None:
+            songs = self._vertex.result()
+        else:
+            songs = spot_songs_to_verts([self.track], graph, all_songs, self.client)
+        return songs[0] if songs != [] else None
 
 
 def find_track_options(song_name: str, graph: song_graph.GenreGraph,
-                       all_songs: dict, artist: str = None) -> list[song_graph.Song]:
+                       all_songs: dict, artist: str = None,
+                       prefetch_top: bool = True, client: Any = None) -> list[TrackCandidate]:
     """This method retrieves search results for a given song search query.
     Returns the name, artist, and track ID
 
     For example: Searching for "Deutschland" by "Rammstein" will return all songs related
     to 'Deutschland' and/or 'Rammstein', and order them on relevancy. Spotipy does this
     implicitly.
+
+    This only takes the one search request, the results are converted into Song vertices when
+    they are picked (TrackCandidate.to_vertex). If prefetch_top is True the top result starts
+    converting in the background straight away.
     """
-    data_returned = SP.search(q=song_name + '+' + artist, type='track')
+    client = as_concurrent(client)
+    data_returned = client.call('search', q=song_name + '+' + artist, type='track')
     if data_returned['tracks']['items'] == []:  # search returned nothing
         return []
-    songs = []
-    for song in data_returned['tracks']['items']:
-        # print(song['name'])
-        songs.append(spot_song_to_vert(song, graph, all_songs))
-    return songs
+    candidates = [TrackCandidate(track, client) for track in data_returned['tracks']['items']]
+    if prefetch_top:
+        candidates[0].prefetch(graph, all_songs)
+    return candidates
 
 
 def pull_playlist(playlist_name: str, graph: song_graph.GenreGraph, all_songs: dict) \
         -> list[song_graph.Song]:
     """Returns list of tracks corresponding to a user's playlist. This is used
     for loading a whole playlist into the user's interface."""
-    all_playlists = SP.user_playlists(user=USERNAME)
+    songs = []
+    for batch in stream_playlist(playlist_name, graph, all_songs):
+        songs.extend(batch)
+    return songs
+
+
+def stream_playlist(playlist_name: str, graph: song_graph.GenreGraph, all_songs: dict,
+                    batch_size: int = PLAYLIST_PAGE, client: Any = None,
+                    cache: Optional[spotify_cache.SpotifyCache] = None) \
+        -> Iterator[list[song_graph.Song]]:
+    """Yields the tracks of a user's playlist as Song vertices, batch_size tracks at a time.
+
+    Every page of the playlist is converted as soon as it arrives (while the next page is being
+    downloaded) so the first songs can be used before the whole playlist is downloaded. Yields
+    nothing if the user has no playlist called playlist_name."""
+    client = as_concurrent(client)
     playlist = None
-    for item in all_playlists['items']:
+    for item in iter_items(client, client.submit('user_playlists', user=USERNAME,
+                                                 limit=PLAYLISTS_PAGE)):
         if item['name'] == playlist_name:
             playlist = item
             break
     if playlist is None:
-        return []
-    track_data = SP.user_playlist_tracks(user=USERNAME, playlist_id=playlist['id'])
-    return_data = []
-    for song in track_data['items']:
-        return_data.append(spot_song_to_vert(song['track'], graph, all_songs))
-    return return_data
+        return
+
+    batch = []
+    for item in iter_items(client, client.submit('user_playlist_tracks', user=USERNAME,
+                                                 playlist_id=playlist['id'],
+                                                 limit=PLAYLIST_PAGE)):
+        if item['track'] is not None and item['track'].get('id') is not None:
+            batch.append(item['track'])
+        if len(batch) == batch_size:
+            yield spot_songs_to_verts(batch, graph, all_songs, client, cache)
+            batch = []
+    if batch != []:
+        yield spot_songs_to_verts(batch, graph, all_songs, client, cache)
+
+
+def iter_items(client: spotify_client.ConcurrentSpotify,
+               first_page: concurrent.futures.Future) -> Iterator[dict]:
+    """Yields every item of a paged spotify response, starting from the (requested) first page.
+    The request for each page is sent before the items of the page before it are yielded."""
+    page = first_page.result()
+    while page is not None:
+        next_page = client.submit('next', page) if page.get('next') else None
+        yield from page['items']
+        page = next_page.result() if next_page is not None else None
 
 
 def get_playlist_id(name: str, playlists: list) -> Optional[str]:
@@ -109,20 +422,36 @@ def get_playlist_id(name: str, playlists: list) -> Optional[str]:
     return None
 
 
-def generate_playlist(playlist_name: str, tracks: list[str]) -> None:
-    """This method generates a playlist for the user"""
+def generate_playlist(playlist_name: str, tracks: list[str], client: Any = None) -> str:
+    """This method generates a playlist for the user and returns its id
 
-    # check if playlist exists:
-    my_playlists = SP.user_playlists(USERNAME)
-    playlist_id = get_playlist_id(playlist_name, my_playlists['items'])
+    If the user already has a playlist called playlist_name the tracks are added to it, leaving
+    out tracks that are already in it, so generating the same playlist again (e.g. retrying after
+    an error) doesn't add anything twice. Tracks are added ADD_TRACKS_CHUNK at a time with all of
+    the requests sent at once, so a long playlist may not be in the same order as tracks."""
+    client = as_concurrent(client)
+    playlist_id = _playlist_ids.get(playlist_name)
+    existing = set()
+
+    if playlist_id is None:  # check if playlist exists:
+        playlists = iter_items(client, client.submit('user_playlists', user=USERNAME,
+                                                     limit=PLAYLISTS_PAGE))
+        playlist_id = get_playlist_id(playlist_name, playlists)
     if playlist_id is None:  # playlist doesn't exist so create it
-        SP.user_playlist_create(USERNAME, playlist_name)
-        # update playlist_id
-        my_playlists = SP.user_playlists(USERNAME)
-        playlist_id = get_playlist_id(playlist_name, my_playlists['items'])
+        playlist_id = client.call('user_playlist_create', USERNAME, playlist_name)['id']
+    else:
+        for item in iter_items(client, client.submit('user_playlist_tracks', user=USERNAME,
+                                                     playlist_id=playlist_id,
+                                                     limit=PLAYLIST_PAGE)):
+            if item['track'] is not None:
+                existing.add(item['track']['id'])
+    _playlist_ids[playlist_name] = playlist_id
 
     # make the playlist
-    SP.user_playlist_add_tracks(user=USERNAME, playlist_id=playlist_id, tracks=tracks)
+    new_tracks = [track for track in dict.fromkeys(tracks) if track not in existing]
+    client.map('user_playlist_add_tracks', [(USERNAME, playlist_id, chunk)
+                                            for chunk in chunks(new_tracks, ADD_TRACKS_CHUNK)])
+    return playlist_id
 
 
 def song_to_genre_guess(song: song_graph.Song) -> str:
@@ -135,10 +464,26 @@ def song_to_genre_guess(song: song_graph.Song) -> str:
     if artist == 'n/a':
         artist = song.information['artists'][1]
 
-    data = SP.search(q=artist, limit=1, type='artist')
-    # Based on the formatting of how spotify returns data:
-    genres = data['artists']['items'][0]['genres']
+    def fetch(names: list[str]) -> dict[str, list[str]]:
+        """Search spotify for the artist"""
+        data = get_concurrent_client().call('search', q=names[0], limit=1, type='artist')
+        # Based on the formatting of how spotify returns data:
+        return {names[0]: data['artists']['items'][0]['genres']}
 
+    genres = song_graph.get_artist_genres().resolve(artist, get_cache(), fetch)
+
+    closest = closest_genre(song, genres)
+    if closest == '':
+        return 'None Found'
+    else:
+        return closest
+
+
+def closest_genre(song: song_graph.Song, genres: list[str]) -> str:
+    """
+    Returns the genre out of genres whose average properties are closest to song's properties,
+    or '' if none of them are known genres
+    """
     # Normalize these properties so they are ~ [0, 1] as the other properties
     loudness_range = 59
     key_range = 10
@@ -148,36 +493,34 @@ def song_to_genre_guess(song: song_graph.Song) -> str:
     min_difference = 999999
     curr_difference = 0
 
-    closest_genre = ''
+    closest = ''
 
+    g_to_props = get_genre_props()
     for genre in genres:
-        if genre in G_TO_PROPS:
-            average_props = G_TO_PROPS[genre]
+        if genre in g_to_props:
+            average_props = g_to_props[genre]
 
             for prop in average_props:
                 if prop == 'tempo':
                     curr_difference += abs(song.properties[prop]
-                                           - G_TO_PROPS[genre][prop]) / tempo_mod
+                                           - g_to_props[genre][prop]) / tempo_mod
                 elif prop == 'loudness':
                     curr_difference += abs(song.properties[prop]
-                                           - G_TO_PROPS[genre][prop]) / loudness_range
+                                           - g_to_props[genre][prop]) / loudness_range
                 elif prop == 'key':
                     curr_difference += abs(song.properties[prop]
-                                           - G_TO_PROPS[genre][prop]) / key_range
+                                           - g_to_props[genre][prop]) / key_range
                 elif prop not in ['popularity', 'duration_ms']:
                     curr_difference += abs(song.properties[prop]
-                                           - G_TO_PROPS[genre][prop])
+                                           - g_to_props[genre][prop])
 
             if curr_difference < min_difference:
-                closest_genre = genre
+                closest = genre
                 min_difference = curr_difference
 
             curr_difference = 0
 
-    if closest_genre == '':
-        return 'None Found'
-    else:
-        return closest_genre
+    return closest
 
 
 # if __name__ == '__main__':
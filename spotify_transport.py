@@ -0,0 +1,182 @@
+"""
+Record / replay transport for the spotify client.
+
+spotipy sends every request through a requests session. Passing one of these (they are
+requests.Session subclasses) as the client's requests_session lets the spotify code run without
+the network:
+    - RecordingSession sends requests as normal and saves every request / response pair to a
+      cassette file (one json object per line)
+    - ReplaySession answers requests from a cassette file, optionally waiting as long as the
+      original request took (or a set latency) so timings stay realistic
+
+Requests are matched on method, url, query parameters and body. If the same request was recorded
+more than once its responses are replayed in the order they were recorded, the last one is
+repeated after that.
+"""
+import json
+import threading
+import time
+from typing import Any, Optional, Union
+import requests
+
+
+class ReplayMissError(LookupError):
+    """Raised when a request being replayed was never recorded"""
+
+
+def request_key(method: str, url: str, params: Optional[dict], data: Any) -> str:
+    """Return the key a request is recorded and replayed under"""
+    params = sorted((params or {}).items())
+    return json.dumps([method.upper(), url, params, data], default=str)
+
+
+class ReplayResponse:
+    """
+    A recorded response, with the parts of requests.Response that spotipy uses.
+
+    Instance attributes:
+        - status_code: the HTTP status code
+        - headers: the response headers
+        - text: the response body
+        - url: the url that was requested
+        - reason: the HTTP reason phrase
+    """
+    status_code: int
+    headers: dict[str, str]
+    text: str
+    url: str
+    reason: str
+
+    def __init__(self, status_code: int, headers: dict[str, str], text: str, url: str,
+                 reason: str = '') -> None:
+        """Initialize the response"""
+        self.status_code = status_code
+        self.headers = headers
+        self.text = text
+        self.url = url
+        self.reason = reason
+
+    def json(self) -> Any:
+        """Return the body parsed as json (raises ValueError if it isn't json)"""
+        return json.loads(self.text)
+
+    def raise_for_status(self) -> None:
+        """Raise requests.HTTPError if the status code is an error, like requests does"""
+        if self.status_code >= 400:
+            raise requests.HTTPError(str(self.status_code) + ' ' + self.reason + ' for url: '
+                                     + self.url, response=self)
+
+
+class RecordingSession(requests.Session):
+    """
+    Sends requests through a real requests session and appends every request / response pair to
+    a cassette file.
+
+    Instance attributes:
+        - session: the requests session requests are really sent through
+        - path: the cassette file
+    """
+    session: Any
+    path: str
+    _lock: threading.Lock
+
+    def __init__(self, path: str, session: Any) -> None:
+        """Initialize the recorder, appending to the cassette at path"""
+        super().__init__()
+        self.session = session
+        self.path = path
+        self._lock = threading.Lock()
+
+    def request(self, method: str, url: str, params: Optional[dict] = None, data: Any = None,
+                **kwargs: Any) -> Any:
+        """Send the request and record it"""
+        start = time.perf_counter()
+        response = self.session.request(method, url, params=params, data=data, **kwargs)
+        elapsed = time.perf_counter() - start
+        record = {'key': request_key(method, url, params, data),
+                  'status': response.status_code,
+                  'reason': response.reason,
+                  'headers': {name: value for name, value in response.headers.items()
+                              if name.lower() in {'content-type', 'retry-after'}},
+                  'body': response.text,
+                  'url': response.url,
+                  'elapsed': elapsed}
+        with self._lock:
+            with open(self.path, 'a') as cassette:
+                cassette.write(json.dumps(record) + '\n')
+        return response
+
+    def close(self) -> None:
+        """Close the real session"""
+        self.session.close()
+
+
+class ReplaySession(requests.Session):
+    """
+    Answers requests from a cassette file written by RecordingSession.
+
+    Instance attributes:
+        - path: the cassette file
+        - latency: how long every request takes. 'recorded' to take as long as the recorded
+          request did, or a number of seconds
+        - replayed: number of requests answered
+    """
+    path: str
+    latency: Union[str, float]
+    replayed: int
+    _responses: dict[str, list[dict]]
+    _next: dict[str, int]
+    _lock: threading.Lock
+
+    def __init__(self, path: str, latency: Union[str, float] = 'recorded') -> None:
+        """Load the cassette at path"""
+        super().__init__()
+        self.path = path
+        self.latency = latency
+        self.replayed = 0
+        self._responses = {}
+        self._next = {}
+        self._lock = threading.Lock()
+        with open(path) as cassette:
+            for line in cassette:
+                if line.strip() != '':
+                    record = json.loads(line)
+                    self._responses.setdefault(record['key'], []).append(record)
+
+    def request(self, method: str, url: str, params: Optional[dict] = None, data: Any = None,
+                **kwargs: Any) -> ReplayResponse:
+        """Return the recorded response to the request"""
+        key = request_key(method, url, params, data)
+        if key not in self._responses:
+            raise ReplayMissError('no recorded response for ' + method + ' ' + url)
+        with self._lock:
+            index = self._next.get(key, 0)
+            records = self._responses[key]
+            self._next[key] = min(index + 1, len(records) - 1)
+            self.replayed += 1
+        record = records[index]
+
+        delay = record['elapsed'] if self.latency == 'recorded' else float(self.latency)
+        if delay > 0:
+            time.sleep(delay)
+        return ReplayResponse(record['status'], record['headers'], record['body'], record['url'],
+                              record['reason'])
+
+    def close(self) -> None:
+        """Nothing to close, nothing is sent"""
+
+
+# if __name__ == '__main__':
+#     import python_ta.contracts
+#     python_ta.contracts.check_all_contracts()
+#
+#     import doctest
+#     doctest.testmod()
+#
+#     import python_ta
+#     python_ta.check_all(config={
+#         'max-line-length': 100,
+#         'disable': ['E1136'],
+#         'extra-imports': ['json', 'threading', 'time', 'requests'],
+#         'max-nested-blocks': 4
+#     })